@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MediaAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'media_app'
+
+    def ready(self):
+        # Connect the signal handlers
+        from . import signals
@@ -0,0 +1,307 @@
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+# Same timing rules as the MoviePy path in media_processor
+IMAGE_DURATION = 2
+MAX_VIDEO_DURATION = 20
+
+# Sample rate of the sound kept from the videos when there is no music
+AUDIO_SAMPLE_RATE = 44100
+
+# MP4 that can be written front to back to a pipe and played while it downloads
+FRAGMENTED_MP4_FLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+
+def get_ffmpeg_binary():
+    """The ffmpeg executable MoviePy is configured with (imageio-ffmpeg's bundled one by default)"""
+    return get_setting('FFMPEG_BINARY')
+
+
+def run_ffmpeg(args, on_progress=None):
+    """
+    Runs ffmpeg with the given arguments, raising RuntimeError with its log tail on failure.
+
+    `on_progress` is called with the seconds of output written so far as ffmpeg reports them.
+    """
+    command = [get_ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-y'] + list(args)
+    if on_progress is None:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            log = result.stderr.decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {log[-2000:]}")
+        return result
+
+    # Machine-readable progress on stdout, the log goes to a file nobody has to read meanwhile
+    command[1:1] = ['-progress', 'pipe:1', '-nostats']
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log)
+        with process.stdout:
+            for line in process.stdout:
+                key, _, value = line.decode('ascii', errors='replace').strip().partition('=')
+                if key == 'out_time_us' and value.isdigit():
+                    on_progress(int(value) / 1000000)
+        returncode = process.wait()
+
+        if returncode != 0:
+            log.seek(0)
+            output = log.read().decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg exited with code {returncode}: {output[-2000:]}")
+
+
+def get_entry_duration(entry):
+    """Length an entry takes on the timeline, in seconds"""
+    if entry['media_type'] != 'video':
+        return IMAGE_DURATION
+    if entry.get('duration') is None:
+        entry['duration'] = ffmpeg_parse_infos(entry['path'])['duration']
+    return min(MAX_VIDEO_DURATION, entry['duration'])
+
+
+def entry_has_audio(entry):
+    """True if the entry is a video with a sound track"""
+    if entry['media_type'] != 'video':
+        return False
+    if entry.get('has_audio') is None:
+        info = entry.get('info')
+        if info is not None and info.get('has_audio') is not None:
+            entry['has_audio'] = info['has_audio']
+        else:
+            entry['has_audio'] = bool(ffmpeg_parse_infos(entry['path']).get('audio_found'))
+    return entry['has_audio']
+
+
+def build_filter_graph(entries, target_size, fps=24, audio_input=None, total_duration=None, source_audio=False):
+    """
+    Builds the filter_complex graph for a timeline.
+
+    Every input is scaled to fit `target_size`, padded with black bars, brought to `fps`
+    and concatenated into [outv]. When `audio_input` (an input index) is given, that
+    stream is trimmed to `total_duration` into [outa]. With `source_audio` instead, the
+    videos' own sound is cut to their length and concatenated into [outa], with silence
+    for images and silent videos, like MoviePy composes the clips' audio.
+    """
+    width, height = target_size
+    # Letterbox exactly like the PIL path: fit inside the target, then center on black
+    fit = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease:flags=lanczos,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black,"
+        f"setsar=1,fps={fps},format=yuv420p"
+    )
+
+    chains = []
+    labels = []
+    for index, entry in enumerate(entries):
+        if entry['media_type'] == 'video':
+            chain = f"[{index}:v]trim=duration={MAX_VIDEO_DURATION},setpts=PTS-STARTPTS,{fit}[v{index}]"
+        else:
+            # Images are looped at the input (see build_render_command), only the fit is needed
+            chain = f"[{index}:v]{fit}[v{index}]"
+        chains.append(chain)
+        labels.append(f"[v{index}]")
+
+    chains.append(f"{''.join(labels)}concat=n={len(entries)}:v=1:a=0[outv]")
+
+    if audio_input is not None:
+        trim = f"atrim=0:{total_duration:.3f}," if total_duration else ''
+        chains.append(f"[{audio_input}:a]{trim}asetpts=PTS-STARTPTS[outa]")
+    elif source_audio:
+        audio_labels = []
+        for index, entry in enumerate(entries):
+            duration = get_entry_duration(entry)
+            if entry_has_audio(entry):
+                # Padded as well, a sound track may end before its video does
+                chain = (f"[{index}:a]atrim=duration={duration:.3f},asetpts=PTS-STARTPTS,"
+                         f"aresample={AUDIO_SAMPLE_RATE},aformat=channel_layouts=stereo,"
+                         f"apad=whole_dur={duration:.3f}[a{index}]")
+            else:
+                chain = f"anullsrc=r={AUDIO_SAMPLE_RATE}:cl=stereo,atrim=duration={duration:.3f}[a{index}]"
+            chains.append(chain)
+            audio_labels.append(f"[a{index}]")
+        chains.append(f"{''.join(audio_labels)}concat=n={len(entries)}:v=0:a=1[outa]")
+
+    return ';'.join(chains)
+
+
+def build_render_command(entries, output_path, target_size, audio_path=None, fps=24, threads=None, profile=None,
+                         preset=None, pad_audio=False):
+    """
+    Builds the ffmpeg arguments that render the whole timeline in a single process.
+
+    Without `audio_path` the videos keep their own sound. `pad_audio` gives the output a
+    sound track even when none of the entries has one, so parts joined later all match.
+    `profile` forces an H.264 profile, used when the result is joined with stream-copied video.
+    `preset` is the x264 speed preset, ffmpeg's default ('medium') when None.
+    """
+    args = []
+    for entry in entries:
+        if entry['media_type'] == 'video':
+            args += ['-i', entry['path']]
+        else:
+            args += ['-loop', '1', '-framerate', str(fps), '-t', str(IMAGE_DURATION), '-i', entry['path']]
+
+    audio_input = None
+    total_duration = None
+    source_audio = False
+    if audio_path:
+        audio_input = len(entries)
+        total_duration = sum(get_entry_duration(entry) for entry in entries)
+        args += ['-i', str(audio_path)]
+    else:
+        source_audio = pad_audio or any(entry_has_audio(entry) for entry in entries)
+
+    graph = build_filter_graph(entries, target_size, fps, audio_input, total_duration, source_audio)
+    args += ['-filter_complex', graph]
+    args += ['-map', '[outv]']
+    if audio_input is not None or source_audio:
+        args += ['-map', '[outa]', '-c:a', 'aac']
+
+    args += ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-r', str(fps)]
+    if profile:
+        args += ['-profile:v', profile]
+    if preset:
+        args += ['-preset', preset]
+    if threads:
+        args += ['-threads', str(threads)]
+    args.append(str(output_path))
+    return args
+
+
+def render_timeline(entries, output_path, target_size, audio_path=None, fps=24, threads=None, profile=None,
+                    progress=None, preset=None, pad_audio=False):
+    """
+    Renders the timeline to `output_path` with one ffmpeg filtergraph run.
+
+    `progress` is called with (seconds encoded, timeline duration) while it renders.
+    """
+    on_progress = None
+    if progress is not None:
+        total_duration = sum(get_entry_duration(entry) for entry in entries)
+        on_progress = lambda seconds: progress(seconds, total_duration)
+    args = build_render_command(entries, output_path, target_size, audio_path, fps, threads, profile, preset,
+                                pad_audio)
+    run_ffmpeg(args, on_progress)
+
+
+def stream_timeline(entries, target_size, consume, audio_path=None, fps=24, threads=None, profile=None):
+    """
+    Renders the timeline as fragmented MP4 written to ffmpeg's stdout, calling `consume` with
+    the pipe while ffmpeg runs, so the output can be uploaded as it is encoded.
+
+    Returns what `consume` returned, raising RuntimeError when ffmpeg fails.
+    """
+    args = build_render_command(entries, 'pipe:1', target_size, audio_path, fps, threads, profile)
+    # Fragments need no moov written at the end, so nothing has to seek back in the output
+    args[-1:-1] = ['-movflags', FRAGMENTED_MP4_FLAGS, '-f', 'mp4']
+    command = [get_ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-y'] + args
+
+    # The log goes to a file rather than a pipe nobody reads while the output is consumed
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log)
+        try:
+            result = consume(process.stdout)
+        finally:
+            # Stops ffmpeg if `consume` gave up early instead of leaving it blocked on the pipe
+            process.stdout.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            log.seek(0)
+            output = log.read().decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg exited with code {returncode}: {output[-2000:]}")
+    return result
+
+
+def write_concat_list(segments, list_path):
+    """
+    Writes a concat demuxer script. `segments` is a list of (path, outpoint) pairs,
+    outpoint being None to use the whole file.
+    """
+    lines = []
+    for path, outpoint in segments:
+        escaped = str(path).replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+        if outpoint is not None:
+            lines.append(f"outpoint {outpoint}")
+    with open(list_path, 'w', encoding='utf-8') as list_file:
+        list_file.write('\n'.join(lines) + '\n')
+
+
+def concat_segments(list_path, output_path, audio_path=None, total_duration=None):
+    """
+    Joins the segments of a concat script without re-encoding the video.
+
+    When `audio_path` is given it becomes the soundtrack, padded with silence or cut to
+    `total_duration`; only the audio is encoded. Otherwise the segments' own sound, if they
+    have one, is copied along.
+    """
+    args = ['-f', 'concat', '-safe', '0', '-i', str(list_path)]
+    if audio_path:
+        args += ['-i', str(audio_path), '-map', '0:v:0', '-map', '1:a:0', '-c:a', 'aac', '-af', 'apad']
+        # An explicit length rather than -shortest, which never ends with padded audio and copied video
+        args += ['-t', f"{total_duration:.3f}"]
+    else:
+        args += ['-map', '0:v:0', '-map', '0:a:0?', '-c:a', 'copy']
+    args += ['-c:v', 'copy', '-movflags', '+faststart', str(output_path)]
+    run_ffmpeg(args)
+
+
+def split_timeline(entries, chunks):
+    """
+    Splits the timeline at item boundaries into at most `chunks` contiguous groups of
+    roughly equal duration. No group is empty and the order of entries is kept.
+    """
+    chunks = max(1, min(chunks, len(entries)))
+    durations = [get_entry_duration(entry) for entry in entries]
+    remaining = sum(durations)
+
+    groups = []
+    current = []
+    current_duration = 0
+    for index, (entry, duration) in enumerate(zip(entries, durations)):
+        current.append(entry)
+        current_duration += duration
+        groups_left = chunks - len(groups) - 1
+        entries_left = len(entries) - index - 1
+        if groups_left and (current_duration >= remaining / (groups_left + 1) or entries_left == groups_left):
+            groups.append(current)
+            remaining -= current_duration
+            current = []
+            current_duration = 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def render_chunked(entries, output_path, target_size, audio_path=None, fps=24, threads=None, chunks=2,
+                   profile='high'):
+    """
+    Renders the timeline as concurrent ffmpeg processes, one per chunk, and joins them.
+
+    Every chunk is encoded with the same size, frame rate and profile, so the concat demuxer
+    can join them without re-encoding. Only the music is added in the final pass; without
+    music every chunk carries the videos' sound (silence where they have none).
+    """
+    groups = split_timeline(entries, chunks)
+    total_duration = sum(get_entry_duration(entry) for entry in entries)
+    pad_audio = not audio_path and any(entry_has_audio(entry) for entry in entries)
+
+    with tempfile.TemporaryDirectory(prefix='chunks_') as work_dir:
+        chunk_paths = [os.path.join(work_dir, f"chunk_{index}.mp4") for index in range(len(groups))]
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            futures = [
+                pool.submit(render_timeline, group, chunk_path, target_size, fps=fps, threads=threads, profile=profile,
+                            pad_audio=pad_audio)
+                for group, chunk_path in zip(groups, chunk_paths)
+            ]
+            for future in futures:
+                # Re-raises the first ffmpeg failure
+                future.result()
+
+        list_path = os.path.join(work_dir, 'chunks.txt')
+        write_concat_list([(chunk_path, None) for chunk_path in chunk_paths], list_path)
+        concat_segments(list_path, output_path, audio_path, total_duration)
+    return len(groups)
@@ -2,6 +2,21 @@ from django import forms
 from .models import MediaProject, MediaItem
 
 
+# Allowed extensions for each media type
+IMAGE_TYPES = ['jpg', 'jpeg', 'png']
+VIDEO_TYPES = ['mp4']
+
+
+def classify_media_type(filename):
+    """Media type of a file from its extension, None when the file type isn't allowed"""
+    ext = filename.split('.')[-1].lower()
+    if ext in IMAGE_TYPES:
+        return 'image'
+    if ext in VIDEO_TYPES:
+        return 'video'
+    return None
+
+
 class MediaProjectForm(forms.ModelForm):
     class Meta:
         model = MediaProject
@@ -23,19 +38,10 @@ class MediaItemForm(forms.ModelForm):
     def clean_file(self):
         file = self.cleaned_data.get('file')
         if file:
-            # Get the file extension
-            ext = file.name.split('.')[-1].lower()
-
-            # Define allowed extensions
-            image_types = ['jpg', 'jpeg', 'png']
-            video_types = ['mp4']
-
             # Check if the file is an image or video
-            if ext in image_types:
-                self.instance.media_type = 'image'
-            elif ext in video_types:
-                self.instance.media_type = 'video'
-            else:
+            media_type = classify_media_type(file.name)
+            if media_type is None:
                 raise forms.ValidationError("Only image and video files are allowed.")
+            self.instance.media_type = media_type
 
         return file
@@ -1,38 +1,181 @@
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, HttpRequest, build_http
+import httplib2
 import os
+import threading
+import time
 from django.conf import settings
 import mimetypes
+from .models import MediaProject, new_status_version
+from .progress import ProgressReporter
 
 # The folder ID where we want to upload files
 DRIVE_FOLDER_ID = '1GJeeAdKQZt5KCpDjt0lAOL6rEVlTse8D'
 
+# Drive answers worth retrying: rate limiting and server-side failures
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+# Drive client shared by the whole process, built on first use
+_drive_service = None
+_drive_service_lock = threading.Lock()
+# HTTP connection of each thread, httplib2 objects can't be shared between threads
+_thread_http = threading.local()
+
+
+def get_thread_http(credentials):
+    """This thread's authorized HTTP client, kept so its connection and token are reused"""
+    http = getattr(_thread_http, 'http', None)
+    if http is None or http.credentials is not credentials:
+        http = AuthorizedHttp(credentials, http=build_http())
+        _thread_http.http = http
+    return http
+
 
 def get_drive_service():
     """
-    Creates and returns a Google Drive service object
+    Returns the Google Drive service object, creating it on the first call
     Requires a service account credentials file at settings.GOOGLE_DRIVE_CREDENTIALS_FILE
+
+    The credentials file is read and the API client built once per process. Requests go
+    through a per-thread HTTP client, so render worker threads can share the service.
     """
-    try:
-        credentials = service_account.Credentials.from_service_account_file(
-            settings.GOOGLE_DRIVE_CREDENTIALS_FILE,
-            scopes=['https://www.googleapis.com/auth/drive']
-        )
-        service = build('drive', 'v3', credentials=credentials)
-        return service
-    except Exception as e:
-        print(f"Error creating Google Drive service: {str(e)}")
-        return None
+    global _drive_service
+    if _drive_service is not None:
+        return _drive_service
+
+    with _drive_service_lock:
+        if _drive_service is None:
+            try:
+                credentials = service_account.Credentials.from_service_account_file(
+                    settings.GOOGLE_DRIVE_CREDENTIALS_FILE,
+                    scopes=['https://www.googleapis.com/auth/drive']
+                )
 
+                def build_request(http, *args, **kwargs):
+                    return HttpRequest(get_thread_http(credentials), *args, **kwargs)
 
-def upload_file_to_drive(file_path, file_name):
+                _drive_service = build('drive', 'v3', credentials=credentials, requestBuilder=build_request)
+            except Exception as e:
+                print(f"Error creating Google Drive service: {str(e)}")
+                return None
+    return _drive_service
+
+
+def reset_drive_service():
+    """Forgets the cached service, the next call to get_drive_service() builds a new one"""
+    global _drive_service
+    with _drive_service_lock:
+        _drive_service = None
+
+
+def upload_retry_delay(retries):
+    """Seconds to wait before retrying a chunk for the `retries`-th time, doubling each time"""
+    delay = settings.GOOGLE_DRIVE_RETRY_BACKOFF_SECONDS * (2 ** (retries - 1))
+    return min(delay, settings.GOOGLE_DRIVE_RETRY_BACKOFF_MAX_SECONDS)
+
+
+def save_upload_state(project, **fields):
+    # Update only these columns, the render may be saving the project at the same time
+    fields['status_version'] = new_status_version()
+    MediaProject.objects.filter(pk=project.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(project, name, value)
+
+
+def run_resumable_upload(request, file_path, project=None):
+    """
+    Sends a resumable upload request chunk by chunk and returns Drive's response.
+
+    Network errors, 429 and 5xx answers are retried with exponential backoff, resuming
+    from the last byte Drive acknowledged. With a `project`, the session URI is stored on
+    it so a later attempt at the same file continues where this one stopped, and the
+    progress is written to project.upload_progress.
+    """
+    # Sessions are only reused for the very same file
+    upload_file = f"{file_path}:{os.path.getsize(file_path)}"
+    if project is not None and project.drive_upload_uri and project.drive_upload_file == upload_file:
+        request.resumable_uri = project.drive_upload_uri
+        # Makes next_chunk() ask Drive how much it already has before sending anything
+        request._in_error_state = True
+
+    reporter = ProgressReporter(project.id, project.status, 'uploading') if project is not None else None
+
+    retries = 0
+    response = None
+    while response is None:
+        error = None
+        try:
+            status, response = request.next_chunk()
+        except HttpError as e:
+            if e.resp.status in (404, 410) and request.resumable_uri:
+                # The session expired, start a new one from the first byte
+                request.resumable_uri = None
+                request.resumable_progress = 0
+                request._in_error_state = False
+            elif e.resp.status not in RETRYABLE_STATUSES:
+                raise
+            error = e
+        except (httplib2.HttpLib2Error, OSError) as e:
+            error = e
+
+        if project is not None and request.resumable_uri and request.resumable_uri != project.drive_upload_uri:
+            # Stored as soon as Drive hands it out, so even a failed first chunk can be resumed
+            save_upload_state(project, drive_upload_uri=request.resumable_uri, drive_upload_file=upload_file)
+
+        if error is None:
+            retries = 0
+            if project is not None and status:
+                progress = int(status.progress() * 100)
+                if progress != project.upload_progress:
+                    save_upload_state(project, upload_progress=progress)
+                reporter(status.resumable_progress, status.total_size)
+            continue
+
+        retries += 1
+        if retries > settings.GOOGLE_DRIVE_UPLOAD_RETRIES:
+            raise error
+        delay = upload_retry_delay(retries)
+        print(f"Drive upload interrupted ({error}), retry {retries} in {delay}s")
+        time.sleep(delay)
+
+    if project is not None:
+        save_upload_state(project, drive_upload_uri='', drive_upload_file='', upload_progress=100)
+        reporter(1, 1)
+    return response
+
+
+def grant_drive_permissions(service, file_id, permissions):
+    """
+    Grants all `permissions` on a Drive file with one batch HTTP request
+    Raises the error of the first grant Drive rejected
+    """
+    errors = []
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception)
+
+    batch = service.new_batch_http_request(callback=on_response)
+    for permission in permissions:
+        batch.add(service.permissions().create(fileId=file_id, body=permission, fields='id'))
+    batch.execute()
+
+    if errors:
+        raise errors[0]
+
+
+def upload_file_to_drive(file_path, file_name, project=None):
     """
     Uploads a file to Google Drive and returns the file ID and viewable link
 
     Parameters:
     file_path (str): The full path to the file
     file_name (str): The name to give the file in Google Drive
+    project (MediaProject): Optional, keeps the resumable session and progress of the upload
 
     Returns:
     tuple: (file_id, web_view_link) or (None, None) if upload fails
@@ -40,7 +183,7 @@ def upload_file_to_drive(file_path, file_name):
     try:
         service = get_drive_service()
         if not service:
-            return None
+            return None, None
 
         # Determine the MIME type of the file
         mime_type, _ = mimetypes.guess_type(file_path)
@@ -55,30 +198,21 @@ def upload_file_to_drive(file_path, file_name):
         media = MediaFileUpload(
             file_path,
             mimetype=mime_type,
+            chunksize=settings.GOOGLE_DRIVE_CHUNK_SIZE,
             resumable=True
         )
 
-        file = service.files().create(
+        # The link comes back with the upload, there's no need to read the file again
+        request = service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, webViewLink'
-        ).execute()
+        )
+        file = run_resumable_upload(request, file_path, project)
 
         # Create a shared link that anyone can view
-        service.permissions().create(
-            fileId=file.get('id'),
-            body={
-                'type': 'anyone',
-                'role': 'reader'
-            }
-        ).execute()
-
-        # Get the updated file with the web view link
-        file = service.files().get(
-            fileId=file.get('id'),
-            fields='webViewLink'
-        ).execute()
-        return file.get('webViewLink')
+        grant_drive_permissions(service, file['id'], [{'type': 'anyone', 'role': 'reader'}])
+        return file['id'], file.get('webViewLink')
     except Exception as e:
         print(f"Error uploading file to Google Drive: {str(e)}")
-        return None
+        return None, None
@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+# Values accepted by settings.MEDIA_IMAGE_RESAMPLE
+RESAMPLE_FILTERS = {
+    'nearest': Image.NEAREST,
+    'box': Image.BOX,
+    'bilinear': Image.BILINEAR,
+    'hamming': Image.HAMMING,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS,
+}
+
+
+def fit_size(image_size, target_size):
+    """Largest size with the image's aspect ratio that fits inside target_size"""
+    width, height = image_size
+    target_width, target_height = target_size
+    img_aspect = width / height
+    target_aspect = target_width / target_height
+
+    if img_aspect > target_aspect:  # Image is wider than target
+        return target_width, int(target_width / img_aspect)
+    # Image is taller than target
+    return int(target_height * img_aspect), target_height
+
+
+def letterbox_image(path, target_size, resample=None, draft=None):
+    """
+    Fits the image inside target_size and centers it on black.
+
+    Returns an RGB uint8 array of shape (height, width, 3) that MoviePy can use as a frame
+    directly, so nothing is written to disk. `resample` and `draft` default to the
+    MEDIA_IMAGE_RESAMPLE and MEDIA_IMAGE_DRAFT_MODE settings.
+    """
+    if resample is None:
+        resample = settings.MEDIA_IMAGE_RESAMPLE
+    if draft is None:
+        draft = settings.MEDIA_IMAGE_DRAFT_MODE
+    target_width, target_height = target_size
+
+    with Image.open(path) as img:
+        new_width, new_height = fit_size(img.size, target_size)
+
+        if draft:
+            # JPEG only (a no-op for other formats): let the decoder scale down by 1/2, 1/4 or 1/8
+            # while decoding, so a 48MP photo is never fully decoded to end up at 720p
+            img.draft('RGB', (new_width, new_height))
+
+        img_resized = img.convert('RGB').resize(
+            (new_width, new_height),
+            RESAMPLE_FILTERS[resample],
+        )
+
+    frame = np.zeros((target_height, target_width, 3), dtype=np.uint8)
+    paste_x = (target_width - new_width) // 2
+    paste_y = (target_height - new_height) // 2
+    frame[paste_y:paste_y + new_height, paste_x:paste_x + new_width] = np.asarray(img_resized)
+    return frame
+
+
+def _timed_letterbox(path, target_size, resample, draft):
+    start = time.time()
+    frame = letterbox_image(path, target_size, resample, draft)
+    return frame, time.time() - start
+
+
+def preprocess_images(timeline, target_size):
+    """
+    Letterboxes every image of the timeline concurrently.
+
+    Pillow releases the GIL while decoding and resizing, so a thread pool scales across cores;
+    set MEDIA_IMAGE_POOL to 'process' to use separate processes instead. Returns
+    {timeline index: frame}, so callers keep the MediaItem order. Images that fail are
+    reported and left out.
+    """
+    images = [(index, entry) for index, entry in enumerate(timeline) if entry['media_type'] != 'video']
+    if not images:
+        return {}
+
+    pool_class = ProcessPoolExecutor if settings.MEDIA_IMAGE_POOL == 'process' else ThreadPoolExecutor
+    workers = min(settings.MEDIA_IMAGE_WORKERS, len(images))
+    # Settings are resolved here so process workers don't need Django configured
+    resample = settings.MEDIA_IMAGE_RESAMPLE
+    draft = settings.MEDIA_IMAGE_DRAFT_MODE
+
+    frames = {}
+    start = time.time()
+    with pool_class(max_workers=workers) as pool:
+        futures = [
+            (index, entry, pool.submit(_timed_letterbox, entry['path'], target_size, resample, draft))
+            for index, entry in images
+        ]
+        for index, entry, future in futures:
+            try:
+                frame, seconds = future.result()
+            except Exception as e:
+                print(f"Error processing item {entry['item'].id}: {str(e)}. Skipping this item.")
+                continue
+            frames[index] = frame
+            print(f"Prepared image {entry['item'].id} in {seconds:.2f}s")
+
+    print(f"Prepared {len(frames)} of {len(images)} images with {workers} workers in {time.time() - start:.2f}s")
+    return frames
@@ -0,0 +1,27 @@
+import time
+from pathlib import Path
+from django.conf import settings
+from .media_processor import build_timeline, get_target_size
+from .segment_cache import get_segment
+
+
+def ingest_enabled():
+    """Ingest only pays off when renders are assembled from cached segments"""
+    return settings.MEDIA_INGEST_ENABLED and settings.MEDIA_RENDER_BACKEND == 'segments'
+
+
+def ingest_media_item(item):
+    """
+    Normalizes one uploaded item ahead of rendering: the image is letterboxed or the video
+    transcoded to the project's output size, and the result lands in the segment cache.
+    """
+    media_root = Path(settings.MEDIA_ROOT)
+    timeline = build_timeline([item], media_root)
+    if not timeline:
+        return False
+
+    start = time.time()
+    target_size = get_target_size(item.project.media_items.select_related('info').order_by('order'), media_root)
+    get_segment(timeline[0], target_size, threads=settings.RENDER_FFMPEG_THREADS)
+    print(f"Ingested media item {item.id} at {target_size[0]}x{target_size[1]} in {time.time() - start:.2f}s")
+    return True
@@ -0,0 +1,190 @@
+import threading
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .models import RenderJob
+from .render_executor import render_project, get_status_field
+from .media_processor import publish_project
+from .ingest import ingest_media_item
+
+
+def enqueue_render_job(project, profile='final'):
+    """Queue a render job for the project, reusing an active one with the same profile if it exists"""
+    job = project.render_jobs.filter(kind='render', profile=profile, status__in=['queued', 'running']).first()
+    if job:
+        return job
+
+    return RenderJob.objects.create(
+        project=project,
+        profile=profile,
+        max_attempts=settings.RENDER_JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_ingest_job(item):
+    """Queue normalization of a freshly uploaded item, unless it is already waiting"""
+    job = item.ingest_jobs.filter(status='queued').first()
+    if job:
+        return job
+
+    return RenderJob.objects.create(
+        project=item.project,
+        media_item=item,
+        kind='ingest',
+        max_attempts=settings.RENDER_JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_publish_job(project):
+    """Queue the upload of a rendered project, reusing an active publish job if it exists"""
+    job = project.render_jobs.filter(kind='publish', status__in=['queued', 'running']).first()
+    if job:
+        return job
+
+    return RenderJob.objects.create(
+        project=project,
+        kind='publish',
+        max_attempts=settings.RENDER_JOB_MAX_ATTEMPTS,
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff (in seconds) before retrying a job that failed `attempts` times"""
+    delay = settings.RENDER_JOB_RETRY_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.RENDER_JOB_RETRY_BACKOFF_MAX_SECONDS)
+
+
+def claim_next_job(worker_id, kinds=None):
+    """
+    Claims the next runnable job for this worker and returns it, or None if the queue is empty.
+    `kinds` limits the claim to those job kinds, any kind is claimed when None.
+
+    A job is runnable when it is queued and due, or when it is running but its lease expired
+    (the worker that held it died). Claiming is a conditional UPDATE so two workers can never
+    hold the same job.
+    """
+    now = timezone.now()
+    candidates = RenderJob.objects.filter(
+        Q(status='queued', run_after__lte=now) |
+        Q(status='running', lease_expires_at__lt=now)
+    ).order_by('run_after', 'id')
+    if kinds is not None:
+        candidates = candidates.filter(kind__in=kinds)
+
+    for job in candidates[:10]:
+        if job.attempts >= job.max_attempts:
+            # Lease expired on the last allowed attempt, give up on it
+            _give_up(job, 'Lease expired after the last attempt')
+            continue
+
+        claimed = RenderJob.objects.filter(
+            pk=job.pk,
+            status=job.status,
+            attempts=job.attempts,
+        ).update(
+            status='running',
+            attempts=job.attempts + 1,
+            worker_id=worker_id,
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=settings.RENDER_JOB_LEASE_SECONDS),
+            updated_at=now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+    return None
+
+
+def heartbeat_job(job, worker_id):
+    """Renews the lease on a running job. Returns False if the worker no longer owns it."""
+    now = timezone.now()
+    renewed = RenderJob.objects.filter(pk=job.pk, status='running', worker_id=worker_id).update(
+        heartbeat_at=now,
+        lease_expires_at=now + timedelta(seconds=settings.RENDER_JOB_LEASE_SECONDS),
+    )
+    return bool(renewed)
+
+
+def complete_job(job):
+    job.status = 'completed'
+    job.lease_expires_at = None
+    job.last_error = ''
+    job.save()
+
+
+def fail_job(job, error):
+    """Schedules a retry with backoff, or marks the job and project failed when out of attempts"""
+    if job.attempts >= job.max_attempts:
+        _give_up(job, error)
+        return
+
+    job.status = 'queued'
+    job.worker_id = ''
+    job.lease_expires_at = None
+    job.last_error = error
+    job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+    job.save()
+
+    # The project stays 'processing' (or 'publishing'), only _give_up marks it failed
+    print(f"{job.get_kind_display()} job {job.id} failed (attempt {job.attempts}/{job.max_attempts}), "
+          f"retrying later: {error}")
+
+
+def _give_up(job, error):
+    job.status = 'failed'
+    job.lease_expires_at = None
+    job.last_error = error
+    job.save()
+
+    if job.kind in ('render', 'publish'):
+        project = job.project
+        status_field = get_status_field(job.profile)
+        setattr(project, status_field, 'failed')
+        project.save(update_fields=[status_field])
+    print(f"{job.get_kind_display()} job {job.id} failed permanently: {error}")
+
+
+def run_job(job, worker_id):
+    """Runs a claimed job, keeping its lease alive while it works"""
+    stop_heartbeat = threading.Event()
+
+    def keep_alive():
+        interval = max(settings.RENDER_JOB_LEASE_SECONDS / 3, 1)
+        try:
+            while not stop_heartbeat.wait(interval):
+                if not heartbeat_job(job, worker_id):
+                    print(f"Worker {worker_id} lost the lease on render job {job.id}")
+                    break
+        finally:
+            connection.close()
+
+    heartbeat = threading.Thread(target=keep_alive, daemon=True)
+    heartbeat.start()
+
+    try:
+        if job.kind == 'ingest':
+            if ingest_media_item(job.media_item):
+                complete_job(job)
+            else:
+                fail_job(job, 'Media item file is missing')
+        elif job.kind == 'publish':
+            if publish_project(job.project, last_attempt=job.attempts >= job.max_attempts):
+                complete_job(job)
+            else:
+                fail_job(job, f"Upload to {settings.OUTPUT_STORAGE_BACKEND} output storage failed")
+        elif render_project(job.project, job.profile):
+            complete_job(job)
+            # Previews are never published
+            if job.profile == 'final' and job.project.status == 'publishing':
+                enqueue_publish_job(job.project)
+        else:
+            fail_job(job, 'Processing did not produce an output video')
+    except Exception:
+        fail_job(job, traceback.format_exc())
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
@@ -0,0 +1,35 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+
+class LRUCache:
+    """
+    Values kept in this process, dropping the least recently used ones.
+
+    Holds at most the value of the `size_setting` setting, read on every insert.
+    """
+
+    def __init__(self, size_setting):
+        self.size_setting = size_setting
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The value stored under `key`, None if there is none"""
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None:
+                self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > getattr(settings, self.size_setting):
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
@@ -0,0 +1,18 @@
+import os
+import shutil
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Deletes the QR code images earlier publishes wrote under MEDIA_ROOT/qrcodes'
+
+    def handle(self, *args, **options):
+        # QR codes are rendered on request now, nothing reads these files anymore
+        directory = os.path.join(settings.MEDIA_ROOT, 'qrcodes')
+        if not os.path.isdir(directory):
+            self.stdout.write("No QR code images to delete")
+            return
+        count = sum(len(files) for _, _, files in os.walk(directory))
+        shutil.rmtree(directory)
+        self.stdout.write(f"Deleted {count} QR code image(s)")
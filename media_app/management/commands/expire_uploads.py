@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from media_app.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes chunked uploads that were abandoned before they were finished'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Seconds without a new chunk after which an upload is abandoned '
+                 '(defaults to MEDIA_UPLOAD_EXPIRY_SECONDS)',
+        )
+
+    def handle(self, *args, **options):
+        expired = expire_uploads(options['max_age'])
+        self.stdout.write(f"Expired {expired} abandoned upload(s)")
@@ -0,0 +1,84 @@
+import os
+import socket
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from media_app.job_queue import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = ('Runs queued render jobs, at most --concurrency at a time, and uploads rendered '
+            'projects, at most --publish-concurrency at a time')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help='Number of jobs rendered at the same time (defaults to RENDER_WORKER_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--publish-concurrency', type=int, default=None,
+            help='Number of rendered projects uploaded at the same time (defaults to PUBLISH_WORKER_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Seconds to wait before checking an empty queue again',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit as soon as the queue is empty instead of waiting for new jobs',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency is None:
+            concurrency = settings.RENDER_WORKER_CONCURRENCY
+        publish_concurrency = options['publish_concurrency']
+        if publish_concurrency is None:
+            publish_concurrency = settings.PUBLISH_WORKER_CONCURRENCY
+        worker_name = f"{socket.gethostname()}-{os.getpid()}"
+        stop = threading.Event()
+
+        self.stdout.write(f"Render worker {worker_name} started with {concurrency} render slot(s) "
+                          f"and {publish_concurrency} publish slot(s)")
+
+        # Encoding and uploading get separate slots, so uploads never hold up a render
+        slot_kinds = [('render', ['render', 'ingest'])] * concurrency + [('publish', ['publish'])] * publish_concurrency
+        slots = [
+            threading.Thread(
+                target=self.work,
+                args=(f"{worker_name}-{name}-{index}", kinds, stop, options['poll_interval'], options['once']),
+            )
+            for index, (name, kinds) in enumerate(slot_kinds)
+        ]
+        for slot in slots:
+            slot.start()
+
+        try:
+            for slot in slots:
+                while slot.is_alive():
+                    slot.join(timeout=1)
+        except KeyboardInterrupt:
+            # Let running jobs finish, their leases keep other workers away until then
+            self.stdout.write('Stopping render worker after the current jobs...')
+            stop.set()
+            for slot in slots:
+                slot.join()
+
+        self.stdout.write('Render worker stopped')
+
+    def work(self, worker_id, kinds, stop, poll_interval, once):
+        try:
+            while not stop.is_set():
+                job = claim_next_job(worker_id, kinds)
+                if job is None:
+                    if once:
+                        break
+                    stop.wait(poll_interval)
+                    continue
+
+                action = 'Publishing' if job.kind == 'publish' else 'Rendering'
+                self.stdout.write(f"[{worker_id}] {action} project {job.project_id} (job {job.id})")
+                run_job(job, worker_id)
+        finally:
+            connection.close()
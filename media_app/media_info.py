@@ -0,0 +1,77 @@
+import os
+from PIL import Image
+from .models import MediaInfo
+from .media_probe import probe_media
+from .segment_cache import file_hash
+
+# MediaInfo fields holding the probe_media() result
+PROBE_FIELDS = (
+    'duration', 'width', 'height', 'fps', 'frame_rate', 'video_codec', 'profile', 'pix_fmt',
+    'audio_codec', 'has_audio', 'rotation',
+)
+TEXT_FIELDS = ('frame_rate', 'video_codec', 'profile', 'pix_fmt', 'audio_codec')
+
+
+def probe_file(path, media_type):
+    """Metadata of a media file: one ffprobe for videos, just the header for photos"""
+    if media_type == 'video':
+        return probe_media(path)
+    with Image.open(path) as img:
+        width, height = img.size
+    return {'width': width, 'height': height}
+
+
+def media_info_values(item, path=None, info=None):
+    """
+    Field values of the MediaInfo record of an item. `info` is a probe result, optionally
+    with file_size and sha256 already known; whatever is missing is read from the file.
+    """
+    path = path or item.file.path
+    info = dict(info or {})
+    if 'width' not in info:
+        # Only the file size and hash are known so far
+        info.update(probe_file(path, item.media_type))
+    if info.get('file_size') is None:
+        info['file_size'] = os.path.getsize(path)
+    if not info.get('sha256'):
+        info['sha256'] = file_hash(path)
+
+    values = {field: info.get(field) for field in PROBE_FIELDS}
+    # Text columns store '' rather than NULL
+    for field in TEXT_FIELDS:
+        values[field] = values[field] or ''
+    values['has_audio'] = bool(values['has_audio'])
+    values['rotation'] = values['rotation'] or 0
+    values['file_size'] = info['file_size']
+    values['sha256'] = info['sha256']
+    return values
+
+
+def save_media_info(item, path=None, info=None):
+    """Stores (or refreshes) the MediaInfo record of an item, see media_info_values()"""
+    values = media_info_values(item, path, info)
+    media_info, _ = MediaInfo.objects.update_or_create(item=item, defaults=values)
+    item.info = media_info
+    return media_info
+
+
+def get_media_info(item, path=None):
+    """
+    The stored metadata of an item, probing and storing it on first use for items uploaded
+    before it was recorded. None when the file can't be probed.
+    """
+    try:
+        return item.info
+    except MediaInfo.DoesNotExist:
+        pass
+
+    try:
+        return save_media_info(item, path)
+    except Exception as e:
+        print(f"Warning: Could not read metadata of media item {item.id}: {str(e)}")
+        return None
+
+
+def info_as_probe(media_info):
+    """The record as the dict probe_media() returns"""
+    return {field: getattr(media_info, field) for field in PROBE_FIELDS}
@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+from django.conf import settings
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+
+def ffprobe_available():
+    """ffprobe is optional, imageio-ffmpeg only ships ffmpeg"""
+    return shutil.which(settings.FFPROBE_BINARY) is not None
+
+
+def run_ffprobe(args):
+    """Runs ffprobe and returns its stdout, raising RuntimeError on failure"""
+    command = [settings.FFPROBE_BINARY, '-v', 'error'] + list(args)
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError(f"ffprobe not found at '{settings.FFPROBE_BINARY}'")
+    if result.returncode != 0:
+        log = result.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffprobe exited with code {result.returncode}: {log[-1000:]}")
+    return result.stdout.decode('utf-8', errors='replace')
+
+
+def _parse_rate(rate):
+    try:
+        value = Fraction(rate)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return float(value) if value else None
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rotation(stream):
+    # Newer ffprobe reports a display matrix in side data, older ones a "rotate" tag. The
+    # tag turns clockwise and the matrix counter-clockwise, rotation is kept clockwise
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return -int(float(side_data['rotation'])) % 360
+    rotate = stream.get('tags', {}).get('rotate')
+    return int(float(rotate)) % 360 if rotate else 0
+
+
+def probe_media(path):
+    """
+    Reads container and stream metadata of a media file with a single ffprobe call.
+
+    Returns a dict with duration, width, height, fps, frame_rate (as ffmpeg writes it,
+    e.g. '30000/1001'), video_codec, profile, pix_fmt, audio_codec, has_audio and rotation.
+    Without ffprobe the file is read with ffmpeg instead, see probe_with_ffmpeg().
+    """
+    if not ffprobe_available():
+        return probe_with_ffmpeg(path)
+
+    output = run_ffprobe(['-print_format', 'json', '-show_format', '-show_streams', str(path)])
+    data = json.loads(output or '{}')
+    streams = data.get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), None)
+
+    frame_rate = video.get('avg_frame_rate')
+    if not _parse_rate(frame_rate):
+        frame_rate = video.get('r_frame_rate')
+
+    return {
+        'duration': _parse_float(data.get('format', {}).get('duration')) or _parse_float(video.get('duration')),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': _parse_rate(frame_rate),
+        'frame_rate': frame_rate,
+        'video_codec': video.get('codec_name'),
+        'profile': video.get('profile'),
+        'pix_fmt': video.get('pix_fmt'),
+        'audio_codec': audio.get('codec_name') if audio else None,
+        'has_audio': audio is not None,
+        'rotation': _parse_rotation(video) if video else 0,
+    }
+
+
+def probe_with_ffmpeg(path):
+    """
+    probe_media() from the summary MoviePy's ffmpeg prints, for when ffprobe isn't installed.
+
+    Codecs, profile and pixel format stay unknown, which keeps such files off the
+    stream-copy path. Raises IOError when ffmpeg can't read the file.
+    """
+    infos = ffmpeg_parse_infos(str(path))
+    width, height = infos.get('video_size') or (None, None)
+    return {
+        'duration': infos.get('duration'),
+        'width': width,
+        'height': height,
+        'fps': infos.get('video_fps'),
+        'frame_rate': None,
+        'video_codec': None,
+        'profile': None,
+        'pix_fmt': None,
+        'audio_codec': None,
+        'has_audio': bool(infos.get('audio_found')),
+        'rotation': infos.get('video_rotation') or 0,
+    }
+
+
+def probe_upload(uploaded_file):
+    """
+    probe_media() for a file that is still being uploaded. Stored files and Django's temporary
+    files are probed in place; uploads held in memory are written to a temporary file first.
+    """
+    if getattr(uploaded_file, '_committed', False):
+        # Already in storage (a FieldFile of a saved file)
+        return probe_media(uploaded_file.path)
+
+    # A FieldFile wraps the uploaded file
+    upload = getattr(uploaded_file, 'file', uploaded_file)
+    if hasattr(upload, 'temporary_file_path'):
+        return probe_media(upload.temporary_file_path())
+
+    with tempfile.NamedTemporaryFile(delete=False) as temp:
+        for chunk in uploaded_file.chunks():
+            temp.write(chunk)
+    try:
+        return probe_media(temp.name)
+    finally:
+        if os.path.exists(temp.name):
+            os.remove(temp.name)
+
+
+def keyframe_times(path, start, end):
+    """Timestamps (in seconds) of the video keyframes between `start` and `end`"""
+    output = run_ffprobe([
+        '-select_streams', 'v:0',
+        '-skip_frame', 'nokey',
+        '-read_intervals', f"{max(start, 0)}%{end}",
+        '-show_entries', 'frame=best_effort_timestamp_time',
+        '-print_format', 'csv=p=0',
+        str(path),
+    ])
+    times = []
+    for line in output.splitlines():
+        value = _parse_float(line.strip().strip(','))
+        if value is not None:
+            times.append(value)
+    return times
+
+
+def has_keyframe_at(path, timestamp, fps):
+    """True if a video keyframe starts within half a frame of `timestamp`, False when ffprobe can't tell"""
+    if not ffprobe_available():
+        return False
+    tolerance = 0.5 / fps if fps else 0.02
+    return any(abs(time - timestamp) <= tolerance for time in keyframe_times(path, timestamp - 1, timestamp + 1))
@@ -1,16 +1,40 @@
 import os
 import time
+import tempfile
 from pathlib import Path
-from PIL import Image
 from moviepy.editor import VideoFileClip, ImageClip, concatenate_videoclips, AudioFileClip
+from proglog import TqdmProgressBarLogger
 from django.conf import settings
-import qrcode
-from .google_drive_utils import upload_file_to_drive
-
-
-def process_media_project(project):
-    """Process media items into a single video file and upload to Google Drive"""
-    clips = []  # Initialize clips list outside try block for proper cleanup
+from .output_storage import get_output_storage, CopyingReader
+from .progress import ProgressReporter
+from .ffmpeg_renderer import (
+    render_timeline, render_chunked, stream_timeline, get_entry_duration, write_concat_list, concat_segments,
+)
+from .segment_cache import get_segment
+from .media_info import get_media_info, info_as_probe
+from .image_processing import preprocess_images
+from .stream_copy import plan_stream_copy, render_stream_copy
+
+# Columns the final render and its publish write. A preview rendered meanwhile and the upload
+# state saved by the output storage are left as they are in the database
+RENDER_FIELDS = [
+    'status', 'upload_progress', 'output_file', 'output_url', 'drive_file_id', 'drive_web_view_link', 'updated_at',
+]
+
+
+def process_media_project(project, threads=None, profile='final'):
+    """
+    Process media items into a single video file, leaving the project 'publishing'
+
+    `threads` caps the number of threads used by the ffmpeg encoder (ffmpeg decides when None).
+    The renderer is chosen with settings.MEDIA_RENDER_BACKEND ('moviepy', 'ffmpeg' or 'segments').
+    With the 'preview' profile a quick low-resolution preview is rendered instead, see render_preview().
+
+    A failed render returns False and leaves the project 'processing': the job queue either
+    retries it or marks the project failed once it runs out of attempts.
+    """
+    if profile == 'preview':
+        return render_preview(project, threads)
 
     try:
         # Ensure project ID is valid
@@ -18,268 +42,434 @@ def process_media_project(project):
             raise ValueError("Project ID is None. Ensure the project is saved before processing.")
 
         project.status = 'processing'
-        project.save()
+        project.upload_progress = 0
+        # Forget where a previous render of the project was published
+        project.drive_file_id = None
+        project.drive_web_view_link = None
+        project.output_url = ''
+        project.save(update_fields=RENDER_FIELDS)
 
         # Create necessary folders using pathlib for better path handling
         media_root = Path(settings.MEDIA_ROOT)
-        resized_folder = media_root / 'resized_images'
         output_folder = media_root / 'outputs'
-        qr_folder = media_root / 'qrcodes'
 
         # Create folders if they don't exist
-        resized_folder.mkdir(parents=True, exist_ok=True)
         output_folder.mkdir(parents=True, exist_ok=True)
-        qr_folder.mkdir(parents=True, exist_ok=True)
 
-        media_items = project.media_items.all().order_by('order')
+        media_items = project.media_items.select_related('info').order_by('order')
 
         if not media_items.exists():
             print(f"No media items found for project {project.id}")
-            project.status = 'failed'
-            project.save()
             return False
 
-        # Define target size for consistency (HD by default)
-        target_size = (1280, 720)
+        target_size = get_target_size(media_items, media_root)
 
-        # Find first video to determine target size (if any)
-        first_video = next((item for item in media_items if item.media_type == 'video'), None)
-        if first_video:
-            try:
-                video_path = media_root / first_video.file.name
-                # Check if file exists before trying to open it
-                if not video_path.exists():
-                    print(f"Warning: Video file not found at {video_path}. Using default dimensions.")
-                else:
-                    with VideoFileClip(str(video_path)) as video:
-                        target_size = video.size
-            except Exception as e:
-                print(f"Error determining size from first video: {str(e)}. Using default dimensions.")
+        timeline = build_timeline(media_items, media_root)
+        audio_path = get_project_audio_path(project)
+        if not audio_path.exists():
+            print(f"Warning: Audio file '{audio_path}' not found. Proceeding without audio.")
+            audio_path = None
 
-        for item in media_items:
-            # Ensure file name exists and file exists on disk
-            if not item.file or not item.file.name:
-                print(f"Warning: File is missing for media item {item.id}, skipping")
-                continue
+        # Create a unique filename for the output
+        output_filename = f"project_{project.id}_{int(time.time())}.mp4"
+        # Full path for saving the file
+        output_path = output_folder / output_filename
+        output_path_str = str(output_path)
+
+        rendered = False
+        if settings.MEDIA_STREAM_COPY_ENABLED and audio_path:
+            # Remux videos that already match instead of re-encoding them
+            rendered = render_with_stream_copy(timeline, output_path_str, audio_path, threads)
+
+        storage = get_output_storage()
+        stream_upload = (
+            settings.MEDIA_STREAM_UPLOAD and settings.MEDIA_RENDER_BACKEND == 'ffmpeg'
+            and settings.MEDIA_RENDER_CHUNKS <= 1 and storage.can_stream and storage.is_configured()
+        )
 
-            # Use pathlib for better path handling
-            file_path = media_root / item.file.name
+        # Frames encoded by the backends that can tell, for the progress stream
+        progress = ProgressReporter(project.id, 'processing', 'rendering')
+
+        if not rendered:
+            if stream_upload:
+                rendered = render_with_ffmpeg_streaming(timeline, output_path_str, target_size, audio_path, threads,
+                                                        project, storage)
+            elif settings.MEDIA_RENDER_BACKEND == 'ffmpeg':
+                rendered = render_with_ffmpeg(timeline, output_path_str, target_size, audio_path, threads, progress)
+            elif settings.MEDIA_RENDER_BACKEND == 'segments':
+                rendered = render_with_segments(timeline, output_path_str, target_size, audio_path, threads)
+            else:
+                rendered = render_with_moviepy(timeline, output_path_str, target_size, audio_path, threads, progress)
 
-            # Convert to string representation for libraries that don't support Path objects
-            file_path_str = str(file_path)
+        if rendered:
+            project.output_file = f'outputs/{output_filename}'
+            if project.output_url:
+                # Uploaded while encoding, only completing the project is left to do
+                return publish_project(project)
 
-            print(f"Processing file: {file_path_str}")
+            # Publishing (upload and QR code) runs as its own job, the render slot is free again
+            project.status = 'publishing'
+            project.save(update_fields=RENDER_FIELDS)
+            print(f"Project {project.id} rendered to {output_path_str}, waiting to be published")
 
-            # Check if file exists before processing
-            if not file_path.exists():
-                print(f"Error: File not found at {file_path_str}. Skipping this item.")
-                continue
+            return True
+        else:
+            print(f"No valid clips were generated for project {project.id}")
+            return False
 
-            try:
-                if item.media_type == 'video':
-                    # Load the video and take only the first 20 seconds
-                    video = VideoFileClip(file_path_str)
-                    # If video is shorter than 20 seconds, use the entire video
-                    if video.duration > 20:
-                        video_clip = video.subclip(0, 20)
-                    else:
-                        video_clip = video
+    except Exception as e:
+        print(f"Error processing project: {str(e)}")
+        return False
 
-                    clips.append(video_clip)
-                else:  # Image processing
-                    # Resize image to match target size
-                    img = Image.open(file_path_str)
-                    width, height = img.size
-                    target_width, target_height = target_size
-                    img_aspect = width / height
-                    target_aspect = target_width / target_height
-
-                    if img_aspect > target_aspect:  # Image is wider than target
-                        new_width = target_width
-                        new_height = int(target_width / img_aspect)
-                    else:  # Image is taller than target
-                        new_height = target_height
-                        new_width = int(target_height * img_aspect)
-
-                    # Resize image to fit within target dimensions
-                    img_resized = img.resize((new_width, new_height), Image.LANCZOS)
-
-                    # Create new image with padding
-                    new_img = Image.new('RGB', target_size, (0, 0, 0))
-
-                    # Paste resized image centered in the padded image
-                    paste_x = (target_width - new_width) // 2
-                    paste_y = (target_height - new_height) // 2
-                    new_img.paste(img_resized, (paste_x, paste_y))
-
-                    # Save resized image with unique filename
-                    resized_filename = f"resized_{project.id}_{int(time.time())}_{file_path.name}"
-                    resized_path = resized_folder / resized_filename
-                    new_img.save(str(resized_path))
-
-                    # Create image clip from resized image
-                    img_clip = ImageClip(str(resized_path)).set_duration(2).set_fps(24)
-                    clips.append(img_clip)
-            except Exception as e:
-                print(f"Error processing item {item.id}: {str(e)}. Skipping this item.")
-                continue
 
-        if clips:
-            final_clip = concatenate_videoclips(clips, method="compose")
+def render_preview(project, threads=None):
+    """
+    Renders a low-resolution preview of the project to MEDIA_ROOT/previews, leaving its status
+    and final output alone. The preview is never published.
+
+    Always one ffmpeg filtergraph at MEDIA_PREVIEW_HEIGHT and MEDIA_PREVIEW_FPS with the
+    MEDIA_PREVIEW_PRESET x264 preset, whatever MEDIA_RENDER_BACKEND is.
+    """
+    # Only the preview fields are written, a full render of the project may be running meanwhile
+    try:
+        project.preview_status = 'processing'
+        project.save(update_fields=['preview_status'])
+
+        media_root = Path(settings.MEDIA_ROOT)
+        preview_folder = media_root / 'previews'
+        preview_folder.mkdir(parents=True, exist_ok=True)
 
-            # Calculate the total duration of the video (photos + videos)
-            total_video_duration = sum([min(20, vid.duration) for vid in clips])
+        media_items = project.media_items.select_related('info').order_by('order')
+        timeline = build_timeline(media_items, media_root)
+        if not timeline:
+            print(f"No media items to preview for project {project.id}")
+            return False
 
-            # Select audio file based on project type
+        target_size = get_preview_size(get_target_size(media_items, media_root))
+        audio_path = get_project_audio_path(project)
+        if not audio_path.exists():
             audio_path = None
-            if project.type == 'life_story':
-                audio_path = Path(settings.BASE_DIR) / "media/needed_media/life.mp3"
-            elif project.type == 'event_coverage':
-                audio_path = Path(settings.BASE_DIR) / "media/needed_media/event.mp3"
-            elif project.type == 'memory_collection':
-                audio_path = Path(settings.BASE_DIR) / "media/needed_media/memory.mp3"
-            else:
-                # Default to life story audio if type is not recognized
-                audio_path = Path(settings.BASE_DIR) / "media/needed_media/life.mp3"
 
-            if audio_path.exists():
-                audio = AudioFileClip(str(audio_path))
+        preview_filename = f"project_{project.id}_{int(time.time())}.mp4"
+        start = time.time()
+        render_timeline(timeline, str(preview_folder / preview_filename), target_size, audio_path,
+                        fps=settings.MEDIA_PREVIEW_FPS, threads=threads, preset=settings.MEDIA_PREVIEW_PRESET)
+        print(f"Rendered a {target_size[0]}x{target_size[1]} preview of project {project.id} "
+              f"in {time.time() - start:.2f}s")
+
+        previous_path = project.preview_file.path if project.preview_file else None
+        project.preview_file = f'previews/{preview_filename}'
+        project.preview_status = 'completed'
+        project.save(update_fields=['preview_file', 'preview_status'])
+
+        # Only the latest preview is kept
+        if previous_path and os.path.exists(previous_path):
+            try:
+                os.remove(previous_path)
+            except OSError as e:
+                print(f"Warning: Could not delete previous preview {previous_path}: {e}")
+        return True
 
-                # Trim the audio to match the total video duration
-                audio = audio.subclip(0, total_video_duration)
+    except Exception as e:
+        print(f"Error rendering preview: {str(e)}")
+        return False
 
-                # Set the audio of the video to the loaded and trimmed audio
-                final_clip = final_clip.set_audio(audio)
+
+def get_preview_size(target_size):
+    """`target_size` scaled down to MEDIA_PREVIEW_HEIGHT, with even sides as x264 requires"""
+    width, height = target_size
+    preview_height = min(settings.MEDIA_PREVIEW_HEIGHT, height)
+    preview_width = round(width * preview_height / height / 2) * 2
+    return max(preview_width, 2), preview_height - preview_height % 2
+
+
+def publish_project(project, last_attempt=True):
+    """
+    Stores the rendered output with the configured output storage and completes the project
+
+    Returns False when the upload failed and should be retried later. On the last attempt,
+    or when the storage isn't configured, the project is completed with its local output.
+    """
+    output_path_str = project.output_file.path
+    output_filename = os.path.basename(project.output_file.name)
+
+    storage = get_output_storage()
+    if project.output_url:
+        print(f"Project {project.id} was uploaded while it was rendered")
+    elif storage.is_configured():
+        if not storage.save(project, output_path_str, output_filename):
+            if not last_attempt:
+                # A resumable upload is kept on the project, the retry picks up where this stopped
+                print(f"Failed to publish project {project.id} to {settings.OUTPUT_STORAGE_BACKEND}, retrying later")
+                return False
+            print(f"Failed to publish to {settings.OUTPUT_STORAGE_BACKEND}, falling back to local storage")
+    else:
+        print(f"Output storage '{settings.OUTPUT_STORAGE_BACKEND}' isn't configured, using local storage")
+
+    # The QR code is rendered on request for the project's share URL, see views.project_qr_code
+    if project.output_url:
+        print(f"Project {project.id} completed. Output file published at: {project.output_url}")
+    else:
+        print(f"Project {project.id} completed. Local output file: {project.output_file.name}")
+
+    project.status = 'completed'
+    project.save(update_fields=RENDER_FIELDS)
+    return True
+
+
+def get_target_size(media_items, media_root):
+    """Output size of a project: the size of its first video, HD when there is none"""
+    # Define target size for consistency (HD by default)
+    target_size = (1280, 720)
+
+    # Find first video to determine target size (if any)
+    first_video = next((item for item in media_items if item.media_type == 'video'), None)
+    if first_video:
+        try:
+            video_path = media_root / first_video.file.name
+            # Check if file exists before trying to open it
+            if not video_path.exists():
+                print(f"Warning: Video file not found at {video_path}. Using default dimensions.")
             else:
-                print(f"Warning: Audio file '{audio_path}' not found. Proceeding without audio.")
+                media_info = get_media_info(first_video, video_path)
+                if media_info is not None and media_info.width and media_info.height:
+                    target_size = (media_info.width, media_info.height)
+                else:
+                    with VideoFileClip(str(video_path)) as video:
+                        target_size = tuple(video.size)
+        except Exception as e:
+            print(f"Error determining size from first video: {str(e)}. Using default dimensions.")
+
+    return target_size
+
+
+def build_timeline(media_items, media_root):
+    """Returns the ordered list of items that can be rendered, skipping missing files"""
+    timeline = []
+    for item in media_items:
+        # Ensure file name exists and file exists on disk
+        if not item.file or not item.file.name:
+            print(f"Warning: File is missing for media item {item.id}, skipping")
+            continue
+
+        # Use pathlib for better path handling
+        file_path = media_root / item.file.name
+
+        # Check if file exists before processing
+        if not file_path.exists():
+            print(f"Error: File not found at {file_path}. Skipping this item.")
+            continue
+
+        entry = {
+            'item': item,
+            'path': str(file_path),
+            'media_type': item.media_type,
+        }
+        # Reuse the metadata probed at upload instead of opening the file again
+        media_info = get_media_info(item, file_path)
+        if media_info is not None:
+            entry['info'] = info_as_probe(media_info)
+            entry['hash'] = media_info.sha256
+            if media_info.duration is not None:
+                entry['duration'] = media_info.duration
+        timeline.append(entry)
+    return timeline
+
+
+def get_project_audio_path(project):
+    """Background music for the project, selected by project type"""
+    if project.type == 'life_story':
+        return Path(settings.BASE_DIR) / "media/needed_media/life.mp3"
+    elif project.type == 'event_coverage':
+        return Path(settings.BASE_DIR) / "media/needed_media/event.mp3"
+    elif project.type == 'memory_collection':
+        return Path(settings.BASE_DIR) / "media/needed_media/memory.mp3"
+    # Default to life story audio if type is not recognized
+    return Path(settings.BASE_DIR) / "media/needed_media/life.mp3"
+
+
+def render_with_stream_copy(timeline, output_path, audio_path, threads=None):
+    """
+    Fast path for timelines whose videos are already H.264 in a common size and frame rate.
+
+    Returns False when the timeline doesn't qualify or the remux fails, so the caller can
+    fall back to a full render.
+    """
+    try:
+        plan = plan_stream_copy(timeline)
+        if plan is None:
+            return False
 
-            # Create a unique filename for the output
-            output_filename = f"project_{project.id}_{int(time.time())}.mp4"
-            # Full path for saving the file
-            output_path = output_folder / output_filename
-            output_path_str = str(output_path)
+        target, segments = plan
+        copied = sum(1 for segment in segments if segment['copy'])
+        print(f"Stream-copying {copied} of {len(segments)} segments")
+        render_stream_copy(target, segments, output_path, audio_path, threads)
+        return True
+    except Exception as e:
+        print(f"Stream copy not possible: {str(e)}. Falling back to a full render.")
+        return False
 
-            # Save the video file locally first
-            final_clip.write_videofile(output_path_str, codec='libx264', fps=24)
 
-            # Upload to Google Drive
-            drive_web_view_link = upload_file_to_drive(output_path_str, output_filename)
+def render_with_ffmpeg(timeline, output_path, target_size, audio_path, threads=None, progress=None):
+    """
+    Renders the timeline with ffmpeg filtergraphs, without MoviePy compositing: one for the
+    whole timeline, or one per chunk when MEDIA_RENDER_CHUNKS is above 1.
 
-            if drive_web_view_link:
-                # Store the Google Drive information in the project
-                project.drive_web_view_link = drive_web_view_link
+    `progress` is called with (seconds encoded, total seconds) by the single filtergraph render.
+    """
+    if not timeline:
+        return False
 
-                # STILL store the relative path from MEDIA_ROOT for compatibility
-                # This ensures Django's FileField knows how to create the URL
-                relative_path = f'outputs/{output_filename}'
-                project.output_file = relative_path
+    if settings.MEDIA_RENDER_CHUNKS > 1 and len(timeline) > 1:
+        start = time.time()
+        chunks = render_chunked(timeline, output_path, target_size, audio_path, fps=24, threads=threads,
+                                chunks=settings.MEDIA_RENDER_CHUNKS)
+        print(f"Rendered {len(timeline)} items in {chunks} chunks in {time.time() - start:.2f}s")
+        return True
 
-                # Generate QR code for the GOOGLE DRIVE video
-                qr_filename = f"qr_project_{project.id}_{int(time.time())}.png"
-                qr_path = qr_folder / qr_filename
-                relative_qr_path = f'qrcodes/{qr_filename}'
+    render_timeline(timeline, output_path, target_size, audio_path, fps=24, threads=threads, progress=progress)
+    return True
 
-                # Create QR code with the Google Drive URL to the video
-                generate_qr_code_for_drive(project, relative_qr_path, str(qr_path), drive_web_view_link)
 
-                project.status = 'completed'
-                project.save()
+def render_with_ffmpeg_streaming(timeline, output_path, target_size, audio_path, threads, project, storage):
+    """
+    Renders the timeline with one ffmpeg filtergraph straight into the output storage: the
+    encoder writes fragmented MP4 to a pipe that feeds the upload, so uploading overlaps with
+    encoding. A local copy is still written to `output_path`.
 
-                print(f"Project {project.id} completed. Output file on Drive: {drive_web_view_link}")
-            else:
-                print("Failed to upload to Google Drive, falling back to local storage")
-                # Store local file path as fallback
-                relative_path = f'outputs/{output_filename}'
-                project.output_file = relative_path
+    When the upload fails the render carries on to the local copy, which the publish stage
+    uploads as usual; project.output_url is only set when the upload went through.
+    """
+    if not timeline:
+        return False
 
-                # Generate QR code for the local video
-                qr_filename = f"qr_project_{project.id}_{int(time.time())}.png"
-                qr_path = qr_folder / qr_filename
-                relative_qr_path = f'qrcodes/{qr_filename}'
+    output_filename = os.path.basename(output_path)
+
+    def upload(pipe):
+        reader = CopyingReader(pipe, local_copy)
+        uploaded = storage.save_stream(project, reader, output_filename)
+        # Keep the local copy complete even when the upload gave up early
+        reader.drain()
+        return uploaded
+
+    start = time.time()
+    with open(output_path, 'wb') as local_copy:
+        try:
+            uploaded = stream_timeline(timeline, target_size, upload, audio_path, fps=24, threads=threads)
+        except Exception:
+            # Whatever reached the storage is an incomplete video
+            project.output_url = ''
+            raise
+
+    print(f"Rendered {len(timeline)} items {'and uploaded them ' if uploaded else ''}"
+          f"in {time.time() - start:.2f}s")
+    return True
+
+
+def render_with_segments(timeline, output_path, target_size, audio_path, threads=None):
+    """
+    Renders every item to a cached normalized segment and joins them without re-encoding.
+
+    Re-processing after a reorder only re-runs the final concat, as all segments are cache hits.
+    """
+    segments = []
+    total_duration = 0
+    for entry in timeline:
+        try:
+            segment_path = get_segment(entry, target_size, threads)
+        except Exception as e:
+            print(f"Error processing item {entry['item'].id}: {str(e)}. Skipping this item.")
+            continue
+        segments.append((segment_path, None))
+        total_duration += get_entry_duration(entry)
+
+    if not segments:
+        return False
 
-                # Create QR code with local URL placeholder
-                generate_qr_code(project, relative_qr_path, str(qr_path))
+    with tempfile.TemporaryDirectory(prefix='segments_') as work_dir:
+        list_path = os.path.join(work_dir, 'segments.txt')
+        write_concat_list(segments, list_path)
+        concat_segments(list_path, output_path, audio_path, total_duration)
+    return True
 
-                project.status = 'completed'
-                project.save()
 
-                print(f"Project {project.id} completed. Local output file: {relative_path}")
+class RenderProgressLogger(TqdmProgressBarLogger):
+    """MoviePy's usual console progress bar, also passing the frames written to `progress`"""
 
-            return True
-        else:
-            project.status = 'failed'
-            project.save()
-            print(f"No valid clips were generated for project {project.id}")
-            return False
+    def __init__(self, progress):
+        super().__init__()
+        self.progress = progress
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        super().bars_callback(bar, attr, value, old_value)
+        # 't' counts the video frames, the audio is written with its own bar beforehand
+        if bar == 't' and attr == 'index':
+            self.progress(value, self.bars[bar]['total'])
 
-    except Exception as e:
-        print(f"Error processing project: {str(e)}")
-        project.status = 'failed'
-        project.save()
-        return False
-    finally:
-        # Make sure to close all clips to free resources
-        for clip in clips:
-            try:
-                clip.close()
-            except Exception as e:
-                print(f"Error closing clip: {str(e)}")
 
+def render_with_moviepy(timeline, output_path, target_size, audio_path, threads=None, progress=None):
+    """
+    Composites the timeline frame by frame with MoviePy and writes it to `output_path`
+
+    `progress` is called with (frames written, total frames) while encoding.
+    """
+    clips = []  # Initialize clips list outside try block for proper cleanup
 
-def generate_qr_code(project, relative_qr_path, qr_path):
-    """Generate a QR code for the given output video file (local version)"""
     try:
-        # We'll store the relative path first and update the actual URL in the view
-        project.qr_code = relative_qr_path
-        project.save()
-
-        # Create QR code object
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
+        # Decode and letterbox all photos up front, in parallel
+        frames = preprocess_images(timeline, target_size)
 
-        # At this point, we don't have the full URL, so we'll use a placeholder
-        # The actual URL will be constructed in the view
-        qr.add_data("PLACEHOLDER_URL")
-        qr.make(fit=True)
+        for index, entry in enumerate(timeline):
+            item = entry['item']
+            file_path_str = entry['path']
 
-        # Create and save the QR code image
-        img = qr.make_image(fill="black", back_color="white")
-        img.save(qr_path)
+            print(f"Processing file: {file_path_str}")
 
-        return True
-    except Exception as e:
-        print(f"Error generating QR code: {str(e)}")
-        return False
+            try:
+                if item.media_type == 'video':
+                    # Load the video and take only the first 20 seconds
+                    video = VideoFileClip(file_path_str)
+                    # If video is shorter than 20 seconds, use the entire video
+                    if video.duration > 20:
+                        video_clip = video.subclip(0, 20)
+                    else:
+                        video_clip = video
 
+                    clips.append(video_clip)
+                elif index in frames:  # Image processing
+                    # Create image clip straight from the letterboxed frame
+                    img_clip = ImageClip(frames[index]).set_duration(2).set_fps(24)
+                    clips.append(img_clip)
+            except Exception as e:
+                print(f"Error processing item {item.id}: {str(e)}. Skipping this item.")
+                continue
 
-def generate_qr_code_for_drive(project, relative_qr_path, qr_path, drive_web_view_link):
-    """Generate a QR code for the Google Drive link"""
-    try:
-        # We'll store the relative path
-        project.qr_code = relative_qr_path
-        project.save()
-
-        # Create QR code object
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
+        if not clips:
+            return False
 
-        # Use the Google Drive web view link directly
-        qr.add_data(drive_web_view_link)
-        qr.make(fit=True)
+        final_clip = concatenate_videoclips(clips, method="compose")
 
-        # Create and save the QR code image
-        img = qr.make_image(fill="black", back_color="white")
-        img.save(qr_path)
+        # Calculate the total duration of the video (photos + videos)
+        total_video_duration = sum([min(20, vid.duration) for vid in clips])
 
+        if audio_path:
+            audio = AudioFileClip(str(audio_path))
+
+            # Trim the audio to match the total video duration
+            audio = audio.subclip(0, total_video_duration)
+
+            # Set the audio of the video to the loaded and trimmed audio
+            final_clip = final_clip.set_audio(audio)
+
+        # Save the video file locally first
+        logger = RenderProgressLogger(progress) if progress is not None else 'bar'
+        final_clip.write_videofile(output_path, codec='libx264', fps=24, threads=threads, logger=logger)
         return True
-    except Exception as e:
-        print(f"Error generating QR code for Drive link: {str(e)}")
-        return False
+    finally:
+        # Make sure to close all clips to free resources
+        for clip in clips:
+            try:
+                clip.close()
+            except Exception as e:
+                print(f"Error closing clip: {str(e)}")
+
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0006_renderjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='renderjob',
+            name='kind',
+            field=models.CharField(choices=[('render', 'Render'), ('ingest', 'Ingest')], default='render', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='media_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ingest_jobs', to='media_app.mediaitem'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-17 02:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0007_renderjob_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('fps', models.FloatField(blank=True, null=True)),
+                ('frame_rate', models.CharField(blank=True, max_length=32)),
+                ('video_codec', models.CharField(blank=True, max_length=32)),
+                ('profile', models.CharField(blank=True, max_length=64)),
+                ('pix_fmt', models.CharField(blank=True, max_length=32)),
+                ('audio_codec', models.CharField(blank=True, max_length=32)),
+                ('has_audio', models.BooleanField(default=False)),
+                ('rotation', models.PositiveSmallIntegerField(default=0)),
+                ('file_size', models.BigIntegerField(blank=True, null=True)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('probed_at', models.DateTimeField(auto_now=True)),
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='info', to='media_app.mediaitem')),
+            ],
+        ),
+    ]
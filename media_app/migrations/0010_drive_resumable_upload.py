@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaproject',
+            name='drive_upload_file',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='mediaproject',
+            name='drive_upload_uri',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='mediaproject',
+            name='upload_progress',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0010_drive_resumable_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mediaproject',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('publishing', 'Publishing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='renderjob',
+            name='kind',
+            field=models.CharField(choices=[('render', 'Render'), ('ingest', 'Ingest'), ('publish', 'Publish')], default='render', max_length=20),
+        ),
+    ]
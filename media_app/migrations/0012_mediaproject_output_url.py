@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0011_project_publishing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaproject',
+            name='output_url',
+            field=models.URLField(blank=True, max_length=2000),
+        ),
+    ]
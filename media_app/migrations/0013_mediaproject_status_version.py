@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:24
+
+import media_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0012_mediaproject_output_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaproject',
+            name='status_version',
+            field=models.CharField(default=media_app.models.new_status_version, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:31
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0013_mediaproject_status_version'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='mediaproject',
+            name='qr_code',
+        ),
+    ]
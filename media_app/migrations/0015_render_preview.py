@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_app', '0014_remove_mediaproject_qr_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediaproject',
+            name='preview_file',
+            field=models.FileField(blank=True, null=True, upload_to='previews/'),
+        ),
+        migrations.AddField(
+            model_name='mediaproject',
+            name='preview_status',
+            field=models.CharField(blank=True, choices=[('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='profile',
+            field=models.CharField(choices=[('final', 'Final'), ('preview', 'Preview')], default='final', max_length=20),
+        ),
+    ]
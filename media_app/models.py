@@ -1,9 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+import hashlib
 import os
 import uuid
-from moviepy.editor import VideoFileClip
-import tempfile
+from .media_probe import probe_upload
+from .mp4_header import read_mp4_info
 
 def get_file_path(instance, filename):
     ext = filename.split('.')[-1]
@@ -11,9 +15,25 @@ def get_file_path(instance, filename):
     return os.path.join('uploads/', filename)
 
 
+# Spacing left between items when they are added or renumbered, so most moves can land in a gap
+ORDER_GAP = 1024
+
+
+def new_status_version():
+    return uuid.uuid4().hex
+
+
 class MediaProject(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        # Rendered, the output is being uploaded
+        ('publishing', 'Publishing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    PREVIEW_STATUS_CHOICES = (
         ('processing', 'Processing'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
@@ -32,14 +52,68 @@ class MediaProject(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     output_file = models.FileField(upload_to='outputs/', null=True, blank=True)
-    qr_code = models.FileField(upload_to='qrcodes/', null=True, blank=True)
     type = models.CharField(max_length=20, choices=PROJECT_TYPES, default='life_story')
     drive_file_id = models.CharField(max_length=100, null=True, blank=True)
     drive_web_view_link = models.URLField(max_length=500, null=True, blank=True)
+    # Where the published output is viewed when it isn't served from MEDIA_ROOT
+    output_url = models.URLField(max_length=2000, blank=True)
+    # Resumable Drive upload in progress: its session URI and the file it belongs to
+    drive_upload_uri = models.TextField(blank=True)
+    drive_upload_file = models.CharField(max_length=500, blank=True)
+    # Percentage of the output uploaded to Drive so far
+    upload_progress = models.PositiveSmallIntegerField(default=0)
+    # Low-resolution render to check the project before the full one, never published
+    preview_file = models.FileField(upload_to='previews/', null=True, blank=True)
+    preview_status = models.CharField(max_length=20, choices=PREVIEW_STATUS_CHOICES, blank=True)
+    # Changes with every write, status polls compare it instead of the whole row. Random
+    # rather than incremented, so processes writing at the same time never share a version
+    status_version = models.CharField(max_length=32, default=new_status_version, editable=False)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.status_version = new_status_version()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'status_version'}
+        super().save(*args, **kwargs)
+
+    def share_location(self):
+        """Where the finished video is watched: an absolute URL, or the path of the output file on this site"""
+        if self.output_url:
+            return self.output_url
+        if self.drive_web_view_link:
+            # Published to Drive before output_url existed
+            return self.drive_web_view_link
+        if self.output_file:
+            return self.output_file.url
+        return None
+
+    def share_url(self, request):
+        """Absolute URL the finished video is watched at, None until the project has one"""
+        location = self.share_location()
+        # Files served by this site are addressed through the host the request came in on
+        return request.build_absolute_uri(location) if location else None
+
+    def qr_code_url(self):
+        """
+        Address of the QR code of the share URL, None when there is nothing to share.
+
+        Versioned by the share location, so the image can be cached for good and a new link
+        gets a new address.
+        """
+        location = self.share_location()
+        if self.status != 'completed' or not location:
+            return None
+        version = hashlib.sha256(location.encode('utf-8')).hexdigest()[:16]
+        return f"{reverse('project_qr_code', args=[self.pk])}?v={version}"
+
+    def next_item_order(self):
+        """Order that puts a new item at the end of the project, ORDER_GAP after the last one"""
+        last_order = self.media_items.aggregate(last=models.Max('order'))['last']
+        return 0 if last_order is None else last_order + ORDER_GAP
+
 
 class MediaItem(models.Model):
     MEDIA_TYPES = (
@@ -101,26 +175,119 @@ class MediaItem(models.Model):
 
             # Add video duration check
             if self.media_type == 'video' and ext in video_types:
-                try:
-                    # Create a temporary file to check the duration
-                    with tempfile.NamedTemporaryFile(delete=False) as temp:
-                        for chunk in self.file.chunks():
-                            temp.write(chunk)
-
+                # The moov box holds the duration, so most uploads are never copied or decoded
+                info = read_mp4_info(self.file)
+                if info is None:
+                    # Header inconclusive (e.g. fragmented MP4): probe the file, with ffprobe when
+                    # it is installed and with MoviePy's ffmpeg otherwise
                     try:
-                        with VideoFileClip(temp.name) as video:
-                            if video.duration > 120:
-                                from django.core.exceptions import ValidationError
-                                raise ValidationError(
-                                    "Videos must be 120 seconds (2 minutes) or shorter. Please trim your video before uploading.")
+                        info = probe_upload(self.file)
                     except Exception as e:
                         from django.core.exceptions import ValidationError
                         raise ValidationError(f"Error validating video: {str(e)}")
-                    finally:
-                        # Clean up temp file
-                        if os.path.exists(temp.name):
-                            os.remove(temp.name)
-
-                except ImportError:
-                    # If moviepy is not available, skip this validation
-                    pass
+                    # Kept for the MediaInfo record written once the item is saved
+                    self._upload_info = info
+
+                if info['duration'] and info['duration'] > 120:
+                    from django.core.exceptions import ValidationError
+                    raise ValidationError(
+                        "Videos must be 120 seconds (2 minutes) or shorter. Please trim your video before uploading.")
+
+
+class MediaInfo(models.Model):
+    """Metadata of an uploaded file, probed once at upload so later stages don't reopen it"""
+    item = models.OneToOneField(MediaItem, related_name='info', on_delete=models.CASCADE)
+    duration = models.FloatField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    fps = models.FloatField(null=True, blank=True)
+    # Frame rate as ffmpeg writes it, e.g. '30000/1001'
+    frame_rate = models.CharField(max_length=32, blank=True)
+    video_codec = models.CharField(max_length=32, blank=True)
+    profile = models.CharField(max_length=64, blank=True)
+    pix_fmt = models.CharField(max_length=32, blank=True)
+    audio_codec = models.CharField(max_length=32, blank=True)
+    has_audio = models.BooleanField(default=False)
+    rotation = models.PositiveSmallIntegerField(default=0)
+    file_size = models.BigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    probed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Info for media item {self.item_id}"
+
+
+class UploadSession(models.Model):
+    """A chunked upload of one media item, written in place until it is finalized"""
+    STATUS_CHOICES = (
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    project = models.ForeignKey(MediaProject, related_name='upload_sessions', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    media_type = models.CharField(max_length=10, choices=MediaItem.MEDIA_TYPES)
+    # Final location of the file inside MEDIA_ROOT, chunks are written straight into it
+    file_path = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # Bytes stored so far, the offset the next chunk must start at
+    received = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    media_item = models.OneToOneField(MediaItem, related_name='upload_session', null=True, blank=True,
+                                      on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received}/{self.size} bytes)"
+
+
+class RenderJob(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    JOB_KINDS = (
+        ('render', 'Render'),
+        ('ingest', 'Ingest'),
+        ('publish', 'Publish'),
+    )
+
+    # Render jobs only: a full render that gets published, or a quick preview
+    RENDER_PROFILES = (
+        ('final', 'Final'),
+        ('preview', 'Preview'),
+    )
+
+    project = models.ForeignKey(MediaProject, related_name='render_jobs', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=JOB_KINDS, default='render')
+    profile = models.CharField(max_length=20, choices=RENDER_PROFILES, default='final')
+    # Set for ingest jobs, which prepare a single uploaded item
+    media_item = models.ForeignKey(MediaItem, related_name='ingest_jobs', null=True, blank=True,
+                                   on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Earliest time the job may be picked up (pushed back on retry)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Lease held by the worker currently running the job, renewed by heartbeats
+    worker_id = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job {self.id} for {self.project.title} ({self.status})"
@@ -0,0 +1,124 @@
+import math
+import os
+import struct
+
+# Largest moov box read into memory, anything bigger is left to ffprobe
+MAX_MOOV_SIZE = 16 * 1024 * 1024
+
+
+def _box_header(data, offset, end):
+    """Returns (box type, payload start, box end) of the box starting at `offset`"""
+    size, box_type = struct.unpack_from('>I4s', data, offset)
+    header_size = 8
+    if size == 1:  # 64-bit size follows the type
+        size = struct.unpack_from('>Q', data, offset + 8)[0]
+        header_size = 16
+    elif size == 0:  # Box runs to the end of its parent
+        size = end - offset
+    if size < header_size or offset + size > end:
+        raise ValueError(f"invalid size for '{box_type.decode('latin-1')}' box")
+    return box_type, offset + header_size, offset + size
+
+
+def _iter_boxes(data, start, end):
+    """Yields (box type, payload start, box end) of the boxes in data[start:end]"""
+    offset = start
+    while offset + 8 <= end:
+        box_type, payload_start, box_end = _box_header(data, offset, end)
+        yield box_type, payload_start, box_end
+        offset = box_end
+
+
+def _read_moov(stream):
+    """Finds the top-level moov box, seeking over everything else (mdat included), and reads it"""
+    stream.seek(0, os.SEEK_END)
+    file_size = stream.tell()
+    offset = 0
+    while offset + 8 <= file_size:
+        stream.seek(offset)
+        header = stream.read(16)
+        box_type, payload_start, box_end = _box_header(header.ljust(16, b'\0'), 0, file_size - offset)
+        if offset == 0 and box_type != b'ftyp':
+            raise ValueError('not an MP4 file')
+        if box_type == b'moov':
+            if box_end > MAX_MOOV_SIZE:
+                raise ValueError('moov box too large')
+            stream.seek(offset + payload_start)
+            moov = stream.read(box_end - payload_start)
+            if len(moov) != box_end - payload_start:
+                raise ValueError('truncated moov box')
+            return moov
+        offset += box_end
+    raise ValueError('no moov box')
+
+
+def _parse_mvhd(data, start):
+    """Movie duration in seconds, None when unknown"""
+    if data[start] == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, start + 20)
+        unknown = 0xFFFFFFFFFFFFFFFF
+    else:
+        timescale, duration = struct.unpack_from('>II', data, start + 12)
+        unknown = 0xFFFFFFFF
+    if not timescale or not duration or duration == unknown:
+        return None
+    return duration / timescale
+
+
+def _parse_tkhd(data, start):
+    """Track (width, height, rotation) from the track header"""
+    # version/flags, then the times, track id and duration (64-bit times in version 1)
+    offset = start + (36 if data[start] == 1 else 24)
+    # reserved, layer, alternate group, volume, reserved
+    offset += 16
+    matrix = struct.unpack_from('>9i', data, offset)
+    width, height = struct.unpack_from('>II', data, offset + 36)
+    # Rotation of the display matrix, same convention as the 'rotate' tag
+    rotation = round(math.degrees(math.atan2(matrix[1], matrix[0]))) % 360
+    return width >> 16, height >> 16, rotation
+
+
+def _parse_trak(data, start, end):
+    """(width, height, rotation) of a video track, None for other tracks"""
+    dimensions = None
+    handler = None
+    for box_type, payload_start, box_end in _iter_boxes(data, start, end):
+        if box_type == b'tkhd':
+            dimensions = _parse_tkhd(data, payload_start)
+        elif box_type == b'mdia':
+            for child_type, child_start, _ in _iter_boxes(data, payload_start, box_end):
+                if child_type == b'hdlr':
+                    handler = data[child_start + 8:child_start + 12]
+    return dimensions if handler == b'vide' else None
+
+
+def read_mp4_info(stream):
+    """
+    Reads duration, width, height and rotation of an MP4 from its moov box.
+
+    Only the box headers and the moov box are read, the media data is skipped. Returns None
+    when the header alone isn't conclusive (not an MP4, fragmented, no video track, unknown
+    duration...), in which case the caller should ask ffprobe.
+    """
+    position = stream.tell()
+    try:
+        moov = _read_moov(stream)
+        duration = None
+        video = None
+        for box_type, payload_start, box_end in _iter_boxes(moov, 0, len(moov)):
+            if box_type == b'mvhd':
+                duration = _parse_mvhd(moov, payload_start)
+            elif box_type == b'mvex':
+                # Fragmented: the real length is spread over the moof boxes
+                return None
+            elif box_type == b'trak' and video is None:
+                video = _parse_trak(moov, payload_start, box_end)
+    except (ValueError, struct.error, IndexError, OSError):
+        return None
+    finally:
+        stream.seek(position)
+
+    if duration is None or video is None or not video[0] or not video[1]:
+        return None
+    width, height, rotation = video
+    return {'duration': duration, 'width': width, 'height': height, 'rotation': rotation}
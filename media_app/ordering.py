@@ -0,0 +1,63 @@
+from django.db import transaction
+from .models import MediaProject, MediaItem, ORDER_GAP
+
+
+def apply_item_order(item_ids, orders, start=0, step=1):
+    """
+    Numbers the items in the order of `item_ids` from `start`, `step` apart, writing only
+    the rows that change with a single bulk UPDATE.
+
+    `orders` maps item id to its current order. Returns the number of rows updated.
+    """
+    changed = [
+        MediaItem(id=item_id, order=start + index * step)
+        for index, item_id in enumerate(item_ids)
+        if orders[item_id] != start + index * step
+    ]
+    if changed:
+        MediaItem.objects.bulk_update(changed, ['order'])
+    return len(changed)
+
+
+def move_item_after(item, after_id=None):
+    """
+    Moves an item right after the item `after_id` of the same project (first when None).
+
+    The item takes an order between its new neighbours, so only its row is written. When
+    the neighbours leave no room the project is renumbered ORDER_GAP apart first.
+    Returns the item's new order.
+    """
+    with transaction.atomic():
+        # Serialize moves within a project
+        MediaProject.objects.select_for_update().filter(pk=item.project_id).first()
+        siblings = list(
+            MediaItem.objects.filter(project_id=item.project_id)
+            .exclude(pk=item.pk)
+            .order_by('order', 'id')
+            .values_list('id', 'order')
+        )
+
+        position = 0
+        if after_id is not None:
+            sibling_ids = [sibling_id for sibling_id, _ in siblings]
+            if after_id not in sibling_ids:
+                raise ValueError("Items must belong to the same project.")
+            position = sibling_ids.index(after_id) + 1
+
+        low = siblings[position - 1][1] if position > 0 else -1
+        high = siblings[position][1] if position < len(siblings) else low + 2 * ORDER_GAP
+        if high - low >= 2:
+            new_order = (low + high) // 2
+            MediaItem.objects.filter(pk=item.pk).update(order=new_order)
+        else:
+            # No room left between the neighbours: spread the whole project out again
+            item_ids = [sibling_id for sibling_id, _ in siblings]
+            item_ids.insert(position, item.pk)
+            orders = dict(siblings)
+            orders[item.pk] = item.order
+            # Starting at ORDER_GAP leaves room in front of the first item too
+            apply_item_order(item_ids, orders, start=ORDER_GAP, step=ORDER_GAP)
+            new_order = (position + 1) * ORDER_GAP
+
+    item.order = new_order
+    return new_order
@@ -0,0 +1,175 @@
+import mimetypes
+import os
+import threading
+from django.conf import settings
+from .google_drive_utils import get_drive_service, upload_file_to_drive
+from .progress import ProgressReporter
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+except ImportError:  # Only needed with OUTPUT_STORAGE_BACKEND = 's3', see requirements-s3.txt
+    boto3 = None
+    TransferConfig = None
+
+
+# Read size when copying a stream that is being uploaded
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class CopyingReader:
+    """Reads from `stream` and writes everything read to `copy` as well"""
+
+    def __init__(self, stream, copy):
+        self.stream = stream
+        self.copy = copy
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.copy.write(data)
+        return data
+
+    def drain(self):
+        """Copies whatever the consumer didn't read"""
+        for _ in iter(lambda: self.read(COPY_BUFFER_SIZE), b''):
+            pass
+
+
+class OutputStorage:
+    """
+    Where rendered videos are published.
+
+    save() stores the rendered file, records where it went on the project (output_url for
+    anything not served by Django) and returns False when the upload failed. Backends with
+    `can_stream` also take the output as a stream while it is being encoded, with save_stream().
+    """
+    can_stream = False
+
+    def is_configured(self):
+        return True
+
+    def save(self, project, path, name):
+        raise NotImplementedError
+
+    def save_stream(self, project, stream, name):
+        raise NotImplementedError
+
+
+class LocalOutputStorage(OutputStorage):
+    """Keeps the output in MEDIA_ROOT/outputs, where Django serves it"""
+
+    def save(self, project, path, name):
+        return True
+
+
+class DriveOutputStorage(OutputStorage):
+    """Uploads the output to the Google Drive folder and shares it with anyone who has the link"""
+
+    def is_configured(self):
+        return get_drive_service() is not None
+
+    def save(self, project, path, name):
+        file_id, web_view_link = upload_file_to_drive(path, name, project)
+        if not web_view_link:
+            return False
+
+        project.drive_file_id = file_id
+        project.drive_web_view_link = web_view_link
+        project.output_url = web_view_link
+        return True
+
+
+class S3OutputStorage(OutputStorage):
+    """Uploads the output to an S3 bucket, or any S3-compatible store through OUTPUT_S3_ENDPOINT_URL"""
+    can_stream = True
+
+    def is_configured(self):
+        # Outputs are linked by their public URL, a presigned one would stop working once it expires
+        return boto3 is not None and bool(settings.OUTPUT_S3_BUCKET) and bool(settings.OUTPUT_S3_PUBLIC_URL)
+
+    def get_client(self):
+        return boto3.client(
+            's3',
+            endpoint_url=settings.OUTPUT_S3_ENDPOINT_URL or None,
+            region_name=settings.OUTPUT_S3_REGION or None,
+            aws_access_key_id=settings.OUTPUT_S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.OUTPUT_S3_SECRET_ACCESS_KEY or None,
+        )
+
+    def get_transfer_config(self):
+        # Multipart upload with several parts in flight at once
+        return TransferConfig(
+            multipart_threshold=settings.OUTPUT_S3_CHUNK_SIZE,
+            multipart_chunksize=settings.OUTPUT_S3_CHUNK_SIZE,
+            max_concurrency=settings.OUTPUT_S3_MAX_CONCURRENCY,
+        )
+
+    def save(self, project, path, name):
+        key = f"{settings.OUTPUT_S3_PREFIX}{name}"
+        mime_type, _ = mimetypes.guess_type(path)
+        client = self.get_client()
+
+        # Called from the transfer threads with the bytes each one sent
+        size = os.path.getsize(path)
+        reporter = ProgressReporter(project.id, project.status, 'uploading')
+        sent = [0]
+        sent_lock = threading.Lock()
+
+        def on_progress(amount):
+            with sent_lock:
+                sent[0] += amount
+                done = sent[0]
+            reporter(done, size)
+
+        try:
+            # Read from disk part by part
+            client.upload_file(
+                path,
+                settings.OUTPUT_S3_BUCKET,
+                key,
+                ExtraArgs={'ContentType': mime_type or 'application/octet-stream'},
+                Config=self.get_transfer_config(),
+                Callback=on_progress,
+            )
+        except Exception as e:
+            print(f"Error uploading file to S3: {str(e)}")
+            return False
+
+        self.set_output_url(project, key)
+        return True
+
+    def save_stream(self, project, stream, name):
+        key = f"{settings.OUTPUT_S3_PREFIX}{name}"
+        client = self.get_client()
+        try:
+            # The size isn't known up front, each part is sent as soon as it has been read
+            client.upload_fileobj(
+                stream,
+                settings.OUTPUT_S3_BUCKET,
+                key,
+                ExtraArgs={'ContentType': 'video/mp4'},
+                Config=self.get_transfer_config(),
+            )
+        except Exception as e:
+            print(f"Error streaming file to S3: {str(e)}")
+            return False
+
+        self.set_output_url(project, key)
+        return True
+
+    def set_output_url(self, project, key):
+        # Bucket (or CDN in front of it) readable without signing
+        project.output_url = f"{settings.OUTPUT_S3_PUBLIC_URL.rstrip('/')}/{key}"
+
+
+# Values accepted by settings.OUTPUT_STORAGE_BACKEND
+OUTPUT_STORAGES = {
+    'local': LocalOutputStorage,
+    'drive': DriveOutputStorage,
+    's3': S3OutputStorage,
+}
+
+
+def get_output_storage(name=None):
+    """The storage backend called `name`, settings.OUTPUT_STORAGE_BACKEND by default"""
+    return OUTPUT_STORAGES[name or settings.OUTPUT_STORAGE_BACKEND]()
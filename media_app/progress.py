@@ -0,0 +1,141 @@
+import asyncio
+import json
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+# Project statuses after which nothing is published anymore
+FINAL_STATUSES = ('completed', 'failed')
+
+
+def progress_cache():
+    return caches[settings.MEDIA_PROGRESS_CACHE]
+
+
+def progress_key(project_id):
+    return f"project-progress:{project_id}"
+
+
+def preview_key(project_id):
+    return f"project-preview:{project_id}"
+
+
+def get_progress(project_id):
+    """Latest {'status', 'stage', 'percent'} published for the project, None if nothing is known"""
+    return progress_cache().get(progress_key(project_id))
+
+
+def publish_progress(project_id, status, stage=None, percent=None):
+    """
+    Records what the pipeline is doing with the project for the progress stream.
+
+    The cache is shared between the web and render worker processes, so the stream reads
+    it without touching the database.
+    """
+    progress = {'status': status, 'stage': stage, 'percent': percent}
+    progress_cache().set(progress_key(project_id), progress, timeout=settings.MEDIA_PROGRESS_TIMEOUT)
+
+
+def get_preview_status(project_id):
+    """Latest preview status published for the project, None if nothing is known"""
+    return progress_cache().get(preview_key(project_id))
+
+
+def publish_preview_status(project_id, preview_status):
+    """Records the status of the project's preview render for the progress stream"""
+    progress_cache().set(preview_key(project_id), preview_status, timeout=settings.MEDIA_PROGRESS_TIMEOUT)
+
+
+class ProgressReporter:
+    """
+    Publishes how far one stage of a project is, called with (done, total) as work gets done.
+
+    Only whole percent changes are published, so callers can report every frame or chunk.
+    Safe to call from several threads.
+    """
+
+    def __init__(self, project_id, status, stage):
+        self.project_id = project_id
+        self.status = status
+        self.stage = stage
+        self.percent = None
+        self.lock = threading.Lock()
+        self(0, 0)
+
+    def __call__(self, done, total):
+        percent = min(int(done * 100 / total), 100) if total else 0
+        with self.lock:
+            if percent == self.percent:
+                return
+            self.percent = percent
+        try:
+            publish_progress(self.project_id, self.status, self.stage, percent)
+        except Exception as e:
+            # Progress is informative only, never let it break a render or upload
+            print(f"Warning: Could not publish progress of project {self.project_id}: {str(e)}")
+
+
+class ProgressStream:
+    """
+    Server-sent events with a project's progress ('progress' events) and the status of its
+    preview ('preview' events), each sent whenever it changes.
+
+    The stream ends once the project is completed or failed and no preview is rendering, or after
+    MEDIA_PROGRESS_STREAM_SECONDS (the browser then reconnects). Only served under
+    ASGI: events() waits on the event loop without holding a thread.
+    """
+
+    def __init__(self, project_id, initial, initial_preview=''):
+        self.project_id = project_id
+        self.initial = initial
+        self.initial_preview = initial_preview
+        self.last = None
+        self.last_preview = None
+        self.last_sent = time.monotonic()
+        self.deadline = self.last_sent + settings.MEDIA_PROGRESS_STREAM_SECONDS
+        self.finished = False
+
+    def poll(self):
+        """The next chunk of the stream, None when there is nothing to send yet"""
+        now = time.monotonic()
+        if now >= self.deadline:
+            self.finished = True
+            return None
+
+        # Both in one round trip to the cache
+        keys = [progress_key(self.project_id), preview_key(self.project_id)]
+        values = progress_cache().get_many(keys)
+        progress = values.get(keys[0]) or self.last or self.initial
+        preview = values.get(keys[1])
+        if preview is None:
+            preview = self.initial_preview if self.last_preview is None else self.last_preview
+
+        chunk = ''
+        if progress != self.last:
+            self.last = progress
+            chunk += f"event: progress\ndata: {json.dumps(progress)}\n\n"
+        if preview != self.last_preview:
+            self.last_preview = preview
+            chunk += f"event: preview\ndata: {json.dumps({'preview_status': preview})}\n\n"
+        if chunk:
+            self.last_sent = now
+            self.finished = progress['status'] in FINAL_STATUSES and preview != 'processing'
+            return chunk
+        if now - self.last_sent >= settings.MEDIA_PROGRESS_KEEPALIVE_SECONDS:
+            # Keeps proxies from closing an idle connection
+            self.last_sent = now
+            return ": keep-alive\n\n"
+        return None
+
+    async def events(self):
+        # Reconnect quickly when the stream times out
+        yield "retry: 1000\n\n"
+        while True:
+            chunk = await sync_to_async(self.poll)()
+            if chunk:
+                yield chunk
+            if self.finished:
+                return
+            await asyncio.sleep(settings.MEDIA_PROGRESS_POLL_SECONDS)
@@ -0,0 +1,69 @@
+import hashlib
+import io
+import qrcode
+from qrcode.image.svg import SvgPathImage
+from .lru_cache import LRUCache
+
+# Values accepted by settings.MEDIA_QR_FORMAT and the QR code endpoint
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Error correction levels: share of the code that can be damaged and still be read
+QR_ERROR_CORRECTIONS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,  # 7%
+    'M': qrcode.constants.ERROR_CORRECT_M,  # 15%
+    'Q': qrcode.constants.ERROR_CORRECT_Q,  # 25%
+    'H': qrcode.constants.ERROR_CORRECT_H,  # 30%
+}
+
+# Rendered images by (url, format, box size, error correction)
+_images = LRUCache('MEDIA_QR_CACHE_SIZE')
+
+
+def qr_code_digest(url, image_format, box_size, error_correction):
+    """Identifies one rendering of a QR code, used as its ETag"""
+    key = f"{url}\n{image_format}\n{box_size}\n{error_correction}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def render_qr_code(url, image_format, box_size=10, error_correction='L'):
+    """The QR code image of `url` as PNG or SVG bytes"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=QR_ERROR_CORRECTIONS[error_correction],
+        box_size=box_size,
+        border=4,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    if image_format == 'svg':
+        # Vector paths written as text, no raster image to draw and compress
+        img = qr.make_image(image_factory=SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+
+    output = io.BytesIO()
+    img.save(output)
+    return output.getvalue()
+
+
+def get_qr_code(url, image_format, box_size=10, error_correction='L'):
+    """
+    The QR code image of `url`, rendered only if this process doesn't have it yet.
+
+    Images are kept in memory, at most settings.MEDIA_QR_CACHE_SIZE of them.
+    """
+    key = (url, image_format, box_size, error_correction)
+    data = _images.get(key)
+    if data is None:
+        # Two requests for the same new image just both render it
+        data = render_qr_code(url, image_format, box_size, error_correction)
+        _images.set(key, data)
+    return data
+
+
+def clear_qr_code_cache():
+    _images.clear()
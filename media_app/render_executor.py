@@ -0,0 +1,117 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.db import connection
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, memory ceilings are skipped there
+    resource = None
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    """Returns the process-wide render pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Each job gets a fresh spawned process, so a memory ceiling set for one job
+            # never carries over to the next and a crashed encode can't poison the pool
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.RENDER_POOL_SIZE,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                max_tasks_per_child=1,
+            )
+        return _executor
+
+
+def shutdown_render_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _init_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'media_processor.settings')
+    import django
+    django.setup()
+
+
+def _limit_memory(memory_limit_mb):
+    if resource is None or not memory_limit_mb:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    # Inherited by the ffmpeg processes MoviePy starts, so they get the same ceiling. Data
+    # rather than address space: threaded decoders and malloc arenas reserve far more
+    # address space than they ever write to
+    resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def get_status_field(profile):
+    """The MediaProject field holding the status of a render with this profile"""
+    return 'preview_status' if profile == 'preview' else 'status'
+
+
+def render_in_worker(project_id, memory_limit_mb, ffmpeg_threads, profile='final'):
+    """Entry point inside a pool process. Returns (success, project or preview status)."""
+    # Pool processes import this module before _init_worker sets Django up, so nothing
+    # touching the models is imported at module level
+    from .models import MediaProject
+    from .media_processor import process_media_project
+
+    _limit_memory(memory_limit_mb)
+    try:
+        project = MediaProject.objects.get(pk=project_id)
+        success = process_media_project(project, threads=ffmpeg_threads, profile=profile)
+        return success, getattr(project, get_status_field(profile))
+    finally:
+        connection.close()
+
+
+def render_project(project, profile='final'):
+    """
+    Renders the project in a separate worker process from the render pool and
+    records the outcome on the MediaProject (on its preview fields for previews).
+
+    Falls back to rendering in the calling process when RENDER_PROCESS_ISOLATION is off.
+    """
+    from .media_processor import process_media_project
+
+    if not settings.RENDER_PROCESS_ISOLATION:
+        return process_media_project(project, threads=settings.RENDER_FFMPEG_THREADS, profile=profile)
+
+    try:
+        future = get_render_executor().submit(
+            render_in_worker,
+            project.id,
+            settings.RENDER_JOB_MEMORY_LIMIT_MB,
+            settings.RENDER_FFMPEG_THREADS,
+            profile,
+        )
+        success, status = future.result()
+    except BrokenProcessPool:
+        # The worker process died mid-render, most likely killed for running out of memory
+        print(f"Render process for project {project.id} crashed, restarting the render pool")
+        shutdown_render_executor()
+        success, status = False, None
+    except MemoryError:
+        print(f"Project {project.id} exceeded the render memory limit of {settings.RENDER_JOB_MEMORY_LIMIT_MB} MB")
+        success, status = False, None
+
+    # The worker saved its own changes, pick them up and make sure the final status sticks.
+    # A failed render is left as it is, the job queue decides whether it is retried
+    project.refresh_from_db()
+    status_field = get_status_field(profile)
+    if status is not None and getattr(project, status_field) != status:
+        setattr(project, status_field, status)
+        project.save(update_fields=[status_field])
+
+    return success
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from .ffmpeg_renderer import IMAGE_DURATION, MAX_VIDEO_DURATION, render_timeline
+
+# Bump when the way segments are encoded changes, so old cache entries stop matching
+SEGMENT_FORMAT_VERSION = 2
+SEGMENT_FPS = 24
+SEGMENT_PROFILE = 'high'
+
+
+def get_cache_dir():
+    return Path(settings.MEDIA_SEGMENT_CACHE_DIR)
+
+
+def file_hash(path):
+    """SHA-256 of the file contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as media_file:
+        for chunk in iter(lambda: media_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def segment_key(content_hash, media_type, target_size):
+    """Cache key for a normalized segment: source content plus everything that shapes the encode"""
+    params = {
+        'version': SEGMENT_FORMAT_VERSION,
+        'content': content_hash,
+        'size': list(target_size),
+        'duration': MAX_VIDEO_DURATION if media_type == 'video' else IMAGE_DURATION,
+        'fps': SEGMENT_FPS,
+        'codec': 'libx264',
+        'profile': SEGMENT_PROFILE,
+        'pix_fmt': 'yuv420p',
+        'audio': 'aac',
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_segment(entry, target_size, threads=None):
+    """
+    Returns the path of the normalized segment for a timeline entry, rendering it on a miss.
+
+    Segments are H.264 at `target_size` and SEGMENT_FPS with an AAC track (the video's sound,
+    or silence), so any sequence of them can be joined with the concat demuxer without
+    re-encoding.
+    """
+    content_hash = entry.get('hash') or file_hash(entry['path'])
+    key = segment_key(content_hash, entry['media_type'], target_size)
+    segment_path = get_cache_dir() / key[:2] / f"{key}.mp4"
+
+    if segment_path.exists():
+        # Mark as recently used for eviction
+        os.utime(segment_path)
+        return segment_path
+
+    segment_path.parent.mkdir(parents=True, exist_ok=True)
+    # Render next to the final location and rename, so readers never see a partial segment
+    handle, temp_path = tempfile.mkstemp(prefix='.partial-', suffix='.mp4', dir=segment_path.parent)
+    os.close(handle)
+    try:
+        render_timeline([entry], temp_path, target_size, fps=SEGMENT_FPS, threads=threads, profile=SEGMENT_PROFILE,
+                        pad_audio=True)
+        os.replace(temp_path, segment_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    evict_segments()
+    return segment_path
+
+
+def evict_segments(max_bytes=None):
+    """Deletes least recently used segments until the cache fits in its disk budget"""
+    if max_bytes is None:
+        max_bytes = settings.MEDIA_SEGMENT_CACHE_MAX_BYTES
+
+    cache_dir = get_cache_dir()
+    if not cache_dir.exists():
+        return 0
+
+    segments = []
+    total = 0
+    for path in cache_dir.glob('*/*.mp4'):
+        if path.name.startswith('.partial-'):
+            # Still being rendered by someone
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        segments.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(segments):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+            total -= size
+            removed += 1
+        except OSError as e:
+            print(f"Warning: Could not evict segment {path}: {e}")
+    return removed
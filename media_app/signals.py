@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import MediaProject, MediaItem, MediaInfo
+from .ingest import ingest_enabled
+from .job_queue import enqueue_ingest_job
+from .media_info import media_info_values
+from .progress import get_progress, publish_progress, get_preview_status, publish_preview_status
+
+
+def record_new_items_info(items):
+    """Stores the metadata of new uploads, reusing the probe MediaItem.clean already ran"""
+    records = []
+    for item in items:
+        if not item.file:
+            continue
+        try:
+            values = media_info_values(item, info=getattr(item, '_upload_info', None))
+        except Exception as e:
+            print(f"Warning: Could not read metadata of media item {item.id}: {str(e)}")
+            continue
+        records.append(MediaInfo(item=item, **values))
+    MediaInfo.objects.bulk_create(records)
+
+
+def queue_new_items_ingest(project, items):
+    """Starts normalizing new uploads in the background so "Process" only has to assemble them"""
+    if not ingest_enabled():
+        return
+
+    first_video = project.media_items.filter(media_type='video').order_by('order', 'id').first()
+    if first_video in items:
+        # The project output size follows its first video, so everything prepared so far is stale
+        items = list(project.media_items.all())
+
+    transaction.on_commit(lambda: [enqueue_ingest_job(item) for item in items])
+
+
+@receiver(post_save, sender=MediaItem)
+def record_media_item_info(sender, instance, created, **kwargs):
+    if created:
+        record_new_items_info([instance])
+
+
+@receiver(post_save, sender=MediaItem)
+def queue_media_item_ingest(sender, instance, created, **kwargs):
+    if created:
+        queue_new_items_ingest(instance.project, [instance])
+
+
+@receiver(post_save, sender=MediaProject)
+def publish_project_status(sender, instance, update_fields=None, **kwargs):
+    """Tells the progress stream when the project moves to another status"""
+    if update_fields is not None and 'status' not in update_fields:
+        # The instance's status wasn't written and may be outdated (e.g. a preview job saving its fields)
+        return
+    try:
+        progress = get_progress(instance.id)
+        if progress is None or progress['status'] != instance.status:
+            publish_progress(instance.id, instance.status)
+    except Exception as e:
+        print(f"Warning: Could not publish status of project {instance.id}: {str(e)}")
+
+
+@receiver(post_save, sender=MediaProject)
+def publish_project_preview_status(sender, instance, update_fields=None, **kwargs):
+    """Tells the progress stream when the project's preview starts, completes or fails"""
+    if update_fields is not None and 'preview_status' not in update_fields:
+        return
+    try:
+        if get_preview_status(instance.id) != instance.preview_status:
+            publish_preview_status(instance.id, instance.preview_status)
+    except Exception as e:
+        print(f"Warning: Could not publish preview status of project {instance.id}: {str(e)}")
@@ -0,0 +1,17 @@
+from .lru_cache import LRUCache
+
+# Status payloads by (project id, status version)
+_statuses = LRUCache('MEDIA_STATUS_CACHE_SIZE')
+
+
+def get_cached_status(project_id, version):
+    """The status payload built for this version of the project, None if this process has none"""
+    return _statuses.get((project_id, version))
+
+
+def cache_status(project_id, version, data):
+    _statuses.set((project_id, version), data)
+
+
+def clear_status_cache():
+    _statuses.clear()
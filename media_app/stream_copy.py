@@ -0,0 +1,112 @@
+import os
+import tempfile
+from .ffmpeg_renderer import (
+    MAX_VIDEO_DURATION, get_entry_duration, render_timeline, write_concat_list, concat_segments,
+)
+from .media_probe import probe_media, has_keyframe_at
+
+# ffprobe profile names mapped to the libx264 -profile:v values producing them
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+}
+
+
+def get_target_format(info):
+    """Output format for a copy/remux render, taken from the first video of the project"""
+    if info.get('video_codec') != 'h264' or info.get('pix_fmt') != 'yuv420p':
+        return None
+    if info.get('profile') not in X264_PROFILES or not info.get('fps'):
+        return None
+    if info.get('rotation'):
+        # Rotated clips are displayed through a matrix the other segments wouldn't share
+        return None
+    return {
+        'width': info['width'],
+        'height': info['height'],
+        'fps': info['fps'],
+        'frame_rate': info['frame_rate'],
+        'profile': info['profile'],
+    }
+
+
+def matches_target(info, target):
+    """True if the video stream can be copied as-is next to segments encoded for `target`"""
+    return (
+        info.get('video_codec') == 'h264'
+        and info.get('pix_fmt') == 'yuv420p'
+        and info.get('profile') == target['profile']
+        and info.get('width') == target['width']
+        and info.get('height') == target['height']
+        and info.get('fps') is not None
+        and abs(info['fps'] - target['fps']) < 0.01
+        and not info.get('rotation')
+    )
+
+
+def plan_stream_copy(timeline):
+    """
+    Decides, per timeline entry, whether its video can be stream-copied.
+
+    Returns (target format, segments) where each segment is {'entry', 'copy', 'outpoint'},
+    or None when nothing in the timeline can be copied and a full render is cheaper.
+    """
+    target = None
+    segments = []
+    for entry in timeline:
+        segment = {'entry': entry, 'copy': False, 'outpoint': None}
+        segments.append(segment)
+        if entry['media_type'] != 'video':
+            continue
+
+        info = entry.get('info') or probe_media(entry['path'])
+        entry['duration'] = info['duration']
+        if target is None:
+            target = get_target_format(info)
+            if target is None:
+                return None
+
+        if not info['duration'] or not matches_target(info, target):
+            continue
+
+        if info['duration'] > MAX_VIDEO_DURATION:
+            # The 20 second cap can only be copied when it falls on a keyframe, otherwise the
+            # tail of the cut would reference frames that are no longer there
+            if not has_keyframe_at(entry['path'], MAX_VIDEO_DURATION, info['fps']):
+                continue
+            segment['outpoint'] = MAX_VIDEO_DURATION
+
+        segment['copy'] = True
+
+    if target is None or not any(segment['copy'] for segment in segments):
+        return None
+    return target, segments
+
+
+def render_stream_copy(target, segments, output_path, audio_path=None, threads=None):
+    """
+    Assembles the planned segments with the concat demuxer.
+
+    Copyable videos are referenced in place; everything else is encoded to a short
+    segment in the target format first, so only those parts are re-encoded.
+    """
+    target_size = (target['width'], target['height'])
+    with tempfile.TemporaryDirectory(prefix='stream_copy_') as work_dir:
+        concat_entries = []
+        for index, segment in enumerate(segments):
+            entry = segment['entry']
+            if segment['copy']:
+                concat_entries.append((entry['path'], segment['outpoint']))
+                continue
+
+            segment_path = os.path.join(work_dir, f"segment_{index}.mp4")
+            render_timeline([entry], segment_path, target_size, fps=target['frame_rate'],
+                            threads=threads, profile=X264_PROFILES[target['profile']])
+            concat_entries.append((segment_path, None))
+
+        total_duration = sum(get_entry_duration(segment['entry']) for segment in segments)
+        list_path = os.path.join(work_dir, 'segments.txt')
+        write_concat_list(concat_entries, list_path)
+        concat_segments(list_path, output_path, audio_path, total_duration)
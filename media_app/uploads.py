@@ -0,0 +1,169 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .models import MediaItem, UploadSession, get_file_path
+from .segment_cache import file_hash
+
+# Read size when copying a request body to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Running SHA-256 of each upload handled by this process: upload id -> (offset, hash, last write)
+_upload_hashes = {}
+_upload_hashes_lock = threading.Lock()
+
+
+def _drop_idle_hashes():
+    """Forgets the running hashes of uploads this process hasn't written to for a while"""
+    cutoff = time.monotonic() - settings.MEDIA_UPLOAD_EXPIRY_SECONDS
+    with _upload_hashes_lock:
+        for upload_id in [key for key, state in _upload_hashes.items() if state[2] < cutoff]:
+            del _upload_hashes[upload_id]
+
+
+def get_upload_path(session):
+    return Path(settings.MEDIA_ROOT) / session.file_path
+
+
+def start_upload(project, filename, size, media_type):
+    """Opens an upload session and creates the (empty) file at its final location"""
+    file_path = get_file_path(None, filename)
+    session = UploadSession(
+        project=project,
+        filename=filename,
+        media_type=media_type,
+        file_path=file_path,
+        size=size,
+    )
+    upload_path = get_upload_path(session)
+    upload_path.parent.mkdir(parents=True, exist_ok=True)
+    upload_path.touch()
+    session.save()
+
+    _drop_idle_hashes()
+    with _upload_hashes_lock:
+        _upload_hashes[session.pk] = (0, hashlib.sha256(), time.monotonic())
+    return session
+
+
+def write_chunk(session, offset, stream):
+    """
+    Writes the bytes read from `stream` into the upload file at `offset`.
+
+    Returns the new offset, or None when `offset` isn't where the upload stands (a stale
+    retry or a concurrent request), in which case nothing is recorded. Raises ValueError
+    when the chunk would run past the declared size.
+    """
+    if session.status != 'uploading' or offset != session.received:
+        return None
+
+    # Keep hashing only if the chunk continues exactly where the running hash stopped
+    with _upload_hashes_lock:
+        hash_state = _upload_hashes.pop(session.pk, None)
+    digest = hash_state[1] if hash_state and hash_state[0] == offset else None
+
+    end = offset
+    with open(get_upload_path(session), 'r+b') as upload_file:
+        upload_file.seek(offset)
+        for chunk in iter(lambda: stream.read(COPY_BUFFER_SIZE), b''):
+            if end + len(chunk) > session.size:
+                raise ValueError("Chunk runs past the end of the file.")
+            upload_file.write(chunk)
+            end += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+
+    # Only the request that still sees the old offset gets to move it forward
+    updated = UploadSession.objects.filter(pk=session.pk, received=offset, status='uploading').update(
+        received=end, updated_at=timezone.now())
+    if not updated:
+        return None
+
+    if digest is not None:
+        with _upload_hashes_lock:
+            _upload_hashes[session.pk] = (end, digest, time.monotonic())
+    session.received = end
+    return end
+
+
+def finish_upload(session):
+    """
+    Validates the completed upload and creates its MediaItem at the end of the project.
+
+    The file is already where MediaItem expects it, so nothing is copied. Raises
+    ValidationError (and discards the file) when the upload isn't an acceptable item.
+    """
+    if session.status == 'completed':
+        # A retried finalize
+        return session.media_item
+    if session.received != session.size:
+        raise ValueError("Upload is incomplete.")
+
+    upload_path = get_upload_path(session)
+    with _upload_hashes_lock:
+        hash_state = _upload_hashes.pop(session.pk, None)
+    if hash_state and hash_state[0] == session.size:
+        sha256 = hash_state[1].hexdigest()
+    else:
+        # The chunks went through another process (or it restarted), hash the file from disk
+        sha256 = file_hash(upload_path)
+
+    project = session.project
+    item = MediaItem(project=project, file=session.file_path, media_type=session.media_type)
+    try:
+        item.clean()
+    except ValidationError:
+        session.status = 'failed'
+        session.save()
+        if upload_path.exists():
+            os.remove(upload_path)
+        raise
+    finally:
+        item.file.close()
+
+    # Together with any probe clean() ran, kept for the MediaInfo record
+    item._upload_info = dict(getattr(item, '_upload_info', None) or {}, file_size=session.size, sha256=sha256)
+
+    with transaction.atomic():
+        item.order = project.next_item_order()  # Add at the end of the list
+        item.save()
+        session.media_item = item
+        session.status = 'completed'
+        session.save()
+    return item
+
+
+def expire_uploads(max_age=None):
+    """
+    Fails the uploads nobody wrote to for `max_age` seconds (MEDIA_UPLOAD_EXPIRY_SECONDS by
+    default) and deletes their partial files. Returns how many expired.
+    """
+    if max_age is None:
+        max_age = settings.MEDIA_UPLOAD_EXPIRY_SECONDS
+    now = timezone.now()
+
+    expired = 0
+    stale = UploadSession.objects.filter(status='uploading', updated_at__lt=now - timedelta(seconds=max_age))
+    for session in stale:
+        # Only if no chunk moved it forward meanwhile
+        updated = UploadSession.objects.filter(pk=session.pk, status='uploading', received=session.received).update(
+            status='failed', updated_at=now)
+        if not updated:
+            continue
+
+        upload_path = get_upload_path(session)
+        if upload_path.exists():
+            try:
+                os.remove(upload_path)
+            except OSError as e:
+                print(f"Warning: Could not delete abandoned upload {upload_path}: {e}")
+        with _upload_hashes_lock:
+            _upload_hashes.pop(session.pk, None)
+        expired += 1
+    return expired
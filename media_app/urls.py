@@ -10,7 +10,15 @@ urlpatterns = [
     path('project/<int:pk>/update-details/', update_project_details, name='update_project_details'),  # New URL
     path('projects/<int:pk>/', views.project_detail, name='project_detail'),
     path('projects/<int:pk>/process/', views.process_project, name='process_project'),
+    path('projects/<int:pk>/preview/', views.preview_project, name='preview_project'),
     path('projects/<int:pk>/status/', check_project_status, name='check_project_status'),
+    path('projects/<int:pk>/qr-code/', views.project_qr_code, name='project_qr_code'),
+    path('projects/<int:pk>/progress/', views.project_progress, name='project_progress'),
+    path('projects/<int:pk>/items/bulk/', views.bulk_upload_items, name='bulk_upload_items'),
+    path('projects/<int:pk>/uploads/', views.start_item_upload, name='start_item_upload'),
+    path('uploads/<uuid:upload_id>/', views.item_upload, name='item_upload'),
+    path('uploads/<uuid:upload_id>/finalize/', views.finish_item_upload, name='finish_item_upload'),
     path('items/reorder/', views.update_item_order, name='update_item_order'),
+    path('items/<int:item_id>/move/', views.move_item, name='move_item'),
     path('items/<int:item_id>/delete/', views.delete_item, name='delete_item'),
 ]
\ No newline at end of file
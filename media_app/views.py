@@ -1,14 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import MediaProject, MediaItem
-from .forms import MediaProjectForm, MediaItemForm
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-import threading
-from .media_processor import process_media_project
-import qrcode
-import os
+from .models import MediaProject, MediaItem, UploadSession, ORDER_GAP
+from .forms import MediaProjectForm, MediaItemForm, classify_media_type
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_POST, require_http_methods
+from .job_queue import enqueue_render_job
+from .uploads import start_upload, write_chunk, finish_upload
+from .signals import record_new_items_info, queue_new_items_ingest
+from .ordering import apply_item_order, move_item_after
+from .progress import ProgressStream, get_progress, publish_progress, get_preview_status, publish_preview_status
+from .status_cache import get_cached_status, cache_status
+from .qr_codes import QR_FORMATS, QR_ERROR_CORRECTIONS, qr_code_digest, get_qr_code
 from django.conf import settings
 
 
@@ -89,7 +96,7 @@ def project_detail(request, pk):
         if form.is_valid():
             media_item = form.save(commit=False)
             media_item.project = project
-            media_item.order = items.count()  # Add at the end of the list
+            media_item.order = project.next_item_order()  # Add at the end of the list
             media_item.save()
             messages.success(request, 'Media added successfully!')
             return redirect('project_detail', pk=project.pk)
@@ -107,47 +114,234 @@ def project_detail(request, pk):
     })
 
 
+@login_required
+@require_POST
+def bulk_upload_items(request, pk):
+    # Adds many media items at once, appended to the project in the order they were sent
+    project = get_object_or_404(MediaProject, pk=pk, user=request.user)
+    files = request.FILES.getlist('files')
+    if not files:
+        return JsonResponse({'status': 'error', 'message': 'No files were uploaded.'}, status=400)
+
+    # Same checks as one-by-one uploads: the extension picks the media type, clean() the rest
+    new_items = []
+    errors = []
+    for uploaded_file in files:
+        media_type = classify_media_type(uploaded_file.name)
+        if media_type is None:
+            errors.append({'file': uploaded_file.name, 'message': 'Only image and video files are allowed.'})
+            continue
+        item = MediaItem(project=project, file=uploaded_file, media_type=media_type)
+        try:
+            item.clean()
+        except ValidationError as e:
+            errors.append({'file': uploaded_file.name, 'message': ' '.join(e.messages)})
+            continue
+        new_items.append(item)
+
+    if not new_items:
+        return JsonResponse({'status': 'error', 'message': 'No valid files were uploaded.', 'errors': errors},
+                        status=400)
+
+    with transaction.atomic():
+        # Lock the project so concurrent uploads can't hand out the same orders
+        MediaProject.objects.select_for_update().filter(pk=project.pk).first()
+        first_order = project.next_item_order()
+        for index, item in enumerate(new_items):
+            item.order = first_order + index * ORDER_GAP
+        # Files are written to storage as the rows are inserted
+        items = MediaItem.objects.bulk_create(new_items)
+
+        # bulk_create sends no post_save, so do what the signal handlers would
+        record_new_items_info(items)
+        queue_new_items_ingest(project, items)
+
+    return JsonResponse({
+        'status': 'success',
+        'items': [
+            {'id': item.id, 'media_type': item.media_type, 'order': item.order, 'url': item.file.url}
+            for item in items
+        ],
+        'errors': errors,
+    })
+
+
+@login_required
+@require_POST
+def start_item_upload(request, pk):
+    # Opens a chunked upload for a new media item, the file is then sent with PUT requests
+    project = get_object_or_404(MediaProject, pk=pk, user=request.user)
+
+    filename = request.POST.get('filename', '')
+    media_type = classify_media_type(filename)
+    if media_type is None:
+        return JsonResponse({'status': 'error', 'message': 'Only image and video files are allowed.'}, status=400)
+
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = 0
+    if size <= 0 or size > settings.MEDIA_UPLOAD_MAX_SIZE:
+        return JsonResponse({'status': 'error', 'message': 'Invalid file size.'}, status=400)
+
+    session = start_upload(project, filename, size, media_type)
+    return JsonResponse({
+        'status': 'success',
+        'upload_id': str(session.pk),
+        'offset': session.received,
+        'chunk_size': settings.MEDIA_UPLOAD_CHUNK_SIZE,
+    })
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT'])
+def item_upload(request, upload_id):
+    # GET tells where to resume an upload, PUT stores the next chunk at ?offset=
+    session = get_object_or_404(UploadSession, pk=upload_id, project__user=request.user)
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.GET.get('offset', ''))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Missing chunk offset.'}, status=400)
+
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > settings.MEDIA_UPLOAD_CHUNK_SIZE:
+            return JsonResponse({'status': 'error', 'message': 'Chunk is too large.'}, status=413)
+
+        try:
+            new_offset = write_chunk(session, offset, request)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        if new_offset is None:
+            # Out of order: tell the client where to continue from
+            session.refresh_from_db()
+            return JsonResponse({'status': 'error', 'message': 'Offset mismatch.', 'offset': session.received},
+                                status=409)
+
+    return JsonResponse({
+        'status': session.status,
+        'offset': session.received,
+        'size': session.size,
+    })
+
+
+@login_required
+@require_POST
+def finish_item_upload(request, upload_id):
+    # Turns a fully received upload into a media item of its project
+    session = get_object_or_404(UploadSession, pk=upload_id, project__user=request.user)
+
+    if session.status == 'failed':
+        return JsonResponse({'status': 'error', 'message': 'Upload failed validation.'}, status=400)
+    if session.received != session.size:
+        return JsonResponse({'status': 'error', 'message': 'Upload is incomplete.', 'offset': session.received},
+                            status=409)
+
+    try:
+        item = finish_upload(session)
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': ' '.join(e.messages)}, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'item_id': item.id,
+        'media_type': item.media_type,
+        'order': item.order,
+    })
+
+
 @login_required
 @require_POST
 def process_project(request, pk):
-    # Initiates background processing of media project
+    # Queues the media project for rendering by the render workers
     project = get_object_or_404(MediaProject, pk=pk, user=request.user)
 
     if project.media_items.count() == 0:
         messages.error(request, 'Add media to your project before processing!')
         return redirect('project_detail', pk=project.pk)
 
-    # Update status to show processing has started
-    project.status = 'processing'
-    project.save()
+    with transaction.atomic():
+        # Locked so two requests can't both queue a render
+        project = MediaProject.objects.select_for_update().get(pk=project.pk)
+        if project.status in ('processing', 'publishing'):
+            # A pending publish job would mark a new render completed with the old output
+            return JsonResponse({'status': 'error', 'message': 'The project is already being processed.'},
+                                status=409)
 
-    # Start processing in background thread
-    thread = threading.Thread(target=process_media_project, args=(project,))
-    thread.daemon = True  # Ensure thread doesn't block server shutdown
-    thread.start()
+        # Update status to show processing has started
+        project.status = 'processing'
+        project.save()
+
+        # Queue the render, a render worker picks it up when a slot is free
+        enqueue_render_job(project)
 
     messages.info(request,'Project processing started. This may take some time.')
     return redirect('project_detail', pk=project.pk)
 
 
+@login_required
+@require_POST
+def preview_project(request, pk):
+    # Queues a quick low-resolution render to check the project before processing it
+    project = get_object_or_404(MediaProject, pk=pk, user=request.user)
+
+    if project.media_items.count() == 0:
+        messages.error(request, 'Add media to your project before previewing!')
+        return redirect('project_detail', pk=project.pk)
+
+    project.preview_status = 'processing'
+    project.save(update_fields=['preview_status'])
+
+    # Runs on a render slot like any render, but is never published
+    enqueue_render_job(project, profile='preview')
+
+    messages.info(request, 'Preview started. It will show up here in a few seconds.')
+    return redirect('project_detail', pk=project.pk)
+
+
 @login_required
 @require_POST
 def update_item_order(request):
     # Updates the order of media items in a project via AJAX
-    item_ids = request.POST.getlist('item_order[]')
-
-    for index, item_id in enumerate(item_ids):
-        item = get_object_or_404(MediaItem, id=item_id)
+    try:
+        item_ids = [int(item_id) for item_id in request.POST.getlist('item_order[]')]
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+
+    # One query for every item with its owner
+    rows = MediaItem.objects.filter(id__in=item_ids).values_list('id', 'order', 'project__user_id')
+    orders = {}
+    for item_id, order, owner_id in rows:
         # Security check: ensure user owns the items
-        if item.project.user != request.user:
+        if owner_id != request.user.id:
             return JsonResponse({'status': 'error'}, status=403)
+        orders[item_id] = order
+    if len(orders) != len(set(item_ids)):
+        return JsonResponse({'status': 'error'}, status=404)
 
-        item.order = index
-        item.save()
-
+    # Spaced like move_item_after renumbers, so later moves still find room between items
+    apply_item_order(item_ids, orders, start=ORDER_GAP, step=ORDER_GAP)
     return JsonResponse({'status': 'success'})
 
 
+@login_required
+@require_POST
+def move_item(request, item_id):
+    # Moves one item after another (or to the front) without renumbering the rest
+    item = get_object_or_404(MediaItem, id=item_id, project__user=request.user)
+
+    after = request.POST.get('after')
+    try:
+        after_id = int(after) if after else None
+        order = move_item_after(item, after_id)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Items must belong to the same project.'}, status=400)
+
+    return JsonResponse({'status': 'success', 'order': order})
+
+
 @login_required
 @require_POST
 def delete_item(request, item_id):
@@ -177,13 +371,45 @@ def delete_item(request, item_id):
 
 @login_required
 def check_project_status(request, pk):
-    # AJAX endpoint to check project processing status
-    project = get_object_or_404(MediaProject, pk=pk, user=request.user)
+    # AJAX endpoint to check project processing status. A poll only reads the project's
+    # version: unchanged state gets a 304, the payload is built once per version
+    version = MediaProject.objects.filter(pk=pk, user=request.user).values_list('status_version', flat=True).first()
+    if version is None:
+        raise Http404('No MediaProject matches the given query.')
+
+    data = get_cached_status(pk, version)
+    if data is None:
+        project = get_object_or_404(MediaProject, pk=pk, user=request.user)
+        version = project.status_version
+        data = build_project_status(project)
+        cache_status(pk, version, data)
+
+    etag = f'"{pk}-{version}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(data)
+    response['ETag'] = etag
+    # Cached by the browser, but revalidated on every poll
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 
+def build_project_status(project):
+    """The check_project_status payload of a project"""
     data = {
         'status': project.status,
     }
 
+    if project.status == 'publishing':
+        # Share of the output already sent to Drive
+        data['upload_progress'] = project.upload_progress
+
+    if project.preview_status:
+        data['preview_status'] = project.preview_status
+        if project.preview_status == 'completed' and project.preview_file:
+            data['preview_file'] = project.preview_file.url
+
     # For completed projects, include output file information
     if project.status == 'completed':
         # Prioritize Google Drive link if available
@@ -191,6 +417,10 @@ def check_project_status(request, pk):
             data['drive_web_view_link'] = project.drive_web_view_link
             data['output_file'] = project.drive_web_view_link  # For backward compatibility
             data['is_drive_link'] = True
+        elif project.output_url:
+            # Served from object storage
+            data['output_file'] = project.output_url
+            data['is_drive_link'] = False
         elif project.output_file:
             data['output_file'] = project.output_file.url
             data['is_drive_link'] = False
@@ -199,63 +429,69 @@ def check_project_status(request, pk):
         data['success_message'] = 'Project processing finished!'
 
         # Include QR code if available
-        if project.qr_code:
-            data['qr_code'] = project.qr_code.url
-
-        # Update QR code if needed (for local storage)
-        if not project.drive_web_view_link and project.qr_code and "PLACEHOLDER_URL" in generate_actual_qr_code(request,
-                                                                                                                project):
-            # Full URL to the video
-            video_url = request.build_absolute_uri(project.output_file.url)
-            update_qr_code(project, video_url)
-            if project.qr_code:
-                data['qr_code'] = project.qr_code.url
+        qr_code_url = project.qr_code_url()
+        if qr_code_url:
+            data['qr_code'] = qr_code_url
 
-    return JsonResponse(data)
+    return data
 
 
-def generate_actual_qr_code(request, project):
-    # Checks if QR code exists and needs updating
+@login_required
+def project_qr_code(request, pk):
+    # QR code of the project's share URL, rendered on request: ?format=png|svg, ?size= (pixels
+    # per module) and ?ec=L|M|Q|H (error correction)
+    project = get_object_or_404(MediaProject, pk=pk, user=request.user)
+    share_url = project.share_url(request)
+    if project.status != 'completed' or not share_url:
+        raise Http404('The project has nothing to share yet.')
+
+    image_format = request.GET.get('format', settings.MEDIA_QR_FORMAT)
+    if image_format not in QR_FORMATS:
+        return JsonResponse({'status': 'error', 'message': 'Invalid QR code format.'}, status=400)
+    error_correction = request.GET.get('ec', 'L').upper()
+    if error_correction not in QR_ERROR_CORRECTIONS:
+        return JsonResponse({'status': 'error', 'message': 'Invalid error correction level.'}, status=400)
     try:
-        if not project.qr_code:
-            return "No QR code available"
-
-        qr_path = os.path.join(settings.MEDIA_ROOT, project.qr_code.name)
-
-        # Check if the QR code exists
-        if not os.path.exists(qr_path):
-            return "QR code file not found"
+        box_size = int(request.GET.get('size', 10))
+    except ValueError:
+        box_size = 0
+    if box_size < 1 or box_size > settings.MEDIA_QR_MAX_BOX_SIZE:
+        return JsonResponse({'status': 'error', 'message': 'Invalid QR code size.'}, status=400)
+
+    etag = f'"{qr_code_digest(share_url, image_format, box_size, error_correction)}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        data = get_qr_code(share_url, image_format, box_size, error_correction)
+        response = HttpResponse(data, content_type=QR_FORMATS[image_format])
+        response['Content-Disposition'] = f'inline; filename="qr_project_{project.id}.{image_format}"'
+    response['ETag'] = etag
+    # Links carry the share URL's version (MediaProject.qr_code_url), a new link is a new address
+    response['Cache-Control'] = f'private, max-age={settings.MEDIA_QR_MAX_AGE}'
+    return response
 
-        # Return placeholder to indicate it needs updating
-        return "PLACEHOLDER_URL"
 
-    except Exception as e:
-        print(f"Error checking QR code: {str(e)}")
-        return "Error checking QR code"
+@login_required
+def project_progress(request, pk):
+    # Server-sent events with the stage and percent of the project's render and upload, and its preview status
+    project = get_object_or_404(MediaProject, pk=pk, user=request.user)
 
+    initial = {'status': project.status, 'stage': None, 'percent': None}
+    progress = get_progress(project.id)
+    if progress is None or progress['status'] != project.status:
+        # Nothing (or something outdated) was published, start from what the database says
+        publish_progress(project.id, project.status)
+    if get_preview_status(project.id) != project.preview_status:
+        publish_preview_status(project.id, project.preview_status)
+
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held for the whole stream, the page falls back to polling
+        return HttpResponse(status=204)
+
+    # Under ASGI the stream waits on the event loop instead of holding a worker thread
+    stream = ProgressStream(project.id, initial, project.preview_status)
+    response = StreamingHttpResponse(stream.events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the events
+    return response
 
-def update_qr_code(project, video_url):
-    # Updates QR code to link to the actual video URL
-    try:
-        qr_path = os.path.join(settings.MEDIA_ROOT, project.qr_code.name)
-
-        # Create QR code object
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-
-        # Add the actual video URL
-        qr.add_data(video_url)
-        qr.make(fit=True)
-
-        # Create and save the QR code image
-        img = qr.make_image(fill="black", back_color="white")
-        img.save(qr_path)
-
-        return True
-    except Exception as e:
-        print(f"Error updating QR code: {str(e)}")
-        return False
\ No newline at end of file
@@ -6,6 +6,30 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 GOOGLE_DRIVE_CREDENTIALS_FILE = 'C:/credentials.json'
+# Resumable Drive uploads: bytes per request (a multiple of 256KB) and retries of a failed
+# chunk, waiting twice as long each time up to the maximum
+GOOGLE_DRIVE_CHUNK_SIZE = 8 * 1024 * 1024
+GOOGLE_DRIVE_UPLOAD_RETRIES = 5
+GOOGLE_DRIVE_RETRY_BACKOFF_SECONDS = 1
+GOOGLE_DRIVE_RETRY_BACKOFF_MAX_SECONDS = 60
+
+# Where rendered videos are published: 'drive', 's3' (any S3-compatible store, needs boto3)
+# or 'local' to serve them from MEDIA_ROOT/outputs
+OUTPUT_STORAGE_BACKEND = 'drive'
+OUTPUT_S3_BUCKET = os.environ.get('OUTPUT_S3_BUCKET', '')
+# Endpoint of an S3-compatible store such as MinIO, empty for AWS
+OUTPUT_S3_ENDPOINT_URL = os.environ.get('OUTPUT_S3_ENDPOINT_URL', '')
+OUTPUT_S3_REGION = os.environ.get('OUTPUT_S3_REGION', '')
+# Empty to use boto3's own credential lookup (environment, profile, instance role)
+OUTPUT_S3_ACCESS_KEY_ID = os.environ.get('OUTPUT_S3_ACCESS_KEY_ID', '')
+OUTPUT_S3_SECRET_ACCESS_KEY = os.environ.get('OUTPUT_S3_SECRET_ACCESS_KEY', '')
+OUTPUT_S3_PREFIX = 'outputs/'
+# Multipart upload: size of each part and parts uploaded at the same time
+OUTPUT_S3_CHUNK_SIZE = 8 * 1024 * 1024
+OUTPUT_S3_MAX_CONCURRENCY = 4
+# Base URL the bucket is publicly readable at (bucket website or CDN), required: the
+# project page, status and QR code keep linking to it for good
+OUTPUT_S3_PUBLIC_URL = os.environ.get('OUTPUT_S3_PUBLIC_URL', '')
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -20,6 +44,14 @@ ALLOWED_HOSTS = []
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Default image format of the QR codes: 'png', or 'svg' (smaller, drawn as vector paths)
+MEDIA_QR_FORMAT = 'png'
+# QR code images each web process keeps in memory
+MEDIA_QR_CACHE_SIZE = 256
+# Largest ?size= (pixels per module) the QR code endpoint renders
+MEDIA_QR_MAX_BOX_SIZE = 40
+# Seconds browsers keep a QR code, its address changes with the share URL
+MEDIA_QR_MAX_AGE = 365 * 24 * 3600
 
 # Static files
 STATIC_URL = '/static/'
@@ -28,6 +60,71 @@ STATICFILES_DIRS = [
 ]
 
 
+# Render job queue
+# Threads handed to the ffmpeg encoder of each render
+RENDER_FFMPEG_THREADS = 2
+# Number of projects a `manage.py render_worker` process renders at the same time, one per
+# RENDER_FFMPEG_THREADS cores so the encoders don't oversubscribe the CPU
+RENDER_WORKER_CONCURRENCY = max((os.cpu_count() or 1) // RENDER_FFMPEG_THREADS, 1)
+# Number of rendered projects it uploads at the same time, uploads wait on the network
+# rather than the CPU so this is independent of the render concurrency
+PUBLISH_WORKER_CONCURRENCY = 4
+# Seconds a worker holds a job without a heartbeat before another worker may take it over
+RENDER_JOB_LEASE_SECONDS = 300
+RENDER_JOB_MAX_ATTEMPTS = 3
+# Retry delay doubles after every failed attempt, up to the maximum
+RENDER_JOB_RETRY_BACKOFF_SECONDS = 30
+RENDER_JOB_RETRY_BACKOFF_MAX_SECONDS = 3600
+# Render each project in its own process from a pool with one process per render slot, so
+# encoding never competes with request handling for the GIL and memory
+RENDER_PROCESS_ISOLATION = True
+RENDER_POOL_SIZE = RENDER_WORKER_CONCURRENCY
+# Ceiling on the heap and other writable memory (RLIMIT_DATA) of one render process and the
+# ffmpeg it starts, None to disable. Reserved but unused address space doesn't count
+RENDER_JOB_MEMORY_LIMIT_MB = 4096
+# 'moviepy' composites frame by frame in Python, 'ffmpeg' renders with one ffmpeg filtergraph,
+# 'segments' renders each item once to a cached segment and joins the segments without re-encoding
+MEDIA_RENDER_BACKEND = 'moviepy'
+# With the 'ffmpeg' backend, split the timeline into this many chunks encoded concurrently
+# and joined without re-encoding; 1 renders in a single ffmpeg process
+MEDIA_RENDER_CHUNKS = 1
+# With the 'ffmpeg' backend (unchunked) and an output storage that takes streams ('s3'),
+# upload fragmented MP4 straight from the encoder instead of writing the file first
+MEDIA_STREAM_UPLOAD = False
+# Preview renders: a quick low-resolution ffmpeg encode to check the project before the full
+# render, kept in MEDIA_ROOT/previews and never published
+MEDIA_PREVIEW_HEIGHT = 360
+MEDIA_PREVIEW_FPS = 12
+MEDIA_PREVIEW_PRESET = 'ultrafast'
+# Join videos that are already H.264 in the project's size and frame rate with ffmpeg's
+# concat demuxer instead of re-encoding them; other items are encoded as separate segments
+MEDIA_STREAM_COPY_ENABLED = True
+# Optional: when it isn't installed, media is probed by parsing the output of MoviePy's ffmpeg
+FFPROBE_BINARY = 'ffprobe'
+# Content-addressed cache of normalized per-item segments, trimmed least recently used first
+MEDIA_SEGMENT_CACHE_DIR = os.path.join(MEDIA_ROOT, 'segment_cache')
+MEDIA_SEGMENT_CACHE_MAX_BYTES = 10 * 1024 ** 3
+# Prepare each uploaded item's segment in the background right after upload
+# (only used with the 'segments' backend, which is what reads the cache)
+MEDIA_INGEST_ENABLED = True
+# Resampling filter used to fit photos to the output size:
+# 'nearest', 'box', 'bilinear', 'hamming', 'bicubic' or 'lanczos'
+MEDIA_IMAGE_RESAMPLE = 'lanczos'
+# Let the JPEG decoder downscale large photos while decoding instead of decoding at full resolution
+MEDIA_IMAGE_DRAFT_MODE = True
+# Photos are decoded and letterboxed concurrently on a 'thread' or 'process' pool
+MEDIA_IMAGE_POOL = 'thread'
+MEDIA_IMAGE_WORKERS = os.cpu_count() or 1
+# Chunked uploads: largest accepted chunk and largest accepted file
+MEDIA_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+MEDIA_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+# Uploads idle this long are abandoned: their partial files are deleted by the expire_uploads
+# command, and web processes forget their running hashes
+MEDIA_UPLOAD_EXPIRY_SECONDS = 24 * 3600
+# Files accepted in one request by the bulk upload endpoint
+DATA_UPLOAD_MAX_NUMBER_FILES = 500
+
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -92,6 +189,34 @@ DATABASES = {
 }
 
 
+# Caches
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Render progress, written by the render worker processes and read by the web processes,
+    # so it has to be shared between them (use Redis or Memcached across several hosts)
+    'progress': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'progress'),
+    },
+}
+
+# Swaps the progress cache for an in-memory one while the tests run
+TEST_RUNNER = 'media_processor.test_runner.MediaTestRunner'
+
+# Progress stream of a project page: cache holding the progress, seconds a published
+# progress is kept, how often the stream checks it for changes, seconds between keep-alive
+# comments and how long one connection stays open before the browser reconnects
+MEDIA_PROGRESS_CACHE = 'progress'
+MEDIA_PROGRESS_TIMEOUT = 24 * 3600
+MEDIA_PROGRESS_POLL_SECONDS = 0.5
+MEDIA_PROGRESS_KEEPALIVE_SECONDS = 15
+MEDIA_PROGRESS_STREAM_SECONDS = 300
+# Status payloads each web process keeps, one per project version
+MEDIA_STATUS_CACHE_SIZE = 1024
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
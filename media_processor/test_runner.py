@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class MediaTestRunner(DiscoverRunner):
+    """Runs the tests with the progress cache in memory instead of the project's cache directory"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = dict(settings.CACHES)
+        caches[settings.MEDIA_PROGRESS_CACHE] = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'progress-tests',
+        }
+        self.progress_cache = override_settings(CACHES=caches)
+        self.progress_cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.progress_cache.disable()
+        super().teardown_test_environment(**kwargs)
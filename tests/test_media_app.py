@@ -1,16 +1,25 @@
 # tests/test_media_app.py
-from django.test import TestCase, Client, override_settings
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
-from media_app.models import MediaProject, MediaItem
+from media_app.models import MediaProject, MediaItem, RenderJob, MediaInfo
+from unittest import skipUnless
 from unittest.mock import patch, MagicMock
 import tempfile
 import os
 import shutil
+import subprocess
+import uuid
 from PIL import Image
 import io
 import json
+import re
+
+try:
+    import moto
+except ImportError:  # Optional, see requirements-s3.txt
+    moto = None
 
 
 class MediaAppTestCase(TestCase):
@@ -275,13 +284,12 @@ class MediaAppTestCase(TestCase):
         item2.refresh_from_db()
         item3.refresh_from_db()
 
-        self.assertEqual(item3.order, 0)
-        self.assertEqual(item1.order, 1)
-        self.assertEqual(item2.order, 2)
+        self.assertEqual(item3.order, 1024)
+        self.assertEqual(item1.order, 2048)
+        self.assertEqual(item2.order, 3072)
 
     # Project Processing Tests
-    @patch('media_app.views.process_media_project')
-    def test_process_project(self, mock_process):
+    def test_process_project(self):
         """Test initiating project processing"""
         # Add a media item to the project first
         self.add_test_media_item(self.project)
@@ -293,9 +301,31 @@ class MediaAppTestCase(TestCase):
         self.project.refresh_from_db()
         self.assertEqual(self.project.status, 'processing')
 
-        # Check that the process function was called
-        # Note: In the real view it's called in a thread, but we're checking it's called
-        self.assertTrue(mock_process.called)
+        # Check that a render job was queued for the workers
+        self.assertEqual(self.project.render_jobs.filter(status='queued').count(), 1)
+
+    def test_process_project_twice_queues_one_job(self):
+        """Test that clicking process again doesn't queue a second render"""
+        self.add_test_media_item(self.project)
+
+        self.client.post(reverse('process_project', args=[self.project.id]))
+        response = self.client.post(reverse('process_project', args=[self.project.id]))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.project.render_jobs.count(), 1)
+
+    def test_process_project_while_publishing(self):
+        """Test a new render can't be queued while the last one is being published"""
+        self.add_test_media_item(self.project)
+        self.project.status = 'publishing'
+        self.project.save()
+
+        response = self.client.post(reverse('process_project', args=[self.project.id]))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(self.project.render_jobs.exists())
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'publishing')
 
     def test_process_empty_project(self):
         """Test that processing an empty project fails appropriately"""
@@ -332,7 +362,6 @@ class MediaAppTestCase(TestCase):
         self.project.status = 'completed'
         self.project.drive_web_view_link = "https://drive.google.com/fake-link"
         self.project.output_file = "outputs/test.mp4"
-        self.project.qr_code = "qrcodes/test.png"
         self.project.save()
 
         response = self.client.get(
@@ -347,6 +376,34 @@ class MediaAppTestCase(TestCase):
         self.assertTrue(data['is_drive_link'])
         self.assertIn('success_message', data)
 
+    def test_check_project_status_conditional(self):
+        """Test that unchanged status is answered with 304 from a single version lookup"""
+        self.project.status = 'publishing'
+        self.project.upload_progress = 40
+        self.project.save()
+        url = reverse('check_project_status', args=[self.project.id])
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(json.loads(response.content), {'status': 'publishing', 'upload_progress': 40})
+
+        with patch('media_app.views.build_project_status') as mock_build:
+            with self.assertNumQueries(3):  # Session, user and the project's version
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            # Served from the cache, even without the ETag
+            response = self.client.get(url)
+            self.assertEqual(json.loads(response.content)['upload_progress'], 40)
+            mock_build.assert_not_called()
+
+        # Upload progress written by the publisher makes a new version
+        from media_app.google_drive_utils import save_upload_state
+        save_upload_state(self.project, upload_progress=80)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['upload_progress'], 80)
+
     # Security and Access Control Tests
     def test_project_access_protection(self):
         """Test that users can only access their own projects"""
@@ -414,6 +471,12 @@ class MediaAppTestCase(TestCase):
 class GoogleDriveUtilsTestCase(TestCase):
     """Tests for Google Drive utilities"""
 
+    def setUp(self):
+        from media_app.google_drive_utils import reset_drive_service
+
+        reset_drive_service()
+        self.addCleanup(reset_drive_service)
+
     @patch('media_app.google_drive_utils.service_account.Credentials.from_service_account_file')
     @patch('media_app.google_drive_utils.build')
     def test_get_drive_service(self, mock_build, mock_credentials):
@@ -430,7 +493,33 @@ class GoogleDriveUtilsTestCase(TestCase):
         # Check results
         self.assertEqual(service, "fake_service")
         mock_credentials.assert_called_once()
-        mock_build.assert_called_once_with('drive', 'v3', credentials="fake_credentials")
+        mock_build.assert_called_once()
+        self.assertEqual(mock_build.call_args.args, ('drive', 'v3'))
+        self.assertEqual(mock_build.call_args.kwargs['credentials'], "fake_credentials")
+
+        # Later calls reuse the same client
+        self.assertEqual(get_drive_service(), "fake_service")
+        mock_credentials.assert_called_once()
+        mock_build.assert_called_once()
+
+    @patch('media_app.google_drive_utils.service_account.Credentials.from_service_account_file')
+    def test_drive_requests_use_one_connection_per_thread(self, mock_credentials):
+        import threading
+        from google.oauth2.credentials import Credentials
+        from media_app.google_drive_utils import get_drive_service
+
+        mock_credentials.return_value = Credentials(token='fake-token')
+        service = get_drive_service()
+
+        first = service.files().get(fileId='a').http
+        self.assertIs(service.files().get(fileId='b').http, first)
+
+        other_thread = []
+        thread = threading.Thread(target=lambda: other_thread.append(service.files().get(fileId='c').http))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_thread[0], first)
+        self.assertIs(other_thread[0].credentials, first.credentials)
 
     @patch('media_app.google_drive_utils.get_drive_service')
     @patch('media_app.google_drive_utils.MediaFileUpload')
@@ -452,41 +541,38 @@ class GoogleDriveUtilsTestCase(TestCase):
 
         mock_create = MagicMock()
         mock_files.create.return_value = mock_create
-        mock_create.execute.return_value = {'id': 'fake_file_id'}
+        # The whole file goes in one chunk, the link comes with the response
+        mock_create.next_chunk.return_value = (None, {'id': 'fake_file_id', 'webViewLink': 'https://drive.google.com/fake'})
 
         # Setup permissions().create() chain
         mock_permissions = MagicMock()
         mock_service.permissions.return_value = mock_permissions
+        mock_batch = mock_service.new_batch_http_request.return_value
 
-        mock_perm_create = MagicMock()
-        mock_permissions.create.return_value = mock_perm_create
-        mock_perm_create.execute.return_value = {}
-
-        # Setup files().get() chain
-        mock_get = MagicMock()
-        mock_files.get.return_value = mock_get
-        mock_get.execute.return_value = {'webViewLink': 'https://drive.google.com/fake'}
-
-        # Use a simple file path instead of an actual temp file
-        # This avoids permission issues
-        file_path = "dummy/path/test_file.txt"
+        # The upload is keyed by the file's size, so it has to exist
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        file_path = os.path.join(temp_dir, 'test_file.txt')
+        with open(file_path, 'wb') as test_file:
+            test_file.write(b'content')
 
         # Call the function
         result = upload_file_to_drive(file_path, 'test_file.txt')
 
         # Check results
-        self.assertEqual(result, 'https://drive.google.com/fake')
+        self.assertEqual(result, ('fake_file_id', 'https://drive.google.com/fake'))
 
         # Verify the correct API calls were made
         mock_files.create.assert_called_once()
         mock_permissions.create.assert_called_once_with(
             fileId='fake_file_id',
-            body={'type': 'anyone', 'role': 'reader'}
-        )
-        mock_files.get.assert_called_once_with(
-            fileId='fake_file_id',
-            fields='webViewLink'
+            body={'type': 'anyone', 'role': 'reader'},
+            fields='id'
         )
+        # The grant goes through a batch request and the file isn't fetched again
+        mock_batch.add.assert_called_once_with(mock_permissions.create.return_value)
+        mock_batch.execute.assert_called_once()
+        mock_files.get.assert_not_called()
 
         # Verify MediaFileUpload was called correctly
         mock_media_upload.assert_called_once()
@@ -522,75 +608,1826 @@ class QRCodeGenerationTestCase(TestCase):
         # Clean up temporary files
         shutil.rmtree(self.temp_media_dir, ignore_errors=True)
 
-    @override_settings(MEDIA_ROOT=property(lambda self: self.temp_media_dir))
+    def complete(self, **fields):
+        self.project.status = 'completed'
+        self.project.output_file = 'outputs/test.mp4'
+        for name, value in fields.items():
+            setattr(self.project, name, value)
+        self.project.save()
+
     def test_generate_qr_code(self):
-        #Test generating a QR code for a local video
-        from media_app.media_processor import generate_qr_code
+        # Test rendering a QR code in both formats
+        from media_app.qr_codes import render_qr_code
+
+        png = render_qr_code('https://drive.google.com/fake-link', 'png')
+        self.assertEqual(png[:8], b'\x89PNG\r\n\x1a\n')
+        svg = render_qr_code('https://drive.google.com/fake-link', 'svg', box_size=20, error_correction='H')
+        self.assertIn(b'<svg', svg)
+
+    def test_generate_qr_code_cached_in_memory(self):
+        # Test identical requests are rendered once and the cache stays bounded
+        from media_app import qr_codes
+
+        qr_codes.clear_qr_code_cache()
+        self.addCleanup(qr_codes.clear_qr_code_cache)
+        with self.settings(MEDIA_QR_CACHE_SIZE=1):
+            first = qr_codes.get_qr_code('https://example.com/video.mp4', 'png')
+            with patch('media_app.qr_codes.render_qr_code', return_value=b'other') as mock_render:
+                self.assertEqual(qr_codes.get_qr_code('https://example.com/video.mp4', 'png'), first)
+                mock_render.assert_not_called()
+                qr_codes.get_qr_code('https://example.com/other.mp4', 'png')
+                # Pushed out by the other URL
+                qr_codes.get_qr_code('https://example.com/video.mp4', 'png')
+                self.assertEqual(mock_render.call_count, 2)
+
+    def test_qr_code_endpoint(self):
+        # Test the QR code of a local output encodes its URL on the requested host and is cached by the browser
+        self.complete()
+
+        with self.settings(ALLOWED_HOSTS=['videos.example.com'], MEDIA_ROOT=self.temp_media_dir), \
+                patch('media_app.views.get_qr_code', return_value=b'<svg/>') as mock_qr:
+            response = self.client.get(reverse('project_qr_code', args=[self.project.id]),
+                                       {'format': 'svg', 'size': '20', 'ec': 'q'},
+                                       HTTP_HOST='videos.example.com', secure=True)
+            mock_qr.assert_called_once_with('https://videos.example.com/media/outputs/test.mp4', 'svg', 20, 'Q')
 
-        # Create QR code directories
-        qr_folder = os.path.join(self.temp_media_dir, 'qrcodes')
-        os.makedirs(qr_folder, exist_ok=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/svg+xml')
+            self.assertIn('max-age=', response['Cache-Control'])
+            self.assertEqual(response.content, b'<svg/>')
+
+            # Revalidated without rendering
+            mock_qr.reset_mock()
+            response = self.client.get(reverse('project_qr_code', args=[self.project.id]),
+                                       {'format': 'svg', 'size': '20', 'ec': 'q'},
+                                       HTTP_HOST='videos.example.com', secure=True,
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            mock_qr.assert_not_called()
+
+        # Nothing written to disk
+        self.assertFalse(os.path.exists(os.path.join(self.temp_media_dir, 'qrcodes')))
+
+    def test_qr_code_endpoint_invalid(self):
+        # Test invalid parameters and unfinished projects are refused
+        url = reverse('project_qr_code', args=[self.project.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.complete()
+        self.assertEqual(self.client.get(url, {'format': 'gif'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'ec': 'X'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'size': '1000'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'size': 'big'}).status_code, 400)
+
+    def test_qr_code_url_follows_share_url(self):
+        # Test a new share link gets a new QR code address
+        self.complete(output_url='https://cdn.example/outputs/a.mp4')
+        first = self.project.qr_code_url()
+        self.assertTrue(first.startswith(reverse('project_qr_code', args=[self.project.id])))
+
+        self.project.output_url = 'https://cdn.example/outputs/b.mp4'
+        self.assertNotEqual(self.project.qr_code_url(), first)
+
+        self.project.status = 'processing'
+        self.assertIsNone(self.project.qr_code_url())
+
+    def test_delete_qr_codes_command(self):
+        # Test the images written by earlier publishes are removed on request only
+        from django.core.management import call_command
+
+        directory = os.path.join(self.temp_media_dir, 'qrcodes')
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'qr_project_1.png'), 'wb') as f:
+            f.write(b'png')
+
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            output = io.StringIO()
+            call_command('delete_qr_codes', stdout=output)
+            self.assertIn('Deleted 1 QR code image(s)', output.getvalue())
+            self.assertFalse(os.path.exists(directory))
+
+            output = io.StringIO()
+            call_command('delete_qr_codes', stdout=output)
+            self.assertIn('No QR code images to delete', output.getvalue())
+
+    def test_status_check_does_not_render_qr_code(self):
+        """Test checking the status of a completed project doesn't render its QR code"""
+        # Setup a completed project with local output file
+        self.complete()
 
-        # Generate the QR code
-        relative_qr_path = 'qrcodes/test_qr.png'
-        qr_path = os.path.join(self.temp_media_dir, relative_qr_path)
+        with patch('media_app.qr_codes.render_qr_code') as mock_render:
+            response = self.client.get(
+                reverse('check_project_status', args=[self.project.id]),
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            )
+        mock_render.assert_not_called()
 
-        result = generate_qr_code(self.project, relative_qr_path, qr_path)
+        # Check response
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual(data['qr_code'], self.project.qr_code_url())
 
-        # Check results
-        self.assertTrue(result)
-        self.assertTrue(os.path.exists(qr_path))
 
-        # Check that project was updated
+class RenderJobQueueTestCase(TestCase):
+    """Tests for the database-backed render job queue"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Queued Project')
+
+    def test_claim_next_job(self):
+        from media_app.job_queue import enqueue_render_job, claim_next_job
+
+        job = enqueue_render_job(self.project)
+
+        claimed = claim_next_job('worker-1')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, 'running')
+        self.assertEqual(claimed.attempts, 1)
+        self.assertEqual(claimed.worker_id, 'worker-1')
+        self.assertIsNotNone(claimed.lease_expires_at)
+
+        # A running job with a live lease can't be claimed by another worker
+        self.assertIsNone(claim_next_job('worker-2'))
+
+    def test_expired_lease_is_reclaimed(self):
+        from media_app.job_queue import enqueue_render_job, claim_next_job, heartbeat_job
+        from django.utils import timezone
+        from datetime import timedelta
+
+        job = enqueue_render_job(self.project)
+        claim_next_job('worker-1')
+        RenderJob.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        reclaimed = claim_next_job('worker-2')
+        self.assertEqual(reclaimed.id, job.id)
+        self.assertEqual(reclaimed.worker_id, 'worker-2')
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # The original worker has lost the job
+        self.assertFalse(heartbeat_job(job, 'worker-1'))
+        self.assertTrue(heartbeat_job(job, 'worker-2'))
+
+    @override_settings(RENDER_JOB_RETRY_BACKOFF_SECONDS=10, RENDER_JOB_RETRY_BACKOFF_MAX_SECONDS=25)
+    def test_retry_delay_backoff(self):
+        from media_app.job_queue import retry_delay
+
+        self.assertEqual(retry_delay(1), 10)
+        self.assertEqual(retry_delay(2), 20)
+        self.assertEqual(retry_delay(3), 25)
+
+    @patch('media_app.job_queue.render_project', return_value=False)
+    def test_failed_job_is_retried_then_given_up(self, mock_process):
+        from media_app.job_queue import enqueue_render_job, claim_next_job, run_job
+        from django.utils import timezone
+
+        self.project.status = 'processing'
+        self.project.save()
+        job = enqueue_render_job(self.project)
+        job.max_attempts = 2
+        job.save()
+
+        with patch('media_app.signals.publish_progress') as mock_publish:
+            run_job(claim_next_job('worker-1'), 'worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_after, timezone.now())
         self.project.refresh_from_db()
-        self.assertEqual(self.project.qr_code, relative_qr_path)
+        self.assertEqual(self.project.status, 'processing')
+        # The page never saw the attempt fail
+        mock_publish.assert_not_called()
 
-    @override_settings(MEDIA_ROOT=property(lambda self: self.temp_media_dir))
-    def test_generate_qr_code_for_drive(self):
-        #Test generating a QR code for a Google Drive link
-        from media_app.media_processor import generate_qr_code_for_drive
+        # Not due yet because of the backoff
+        self.assertIsNone(claim_next_job('worker-1'))
 
-        # Create QR code directories
-        qr_folder = os.path.join(self.temp_media_dir, 'qrcodes')
-        os.makedirs(qr_folder, exist_ok=True)
+        RenderJob.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        run_job(claim_next_job('worker-1'), 'worker-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'failed')
+        self.assertEqual(mock_process.call_count, 2)
 
-        # Generate the QR code
-        relative_qr_path = 'qrcodes/test_drive_qr.png'
-        qr_path = os.path.join(self.temp_media_dir, relative_qr_path)
-        drive_link = 'https://drive.google.com/fake-link'
 
-        result = generate_qr_code_for_drive(self.project, relative_qr_path, qr_path, drive_link)
+class PublishStageTestCase(TestCase):
+    """Tests for publishing rendered projects as their own jobs"""
 
-        # Check results
-        self.assertTrue(result)
-        self.assertTrue(os.path.exists(qr_path))
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Published Project', status='processing')
+        temp_media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_media_dir, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=temp_media_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def rendered(self, project, profile='final'):
+        project.status = 'publishing'
+        project.output_file = 'outputs/project.mp4'
+        project.save()
+        os.makedirs(os.path.dirname(project.output_file.path), exist_ok=True)
+        with open(project.output_file.path, 'wb') as output:
+            output.write(b'rendered video')
+        return True
+
+    def test_render_job_queues_publish_job(self):
+        from media_app.job_queue import enqueue_render_job, claim_next_job, run_job
+
+        enqueue_render_job(self.project)
+        with patch('media_app.job_queue.render_project', side_effect=self.rendered):
+            run_job(claim_next_job('render-1', ['render', 'ingest']), 'render-1')
+
+        publish_job = RenderJob.objects.get(kind='publish')
+        self.assertEqual(publish_job.status, 'queued')
+        # Only publish slots pick it up
+        self.assertIsNone(claim_next_job('render-1', ['render', 'ingest']))
+        self.assertEqual(claim_next_job('publish-1', ['publish']).id, publish_job.id)
+
+    @patch('media_app.output_storage.get_drive_service', return_value=MagicMock())
+    @patch('media_app.output_storage.upload_file_to_drive', return_value=('drive-id', 'https://drive.example/view'))
+    def test_publish_to_drive(self, mock_upload, mock_service):
+        from media_app.media_processor import publish_project
+
+        self.rendered(self.project)
+        self.assertTrue(publish_project(self.project))
 
-        # Check that project was updated
         self.project.refresh_from_db()
-        self.assertEqual(self.project.qr_code, relative_qr_path)
+        self.assertEqual(self.project.status, 'completed')
+        self.assertEqual(self.project.drive_file_id, 'drive-id')
+        self.assertEqual(self.project.drive_web_view_link, 'https://drive.example/view')
+        self.assertEqual(self.project.output_url, 'https://drive.example/view')
+        self.assertTrue(self.project.qr_code_url())
+
+    @override_settings(OUTPUT_STORAGE_BACKEND='s3', OUTPUT_S3_BUCKET='videos', OUTPUT_S3_CHUNK_SIZE=5 * 1024 * 1024,
+                       OUTPUT_S3_PUBLIC_URL='https://cdn.example/')
+    @patch('media_app.output_storage.TransferConfig')
+    @patch('media_app.output_storage.boto3')
+    def test_publish_to_s3(self, mock_boto3, mock_transfer_config):
+        from media_app.media_processor import publish_project
+
+        self.rendered(self.project)
+        self.assertTrue(publish_project(self.project))
+
+        client = mock_boto3.client.return_value
+        path, bucket, key = client.upload_file.call_args.args
+        self.assertEqual((path, bucket, key), (self.project.output_file.path, 'videos', 'outputs/project.mp4'))
+        self.assertEqual(client.upload_file.call_args.kwargs['ExtraArgs'], {'ContentType': 'video/mp4'})
+        # Uploaded in parts of the configured size
+        self.assertEqual(mock_transfer_config.call_args.kwargs['multipart_chunksize'], 5 * 1024 * 1024)
 
-    @patch('media_app.views.update_qr_code')
-    def test_update_qr_code_on_status_check(self, mock_update_qr):
-        """Test QR code updating when checking project status"""
-        mock_update_qr.return_value = True
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'completed')
+        self.assertEqual(self.project.output_url, 'https://cdn.example/outputs/project.mp4')
+        self.assertIsNone(self.project.drive_web_view_link)
+
+    @override_settings(MEDIA_RENDER_BACKEND='ffmpeg', MEDIA_STREAM_UPLOAD=True, OUTPUT_STORAGE_BACKEND='s3',
+                       OUTPUT_S3_BUCKET='videos', OUTPUT_S3_PUBLIC_URL='https://cdn.example')
+    @patch('media_app.output_storage.TransferConfig')
+    @patch('media_app.output_storage.boto3')
+    def test_render_streams_into_upload(self, mock_boto3, mock_transfer_config):
+        from media_app.media_processor import process_media_project
+
+        uploaded = []
+        client = mock_boto3.client.return_value
+        # Reads the stream in small parts while ffmpeg is still writing it
+        client.upload_fileobj.side_effect = lambda stream, bucket, key, **kwargs: uploaded.extend(
+            iter(lambda: stream.read(64 * 1024), b''))
 
-        # Setup a completed project with local output file
-        self.project.status = 'completed'
-        self.project.output_file = "outputs/test.mp4"
-        self.project.qr_code = "qrcodes/test.png"
-        self.project.save()
+        image_io = io.BytesIO()
+        Image.new('RGB', (100, 100), color='red').save(image_io, format='JPEG')
+        MediaItem.objects.create(
+            project=self.project,
+            file=SimpleUploadedFile('photo.jpg', image_io.getvalue(), content_type='image/jpeg'),
+            media_type='image',
+        )
 
-        # Mock the generate_actual_qr_code function to return PLACEHOLDER_URL
-        with patch('media_app.views.generate_actual_qr_code', return_value="PLACEHOLDER_URL"):
-            response = self.client.get(
-                reverse('check_project_status', args=[self.project.id]),
-                HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        self.assertTrue(process_media_project(self.project, threads=1))
+
+        # Published during the render, no publish stage needed
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'completed')
+        self.assertTrue(self.project.qr_code_url())
+        key = client.upload_fileobj.call_args.args[2]
+        self.assertEqual(self.project.output_url, f'https://cdn.example/{key}')
+        # The local copy holds exactly what was uploaded
+        with open(self.project.output_file.path, 'rb') as output:
+            self.assertEqual(output.read(), b''.join(uploaded))
+
+    @override_settings(OUTPUT_STORAGE_BACKEND='local')
+    def test_publish_locally(self):
+        from media_app.media_processor import publish_project
+
+        self.rendered(self.project)
+        self.assertTrue(publish_project(self.project, last_attempt=False))
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'completed')
+        self.assertEqual(self.project.output_url, '')
+        self.assertTrue(self.project.qr_code_url())
+
+    @patch('media_app.output_storage.get_drive_service', return_value=MagicMock())
+    @patch('media_app.output_storage.upload_file_to_drive', return_value=(None, None))
+    def test_failed_upload_is_retried_before_local_fallback(self, mock_upload, mock_service):
+        from media_app.job_queue import enqueue_publish_job, claim_next_job, run_job
+
+        self.rendered(self.project)
+        job = enqueue_publish_job(self.project)
+        job.max_attempts = 2
+        job.save()
+
+        run_job(claim_next_job('publish-1', ['publish']), 'publish-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'publishing')
+
+        # The last attempt completes the project with its local output
+        RenderJob.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        run_job(claim_next_job('publish-1', ['publish']), 'publish-1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'completed')
+        self.assertEqual(self.project.output_file.name, 'outputs/project.mp4')
+        self.assertIsNone(self.project.drive_web_view_link)
+        self.assertEqual(mock_upload.call_count, 2)
+
+    @patch('media_app.output_storage.get_drive_service', return_value=None)
+    @patch('media_app.output_storage.upload_file_to_drive')
+    def test_publish_without_drive_keeps_local_output(self, mock_upload, mock_service):
+        from media_app.media_processor import publish_project
+
+        self.rendered(self.project)
+        self.assertTrue(publish_project(self.project, last_attempt=False))
+
+        mock_upload.assert_not_called()
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'completed')
+
+
+@skipUnless(moto, 'moto is not installed')
+@override_settings(
+    OUTPUT_STORAGE_BACKEND='s3', OUTPUT_S3_BUCKET='videos', OUTPUT_S3_REGION='us-east-1',
+    OUTPUT_S3_ACCESS_KEY_ID='testing', OUTPUT_S3_SECRET_ACCESS_KEY='testing', OUTPUT_S3_ENDPOINT_URL='',
+    OUTPUT_S3_PUBLIC_URL='https://videos.example.com/', OUTPUT_S3_PREFIX='outputs/',
+    OUTPUT_S3_CHUNK_SIZE=5 * 1024 * 1024,
+)
+class S3OutputStorageTestCase(TestCase):
+    """Tests for the S3 output storage against moto's in-memory S3"""
+
+    def setUp(self):
+        import boto3
+
+        mock_aws = moto.mock_aws()
+        mock_aws.start()
+        self.addCleanup(mock_aws.stop)
+        self.client = boto3.client('s3', region_name='us-east-1', aws_access_key_id='testing',
+                                   aws_secret_access_key='testing')
+        self.client.create_bucket(Bucket='videos')
+
+        user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=user, title='S3 Project', status='publishing')
+        # Larger than a part, so the upload goes multipart
+        self.data = os.urandom(6 * 1024 * 1024)
+
+    def stored(self, key):
+        return self.client.get_object(Bucket='videos', Key=key)['Body'].read()
+
+    def test_save(self):
+        from media_app.output_storage import S3OutputStorage
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        path = os.path.join(temp_dir, 'project.mp4')
+        with open(path, 'wb') as output:
+            output.write(self.data)
+
+        self.assertTrue(S3OutputStorage().save(self.project, path, 'project.mp4'))
+
+        self.assertEqual(self.stored('outputs/project.mp4'), self.data)
+        head = self.client.head_object(Bucket='videos', Key='outputs/project.mp4')
+        self.assertEqual(head['ContentType'], 'video/mp4')
+        self.assertEqual(self.project.output_url, 'https://videos.example.com/outputs/project.mp4')
+
+    def test_save_stream(self):
+        from media_app.output_storage import S3OutputStorage
+
+        self.assertTrue(S3OutputStorage().save_stream(self.project, io.BytesIO(self.data), 'streamed.mp4'))
+
+        self.assertEqual(self.stored('outputs/streamed.mp4'), self.data)
+        self.assertEqual(self.project.output_url, 'https://videos.example.com/outputs/streamed.mp4')
+
+    def test_needs_public_url(self):
+        # Test a bucket without a public URL isn't used, a presigned link would expire
+        from media_app.output_storage import S3OutputStorage
+
+        self.assertTrue(S3OutputStorage().is_configured())
+        with self.settings(OUTPUT_S3_PUBLIC_URL=''):
+            self.assertFalse(S3OutputStorage().is_configured())
+
+    def test_save_to_missing_bucket(self):
+        from media_app.output_storage import S3OutputStorage
+
+        with self.settings(OUTPUT_S3_BUCKET='missing'):
+            self.assertFalse(S3OutputStorage().save_stream(self.project, io.BytesIO(b'video'), 'lost.mp4'))
+        self.assertEqual(self.project.output_url, '')
+
+
+class RenderWorkerCommandTestCase(TransactionTestCase):
+    """Tests for the render_worker management command"""
+
+    @patch('media_app.job_queue.render_project', return_value=True)
+    def test_worker_runs_queued_jobs(self, mock_process):
+        from django.core.management import call_command
+        from media_app.job_queue import enqueue_render_job
+
+        user = User.objects.create_user(username='testuser', password='testpassword123')
+        projects = [MediaProject.objects.create(user=user, title=f'Project {i}') for i in range(3)]
+        for project in projects:
+            enqueue_render_job(project)
+
+        call_command('render_worker', concurrency=2, once=True, stdout=io.StringIO())
+
+        self.assertEqual(RenderJob.objects.filter(status='completed').count(), 3)
+        self.assertEqual(mock_process.call_count, 3)
+
+
+class RenderExecutorTestCase(TestCase):
+    """Tests for running renders in the process pool"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Pooled Project', status='processing')
+
+    @override_settings(RENDER_PROCESS_ISOLATION=False, RENDER_FFMPEG_THREADS=3)
+    @patch('media_app.media_processor.process_media_project', return_value=True)
+    def test_render_inline_when_isolation_disabled(self, mock_process):
+        from media_app.render_executor import render_project
+
+        self.assertTrue(render_project(self.project))
+        mock_process.assert_called_once_with(self.project, threads=3, profile='final')
+
+    @override_settings(RENDER_PROCESS_ISOLATION=False)
+    def test_failed_render_keeps_project_processing(self):
+        from media_app.render_executor import render_project
+
+        # Nothing to render in the project
+        self.assertFalse(render_project(self.project))
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'processing')
+
+    @patch('media_app.render_executor.resource')
+    def test_memory_limit_caps_data_not_address_space(self, mock_resource):
+        from media_app.render_executor import _limit_memory
+
+        _limit_memory(2048)
+        mock_resource.setrlimit.assert_called_once_with(
+            mock_resource.RLIMIT_DATA, (2048 * 1024 * 1024, 2048 * 1024 * 1024))
+
+    @patch('media_app.render_executor._limit_memory')
+    @patch('media_app.media_processor.process_media_project', return_value=True)
+    def test_render_in_worker_applies_budgets(self, mock_process, mock_limit):
+        from media_app.render_executor import render_in_worker
+
+        success, status = render_in_worker(self.project.id, 2048, 4)
+
+        self.assertTrue(success)
+        self.assertEqual(status, 'processing')
+        mock_limit.assert_called_once_with(2048)
+        self.assertEqual(mock_process.call_args.kwargs['threads'], 4)
+
+    def test_spawned_worker_starts(self):
+        # The pool process imports this module before Django is set up in it
+        from media_app.render_executor import get_render_executor, shutdown_render_executor, get_status_field
+
+        self.addCleanup(shutdown_render_executor)
+        future = get_render_executor().submit(get_status_field, 'preview')
+        self.assertEqual(future.result(timeout=60), 'preview_status')
+
+    @patch('media_app.render_executor.get_render_executor')
+    def test_crashed_worker_leaves_project_to_the_queue(self, mock_get_executor):
+        from concurrent.futures.process import BrokenProcessPool
+        from media_app.render_executor import render_project
+
+        mock_get_executor.return_value.submit.return_value.result.side_effect = BrokenProcessPool()
+
+        self.assertFalse(render_project(self.project))
+        # Still in progress, the job queue retries the render or marks the project failed
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'processing')
+
+    @patch('media_app.render_executor.get_render_executor')
+    def test_worker_status_is_written_back(self, mock_get_executor):
+        from media_app.render_executor import render_project
+
+        mock_get_executor.return_value.submit.return_value.result.return_value = (True, 'completed')
+
+        self.assertTrue(render_project(self.project))
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'completed')
+
+
+class FfmpegRendererTestCase(TestCase):
+    """Tests for the ffmpeg filtergraph render backend"""
+
+    def setUp(self):
+        self.entries = [
+            {'path': '/media/uploads/a.mp4', 'media_type': 'video', 'duration': 30.0},
+            {'path': '/media/uploads/b.jpg', 'media_type': 'image'},
+        ]
+
+    def test_build_filter_graph(self):
+        from media_app.ffmpeg_renderer import build_filter_graph
+
+        graph = build_filter_graph(self.entries, (1280, 720), fps=24, audio_input=2, total_duration=22)
+
+        chains = graph.split(';')
+        self.assertTrue(chains[0].startswith('[0:v]trim=duration=20,setpts=PTS-STARTPTS,scale=1280:720'))
+        self.assertIn('pad=1280:720:(ow-iw)/2:(oh-ih)/2:color=black', chains[0])
+        self.assertTrue(chains[1].startswith('[1:v]scale=1280:720'))
+        self.assertEqual(chains[2], '[v0][v1]concat=n=2:v=1:a=0[outv]')
+        self.assertEqual(chains[3], '[2:a]atrim=0:22.000,asetpts=PTS-STARTPTS[outa]')
+
+    def test_build_render_command(self):
+        from media_app.ffmpeg_renderer import build_render_command
+
+        args = build_render_command(self.entries, '/out.mp4', (640, 360), audio_path='/music.mp3', threads=2)
+
+        self.assertEqual(args[:2], ['-i', '/media/uploads/a.mp4'])
+        # Images are looped for two seconds at the output frame rate
+        self.assertEqual(args[2:10], ['-loop', '1', '-framerate', '24', '-t', '2', '-i', '/media/uploads/b.jpg'])
+        self.assertIn('/music.mp3', args)
+        self.assertIn('atrim=0:22.000', args[args.index('-filter_complex') + 1])
+        self.assertEqual(args[args.index('-threads') + 1], '2')
+        self.assertEqual(args[-1], '/out.mp4')
+
+    def test_split_timeline(self):
+        from media_app.ffmpeg_renderer import split_timeline
+
+        entries = [
+            {'path': '/a.mp4', 'media_type': 'video', 'duration': 12.0},
+            {'path': '/b.jpg', 'media_type': 'image'},
+            {'path': '/c.jpg', 'media_type': 'image'},
+            {'path': '/d.mp4', 'media_type': 'video', 'duration': 8.0},
+            {'path': '/e.jpg', 'media_type': 'image'},
+        ]
+
+        # 26 seconds in total: the cut lands after the first chunk reaches half of it
+        groups = split_timeline(entries, 2)
+        self.assertEqual([[entry['path'] for entry in group] for group in groups],
+                         [['/a.mp4', '/b.jpg'], ['/c.jpg', '/d.mp4', '/e.jpg']])
+        # Never more chunks than items, and never an empty one
+        self.assertEqual(len(split_timeline(entries, 32)), 5)
+        self.assertEqual(split_timeline(entries, 1), [entries])
+
+    @patch('media_app.ffmpeg_renderer.concat_segments')
+    @patch('media_app.ffmpeg_renderer.render_timeline')
+    def test_render_chunked(self, mock_render, mock_concat):
+        from media_app.ffmpeg_renderer import render_chunked
+
+        chunks = render_chunked(self.entries, '/out.mp4', (640, 360), audio_path='/music.mp3', threads=2, chunks=4)
+
+        self.assertEqual(chunks, 2)
+        self.assertEqual(mock_render.call_count, 2)
+        for call in mock_render.call_args_list:
+            # Identical encoder settings for every chunk, and no audio until the concat
+            self.assertEqual(call.args[2], (640, 360))
+            self.assertEqual(call.kwargs, {'fps': 24, 'threads': 2, 'profile': 'high', 'pad_audio': False})
+        list_path, output_path, audio_path, total_duration = mock_concat.call_args.args
+        self.assertEqual((output_path, audio_path, total_duration), ('/out.mp4', '/music.mp3', 22))
+
+    def test_render_keeps_source_audio_without_music(self):
+        from media_app.ffmpeg_renderer import get_ffmpeg_binary, render_timeline
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        video_path = os.path.join(temp_dir, 'clip.mp4')
+        subprocess.run([get_ffmpeg_binary(), '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc=size=64x36:rate=24',
+                        '-f', 'lavfi', '-i', 'sine=frequency=440', '-t', '1', '-pix_fmt', 'yuv420p', video_path],
+                       check=True)
+        image_path = os.path.join(temp_dir, 'photo.jpg')
+        Image.new('RGB', (100, 100), color='red').save(image_path)
+        output_path = os.path.join(temp_dir, 'out.mp4')
+
+        render_timeline([{'path': video_path, 'media_type': 'video'}, {'path': image_path, 'media_type': 'image'}],
+                        output_path, (64, 36))
+
+        # The clip's sound is kept, followed by silence under the image
+        infos = ffmpeg_parse_infos(output_path)
+        self.assertTrue(infos['audio_found'])
+        self.assertAlmostEqual(infos['duration'], 3, delta=0.2)
+
+    def test_build_render_command_without_audio(self):
+        from media_app.ffmpeg_renderer import build_render_command
+
+        entries = [{'path': '/b.jpg', 'media_type': 'image'},
+                   {'path': '/c.mp4', 'media_type': 'video', 'duration': 5.0, 'info': {'has_audio': False}}]
+
+        # Nothing to hear, no sound track unless asked to pad one
+        self.assertNotIn('[outa]', build_render_command(entries, '/out.mp4', (640, 360)))
+        args = build_render_command(entries, '/out.mp4', (640, 360), pad_audio=True)
+        self.assertIn('[outa]', args)
+        self.assertIn('anullsrc', args[args.index('-filter_complex') + 1])
+
+    def test_stream_timeline(self):
+        from media_app.ffmpeg_renderer import stream_timeline
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        image_path = os.path.join(temp_dir, 'photo.jpg')
+        Image.new('RGB', (100, 100), color='red').save(image_path)
+
+        data = stream_timeline([{'path': image_path, 'media_type': 'image'}], (64, 36), lambda pipe: pipe.read())
+
+        # Fragmented MP4, written front to back
+        self.assertEqual(data[4:8], b'ftyp')
+        self.assertIn(b'moof', data)
+
+        with self.assertRaises(RuntimeError):
+            stream_timeline([{'path': os.path.join(temp_dir, 'missing.jpg'), 'media_type': 'image'}], (64, 36),
+                            lambda pipe: pipe.read())
+
+    @override_settings(MEDIA_RENDER_BACKEND='ffmpeg')
+    @patch('media_app.media_processor.render_timeline')
+    def test_process_project_with_ffmpeg_backend(self, mock_render):
+        from media_app.media_processor import process_media_project
+
+        user = User.objects.create_user(username='testuser', password='testpassword123')
+        project = MediaProject.objects.create(user=user, title='Filtergraph Project')
+        image = Image.new('RGB', (100, 100), color='red')
+        image_io = io.BytesIO()
+        image.save(image_io, format='JPEG')
+
+        temp_media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_media_dir, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=temp_media_dir):
+            item = MediaItem.objects.create(
+                project=project,
+                file=SimpleUploadedFile('photo.jpg', image_io.getvalue(), content_type='image/jpeg'),
+                media_type='image',
             )
+            self.assertTrue(process_media_project(project, threads=2))
+
+        timeline, output_path, target_size = mock_render.call_args.args[:3]
+        self.assertEqual([entry['item'] for entry in timeline], [item])
+        self.assertEqual(target_size, (1280, 720))
+        self.assertEqual(mock_render.call_args.kwargs['threads'], 2)
+        # Uploading is left to the publish stage
+        project.refresh_from_db()
+        self.assertEqual(project.status, 'publishing')
+        self.assertEqual(project.output_file.name, os.path.relpath(output_path, temp_media_dir))
+
+
+class StreamCopyTestCase(TestCase):
+    """Tests for the stream-copy fast path"""
 
-            # Check that update_qr_code was called
-            self.assertTrue(mock_update_qr.called)
+    def setUp(self):
+        self.info = {
+            'duration': 12.0, 'width': 1920, 'height': 1080, 'fps': 30.0, 'frame_rate': '30/1',
+            'video_codec': 'h264', 'profile': 'High', 'pix_fmt': 'yuv420p',
+            'audio_codec': 'aac', 'has_audio': True, 'rotation': 0,
+        }
+        self.timeline = [
+            {'path': '/uploads/a.mp4', 'media_type': 'video'},
+            {'path': '/uploads/b.jpg', 'media_type': 'image'},
+            {'path': '/uploads/c.mp4', 'media_type': 'video'},
+            {'path': '/uploads/d.mp4', 'media_type': 'video'},
+        ]
+
+    @patch('media_app.stream_copy.has_keyframe_at', return_value=True)
+    @patch('media_app.stream_copy.probe_media')
+    def test_plan_copies_matching_videos_only(self, mock_probe, mock_keyframe):
+        from media_app.stream_copy import plan_stream_copy
+
+        mock_probe.side_effect = [
+            self.info,
+            dict(self.info, width=1280, height=720),  # different size, must be re-encoded
+            dict(self.info, duration=45.0),  # long, cut at the 20 second keyframe
+        ]
+
+        target, segments = plan_stream_copy(self.timeline)
+
+        self.assertEqual((target['width'], target['height'], target['fps']), (1920, 1080, 30.0))
+        self.assertEqual([segment['copy'] for segment in segments], [True, False, False, True])
+        self.assertEqual(segments[3]['outpoint'], 20)
+        mock_keyframe.assert_called_once_with('/uploads/d.mp4', 20, 30.0)
+
+    @patch('media_app.stream_copy.has_keyframe_at', return_value=False)
+    @patch('media_app.stream_copy.probe_media')
+    def test_plan_without_keyframe_at_cap_is_reencoded(self, mock_probe, mock_keyframe):
+        from media_app.stream_copy import plan_stream_copy
+
+        mock_probe.return_value = dict(self.info, duration=45.0)
+
+        self.assertIsNone(plan_stream_copy(self.timeline))
+
+    @patch('media_app.stream_copy.probe_media')
+    def test_plan_requires_h264_first_video(self, mock_probe):
+        from media_app.stream_copy import plan_stream_copy
+
+        mock_probe.return_value = dict(self.info, video_codec='hevc')
+
+        self.assertIsNone(plan_stream_copy(self.timeline))
+
+    def test_write_concat_list(self):
+        from media_app.ffmpeg_renderer import write_concat_list
+
+        list_path = os.path.join(tempfile.mkdtemp(), 'segments.txt')
+        self.addCleanup(shutil.rmtree, os.path.dirname(list_path), ignore_errors=True)
+        write_concat_list([("/uploads/it's.mp4", 20), ('/tmp/segment_1.mp4', None)], list_path)
+
+        with open(list_path) as list_file:
+            self.assertEqual(
+                list_file.read(),
+                "file '/uploads/it'\\''s.mp4'\noutpoint 20\nfile '/tmp/segment_1.mp4'\n"
+            )
+
+
+class SegmentCacheTestCase(TestCase):
+    """Tests for the per-item normalized segment cache"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.source = os.path.join(self.cache_dir, 'photo.jpg')
+        Image.new('RGB', (100, 100), color='red').save(self.source)
+        self.entry = {'path': self.source, 'media_type': 'image'}
+
+    def test_segment_key_depends_on_render_parameters(self):
+        from media_app.segment_cache import segment_key
+
+        key = segment_key('abc', 'image', (1280, 720))
+        self.assertEqual(key, segment_key('abc', 'image', (1280, 720)))
+        self.assertNotEqual(key, segment_key('abc', 'image', (1920, 1080)))
+        self.assertNotEqual(key, segment_key('abc', 'video', (1280, 720)))
+        self.assertNotEqual(key, segment_key('abd', 'image', (1280, 720)))
+
+    @patch('media_app.segment_cache.render_timeline')
+    def test_segment_is_rendered_once(self, mock_render):
+        from media_app.segment_cache import get_segment
+
+        mock_render.side_effect = lambda entries, path, *args, **kwargs: open(path, 'wb').write(b'segment')
+
+        with self.settings(MEDIA_SEGMENT_CACHE_DIR=self.cache_dir):
+            first = get_segment(self.entry, (1280, 720))
+            second = get_segment(dict(self.entry), (1280, 720))
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.exists())
+        self.assertEqual(mock_render.call_count, 1)
+
+    def test_evict_least_recently_used(self):
+        from media_app.segment_cache import evict_segments
+
+        paths = []
+        for index, name in enumerate(['aa', 'bb', 'cc']):
+            os.makedirs(os.path.join(self.cache_dir, name))
+            path = os.path.join(self.cache_dir, name, f'{name}.mp4')
+            with open(path, 'wb') as segment:
+                segment.write(b'x' * 100)
+            os.utime(path, (1000 + index, 1000 + index))
+            paths.append(path)
+
+        with self.settings(MEDIA_SEGMENT_CACHE_DIR=self.cache_dir):
+            self.assertEqual(evict_segments(max_bytes=250), 1)
+
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+
+@override_settings(MEDIA_RENDER_BACKEND='segments', MEDIA_INGEST_ENABLED=True)
+class IngestTestCase(TestCase):
+    """Tests for preparing uploads in the background right after they are saved"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Ingest Project')
+        self.temp_media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_media_dir, ignore_errors=True)
+
+    def add_item(self, name, media_type, order):
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            return MediaItem.objects.create(
+                project=self.project,
+                file=SimpleUploadedFile(name, b'content'),
+                media_type=media_type,
+                order=order,
+            )
+
+    def test_new_item_queues_ingest_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.add_item('photo.jpg', 'image', 0)
+
+        job = RenderJob.objects.get(kind='ingest')
+        self.assertEqual(job.media_item, item)
+        self.assertEqual(job.project, self.project)
+
+    @override_settings(MEDIA_RENDER_BACKEND='moviepy')
+    def test_no_ingest_without_segment_backend(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item('photo.jpg', 'image', 0)
+
+        self.assertFalse(RenderJob.objects.exists())
+
+    def test_first_video_requeues_project_items(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = self.add_item('photo.jpg', 'image', 0)
+        RenderJob.objects.update(status='completed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video = self.add_item('clip.mp4', 'video', 1)
+
+        queued = RenderJob.objects.filter(kind='ingest', status='queued')
+        self.assertEqual({job.media_item for job in queued}, {photo, video})
+
+    @patch('media_app.job_queue.ingest_media_item', return_value=False)
+    def test_failed_ingest_leaves_project_status_alone(self, mock_ingest):
+        from media_app.job_queue import enqueue_ingest_job, claim_next_job, run_job
+
+        item = self.add_item('photo.jpg', 'image', 0)
+        job = enqueue_ingest_job(item)
+        job.max_attempts = 1
+        job.save()
+
+        run_job(claim_next_job('worker-1'), 'worker-1')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'pending')
+        mock_ingest.assert_called_once_with(item)
+
+    @patch('media_app.ingest.get_segment')
+    def test_ingest_prepares_segment(self, mock_segment):
+        from media_app.ingest import ingest_media_item
+
+        item = self.add_item('photo.jpg', 'image', 0)
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            self.assertTrue(ingest_media_item(item))
+
+        entry, target_size = mock_segment.call_args.args
+        self.assertEqual(entry['item'], item)
+        self.assertEqual(target_size, (1280, 720))
+
+
+class LetterboxImageTestCase(TestCase):
+    """Tests for fitting photos to the output size in memory"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+
+    def save_image(self, name, size, color):
+        path = os.path.join(self.temp_dir, name)
+        Image.new('RGB', size, color=color).save(path)
+        return path
+
+    def test_fit_size(self):
+        from media_app.image_processing import fit_size
+
+        self.assertEqual(fit_size((2000, 1000), (1280, 720)), (1280, 640))
+        self.assertEqual(fit_size((1000, 2000), (1280, 720)), (360, 720))
+
+    def test_letterbox_wide_image(self):
+        from media_app.image_processing import letterbox_image
+
+        frame = letterbox_image(self.save_image('wide.png', (400, 100), (0, 0, 255)), (1280, 720))
+
+        self.assertEqual(frame.shape, (720, 1280, 3))
+        self.assertEqual(frame.dtype.name, 'uint8')
+        # Black bars above and below, the photo in the middle
+        self.assertEqual(frame[0, 640].tolist(), [0, 0, 0])
+        self.assertEqual(frame[360, 640].tolist(), [0, 0, 255])
+        self.assertEqual(frame[360, 0].tolist(), [0, 0, 255])
+
+    @override_settings(MEDIA_IMAGE_DRAFT_MODE=True, MEDIA_IMAGE_RESAMPLE='bilinear')
+    def test_letterbox_large_jpeg_in_draft_mode(self):
+        from media_app.image_processing import letterbox_image
+
+        frame = letterbox_image(self.save_image('tall.jpg', (1500, 3000), (255, 0, 0)), (1280, 720))
+
+        self.assertEqual(frame.shape, (720, 1280, 3))
+        self.assertEqual(frame[360, 0].tolist(), [0, 0, 0])
+        red, green, blue = frame[360, 640].tolist()
+        self.assertGreater(red, 240)
+        self.assertLess(green + blue, 20)
+
+    @override_settings(MEDIA_IMAGE_POOL='thread', MEDIA_IMAGE_WORKERS=4)
+    def test_preprocess_images_keeps_timeline_order(self):
+        from media_app.image_processing import preprocess_images
+
+        item = MagicMock(id=1)
+        timeline = [
+            {'item': item, 'path': self.save_image('red.png', (100, 100), (255, 0, 0)), 'media_type': 'image'},
+            {'item': item, 'path': 'clip.mp4', 'media_type': 'video'},
+            {'item': item, 'path': self.save_image('green.png', (100, 100), (0, 255, 0)), 'media_type': 'image'},
+            {'item': item, 'path': os.path.join(self.temp_dir, 'missing.png'), 'media_type': 'image'},
+        ]
+
+        frames = preprocess_images(timeline, (64, 36))
+
+        # Videos are skipped and the unreadable image is left out
+        self.assertEqual(sorted(frames), [0, 2])
+        self.assertEqual(frames[0][18, 32].tolist(), [255, 0, 0])
+        self.assertEqual(frames[2][18, 32].tolist(), [0, 255, 0])
+
+
+class MediaInfoTestCase(TestCase):
+    """Tests for the metadata probed once per upload"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Info Project')
+        self.temp_media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_media_dir, ignore_errors=True)
+        self.video_info = {
+            'duration': 30.0, 'width': 1920, 'height': 1080, 'fps': 30.0, 'frame_rate': '30/1',
+            'video_codec': 'h264', 'profile': 'High', 'pix_fmt': 'yuv420p',
+            'audio_codec': None, 'has_audio': False, 'rotation': 0,
+        }
+
+    def test_image_upload_records_info(self):
+        from media_app.segment_cache import file_hash
+
+        image_io = io.BytesIO()
+        Image.new('RGB', (300, 200), color='red').save(image_io, format='PNG')
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            item = MediaItem.objects.create(
+                project=self.project,
+                file=SimpleUploadedFile('photo.png', image_io.getvalue()),
+                media_type='image',
+            )
+
+            info = MediaInfo.objects.get(item=item)
+            self.assertEqual((info.width, info.height), (300, 200))
+            self.assertIsNone(info.duration)
+            self.assertEqual(info.file_size, len(image_io.getvalue()))
+            self.assertEqual(info.sha256, file_hash(item.file.path))
+
+    @patch('media_app.media_info.probe_media')
+    @patch('media_app.models.probe_upload')
+    def test_video_is_probed_once(self, mock_clean_probe, mock_info_probe):
+        from media_app.media_processor import build_timeline, get_target_size
+        from pathlib import Path
+
+        mock_clean_probe.return_value = self.video_info
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            item = MediaItem(
+                project=self.project,
+                file=SimpleUploadedFile('clip.mp4', b'video content'),
+                media_type='video',
+            )
+            item.clean()
+            item.save()
+
+            media_root = Path(self.temp_media_dir)
+            items = self.project.media_items.select_related('info')
+            with patch('media_app.media_processor.VideoFileClip') as mock_clip:
+                target_size = get_target_size(items, media_root)
+                timeline = build_timeline(items, media_root)
+
+        # Not an MP4 header, so clean() asks ffprobe: that probe is what gets stored and
+        # nothing reopens the file afterwards
+        self.assertEqual(mock_clean_probe.call_count, 1)
+        mock_info_probe.assert_not_called()
+        mock_clip.assert_not_called()
+        self.assertEqual(target_size, (1920, 1080))
+        self.assertEqual(timeline[0]['duration'], 30.0)
+        self.assertEqual(timeline[0]['info']['profile'], 'High')
+        self.assertEqual(timeline[0]['hash'], item.info.sha256)
+        self.assertEqual(item.info.file_size, len(b'video content'))
+
+    @patch('media_app.models.probe_upload')
+    def test_long_video_is_rejected(self, mock_probe):
+        from django.core.exceptions import ValidationError
+
+        mock_probe.return_value = dict(self.video_info, duration=150.0)
+        item = MediaItem(project=self.project, file=SimpleUploadedFile('long.mp4', b'video'), media_type='video')
+
+        with self.assertRaisesMessage(ValidationError, 'Videos must be 120 seconds'):
+            item.clean()
+
+    @patch('media_app.media_info.probe_media')
+    def test_info_is_backfilled_on_first_use(self, mock_probe):
+        from media_app.media_info import get_media_info
+
+        mock_probe.return_value = self.video_info
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            item = MediaItem.objects.create(
+                project=self.project,
+                file=SimpleUploadedFile('clip.mp4', b'video content'),
+                media_type='video',
+            )
+            # An item uploaded before its metadata was recorded
+            MediaInfo.objects.filter(item=item).delete()
+            item = MediaItem.objects.get(pk=item.pk)
+            mock_probe.reset_mock()
+
+            info = get_media_info(item)
+            self.assertEqual(get_media_info(item), info)
+
+        self.assertEqual(mock_probe.call_count, 1)
+        self.assertEqual(info.width, 1920)
+        self.assertTrue(MediaInfo.objects.filter(item=item).exists())
+
+    def test_rotation_from_rotate_tag(self):
+        from media_app.media_probe import _parse_rotation
+
+        # Older ffprobe: clockwise
+        self.assertEqual(_parse_rotation({'tags': {'rotate': '90'}}), 90)
+        self.assertEqual(_parse_rotation({'tags': {'rotate': '270'}}), 270)
+        self.assertEqual(_parse_rotation({}), 0)
+
+    def test_rotation_from_display_matrix(self):
+        from media_app.media_probe import _parse_rotation
+
+        # Newer ffprobe: counter-clockwise, so the same phone clip reads the same either way
+        self.assertEqual(_parse_rotation({'side_data_list': [{'rotation': -90}]}), 90)
+        self.assertEqual(_parse_rotation({'side_data_list': [{'rotation': 90}]}), 270)
+        self.assertEqual(_parse_rotation({'side_data_list': [{'rotation': '-180.00'}]}), 180)
+
+    def make_video(self, name, *flags):
+        from media_app.ffmpeg_renderer import get_ffmpeg_binary
+
+        path = os.path.join(self.temp_media_dir, name)
+        subprocess.run([get_ffmpeg_binary(), '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc=size=64x36:rate=24',
+                        '-f', 'lavfi', '-i', 'sine', '-t', '1', '-pix_fmt', 'yuv420p', *flags, path], check=True)
+        return path
+
+    @override_settings(FFPROBE_BINARY='missing-ffprobe')
+    def test_probe_without_ffprobe(self):
+        from media_app.media_probe import probe_media
+
+        info = probe_media(self.make_video('clip.mp4'))
+
+        # Read from ffmpeg's summary instead
+        self.assertEqual((info['width'], info['height']), (64, 36))
+        self.assertAlmostEqual(info['duration'], 1, delta=0.1)
+        self.assertTrue(info['has_audio'])
+        self.assertIsNone(info['video_codec'])
+
+    @override_settings(FFPROBE_BINARY='missing-ffprobe')
+    def test_fragmented_upload_accepted_without_ffprobe(self):
+        from django.core.exceptions import ValidationError
+
+        path = self.make_video('fragmented.mp4', '-movflags', 'frag_keyframe+empty_moov')
+        with open(path, 'rb') as video:
+            item = MediaItem(project=self.project, file=SimpleUploadedFile('fragmented.mp4', video.read()),
+                             media_type='video')
+        # The header alone can't tell the duration, ffmpeg reads it
+        item.clean()
+        self.assertAlmostEqual(item._upload_info['duration'], 1, delta=0.1)
+
+        item = MediaItem(project=self.project, file=SimpleUploadedFile('broken.mp4', b'not a video'),
+                         media_type='video')
+        with self.assertRaisesMessage(ValidationError, 'Error validating video'):
+            item.clean()
+
+
+class Mp4HeaderTestCase(TestCase):
+    """Tests for reading the duration from the MP4 moov box"""
+
+    def box(self, box_type, payload):
+        import struct
+        return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+    def make_mp4(self, duration=30, width=1920, height=1080, moov_first=False, version=0, fragmented=False):
+        import struct
+        timescale = 600
+        if version == 1:
+            mvhd = b'\x01\0\0\0' + struct.pack('>QQIQ', 0, 0, timescale, duration * timescale)
+            tkhd_times = struct.pack('>QQIIQ', 0, 0, 1, 0, duration * timescale)
+        else:
+            mvhd = b'\0\0\0\0' + struct.pack('>IIII', 0, 0, timescale, duration * timescale)
+            tkhd_times = struct.pack('>IIIII', 0, 0, 1, 0, duration * timescale)
+        mvhd += b'\0' * 80
+        matrix = struct.pack('>9i', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+        tkhd = bytes([version, 0, 0, 7]) + tkhd_times + b'\0' * 16 + matrix + struct.pack('>II', width << 16, height << 16)
+        hdlr = b'\0' * 8 + b'vide' + b'\0' * 13
+        trak = self.box(b'trak', self.box(b'tkhd', tkhd) + self.box(b'mdia', self.box(b'hdlr', hdlr)))
+        moov_payload = self.box(b'mvhd', mvhd) + trak
+        if fragmented:
+            moov_payload += self.box(b'mvex', b'')
+        moov = self.box(b'moov', moov_payload)
+
+        ftyp = self.box(b'ftyp', b'isom\0\0\x02\0isomiso2avc1mp41')
+        mdat = self.box(b'mdat', b'\0' * 4096)
+        return ftyp + (moov + mdat if moov_first else mdat + moov)
+
+    def test_read_duration_and_size(self):
+        from media_app.mp4_header import read_mp4_info
+
+        for moov_first in (True, False):
+            for version in (0, 1):
+                stream = io.BytesIO(self.make_mp4(moov_first=moov_first, version=version))
+                self.assertEqual(read_mp4_info(stream),
+                                 {'duration': 30.0, 'width': 1920, 'height': 1080, 'rotation': 0})
+                # The stream is left where it was
+                self.assertEqual(stream.tell(), 0)
+
+    def test_inconclusive_headers(self):
+        from media_app.mp4_header import read_mp4_info
+
+        self.assertIsNone(read_mp4_info(io.BytesIO(b'file_content')))
+        self.assertIsNone(read_mp4_info(io.BytesIO(self.make_mp4(fragmented=True))))
+        self.assertIsNone(read_mp4_info(io.BytesIO(self.make_mp4()[:-20])))
+
+    @patch('media_app.models.probe_upload')
+    def test_clean_reads_header_only(self, mock_probe):
+        from django.core.exceptions import ValidationError
+
+        item = MediaItem(file=SimpleUploadedFile('clip.mp4', self.make_mp4(duration=30)), media_type='video')
+        item.clean()
+
+        long_item = MediaItem(file=SimpleUploadedFile('long.mp4', self.make_mp4(duration=150)), media_type='video')
+        with self.assertRaisesMessage(ValidationError, 'Videos must be 120 seconds'):
+            long_item.clean()
+
+        mock_probe.assert_not_called()
+
+
+class ChunkedUploadTestCase(TestCase):
+    """Tests for resumable uploads sent in chunks"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Upload Project')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpassword123')
+        self.temp_media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_media_dir, ignore_errors=True)
+        image_io = io.BytesIO()
+        Image.new('RGB', (64, 48), color='blue').save(image_io, format='PNG')
+        self.content = image_io.getvalue()
+
+    def start(self, filename='photo.png', size=None):
+        return self.client.post(reverse('start_item_upload', args=[self.project.id]), {
+            'filename': filename,
+            'size': len(self.content) if size is None else size,
+        })
+
+    def put_chunk(self, upload_id, offset, data):
+        url = reverse('item_upload', args=[upload_id]) + f'?offset={offset}'
+        return self.client.put(url, data=data, content_type='application/octet-stream')
+
+    def test_abandoned_upload_expires(self):
+        from django.core.management import call_command
+        from django.utils import timezone
+        from datetime import timedelta
+        from media_app import uploads
+        from media_app.models import UploadSession
+
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            abandoned = self.start().json()['upload_id']
+            self.put_chunk(abandoned, 0, self.content[:10])
+            active = self.start().json()['upload_id']
+            UploadSession.objects.filter(pk=abandoned).update(updated_at=timezone.now() - timedelta(days=2))
+            abandoned_path = uploads.get_upload_path(UploadSession.objects.get(pk=abandoned))
+
+            call_command('expire_uploads', stdout=io.StringIO())
+
+            self.assertEqual(UploadSession.objects.get(pk=abandoned).status, 'failed')
+            self.assertFalse(abandoned_path.exists())
+            self.assertNotIn(uuid.UUID(abandoned), uploads._upload_hashes)
+            # Recent uploads are left alone
+            self.assertEqual(UploadSession.objects.get(pk=active).status, 'uploading')
+            self.assertIn(uuid.UUID(active), uploads._upload_hashes)
+
+    def test_idle_upload_hashes_are_dropped(self):
+        from media_app import uploads
+
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            idle = self.start().json()['upload_id']
+            with self.settings(MEDIA_UPLOAD_EXPIRY_SECONDS=0):
+                current = self.start().json()['upload_id']
+
+        self.assertNotIn(uuid.UUID(idle), uploads._upload_hashes)
+        self.assertIn(uuid.UUID(current), uploads._upload_hashes)
+
+    def test_upload_in_chunks_and_resume(self):
+        import hashlib
+
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            upload_id = self.start().json()['upload_id']
+            half = len(self.content) // 2
+
+            self.assertEqual(self.put_chunk(upload_id, 0, self.content[:half]).json()['offset'], half)
+            # A retried chunk is refused with the offset to continue from
+            response = self.put_chunk(upload_id, 0, self.content[:half])
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['offset'], half)
+            self.assertEqual(self.client.get(reverse('item_upload', args=[upload_id])).json()['offset'], half)
+
+            # Finalizing early is refused too
+            self.assertEqual(self.client.post(reverse('finish_item_upload', args=[upload_id])).status_code, 409)
+
+            self.put_chunk(upload_id, half, self.content[half:])
+            response = self.client.post(reverse('finish_item_upload', args=[upload_id]))
+
+            self.assertEqual(response.status_code, 200)
+            item = MediaItem.objects.get(id=response.json()['item_id'])
+            self.assertEqual(item.media_type, 'image')
+            self.assertEqual(item.order, 0)
+            with open(item.file.path, 'rb') as stored:
+                self.assertEqual(stored.read(), self.content)
+            # Hashed as the chunks came in
+            self.assertEqual(item.info.sha256, hashlib.sha256(self.content).hexdigest())
+            self.assertEqual(item.info.file_size, len(self.content))
+
+    def test_rejects_bad_uploads(self):
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            self.assertEqual(self.start(filename='notes.txt').status_code, 400)
+            self.assertEqual(self.start(size=0).status_code, 400)
+
+            upload_id = self.start(size=4).json()['upload_id']
+            self.assertEqual(self.put_chunk(upload_id, 0, b'too long').status_code, 400)
+
+    def test_other_users_cannot_upload(self):
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            upload_id = self.start().json()['upload_id']
+
+        User.objects.create_user(username='otheruser', password='otherpassword123')
+        self.client.login(username='otheruser', password='otherpassword123')
+        self.assertEqual(self.put_chunk(upload_id, 0, self.content).status_code, 404)
+        self.assertEqual(self.start().status_code, 404)
+
+    @patch('media_app.models.probe_upload', side_effect=RuntimeError('not a video'))
+    def test_invalid_video_is_discarded(self, mock_probe):
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            upload_id = self.start(filename='clip.mp4', size=12).json()['upload_id']
+            self.put_chunk(upload_id, 0, b'file_content')
+            response = self.client.post(reverse('finish_item_upload', args=[upload_id]))
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Error validating video', response.json()['message'])
+            self.assertFalse(MediaItem.objects.exists())
+            self.assertEqual(os.listdir(os.path.join(self.temp_media_dir, 'uploads')), [])
+
+
+class BulkUploadTestCase(TestCase):
+    """Tests for adding many media items in one request"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Bulk Project')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpassword123')
+        self.temp_media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_media_dir, ignore_errors=True)
+
+    def image_file(self, name):
+        image_io = io.BytesIO()
+        Image.new('RGB', (40, 30), color='green').save(image_io, format='JPEG')
+        return SimpleUploadedFile(name, image_io.getvalue(), content_type='image/jpeg')
+
+    def test_bulk_upload_appends_items_in_order(self):
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            MediaItem.objects.create(project=self.project, file=self.image_file('first.jpg'),
+                                     media_type='image', order=4)
+            files = [self.image_file(f'photo{index}.jpg') for index in range(5)]
+
+            # Session, user, project, lock, max order, then one insert per table whatever the file count
+            with self.assertNumQueries(9):
+                response = self.client.post(reverse('bulk_upload_items', args=[self.project.id]), {'files': files})
+
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            # Spaced ORDER_GAP apart, like renumbered items
+            self.assertEqual([item['order'] for item in data['items']], [1028, 2052, 3076, 4100, 5124])
+            items = MediaItem.objects.filter(id__in=[item['id'] for item in data['items']]).order_by('order')
+            self.assertEqual([os.path.exists(item.file.path) for item in items], [True] * 5)
+            # Metadata is recorded even though bulk_create sends no post_save
+            self.assertEqual([(item.info.width, item.info.height) for item in items], [(40, 30)] * 5)
+
+    def test_invalid_files_are_reported(self):
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            response = self.client.post(reverse('bulk_upload_items', args=[self.project.id]), {
+                'files': [self.image_file('photo.jpg'), SimpleUploadedFile('notes.txt', b'text')],
+            })
 
-            # Check response
             self.assertEqual(response.status_code, 200)
-            data = json.loads(response.content)
-            self.assertEqual(data['status'], 'completed')
+            data = response.json()
+            self.assertEqual(len(data['items']), 1)
+            self.assertEqual(data['errors'][0]['file'], 'notes.txt')
+
+            response = self.client.post(reverse('bulk_upload_items', args=[self.project.id]), {
+                'files': [SimpleUploadedFile('notes.txt', b'text')],
+            })
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.project.media_items.count(), 1)
+
+    @override_settings(MEDIA_RENDER_BACKEND='segments')
+    def test_bulk_upload_queues_ingest(self):
+        with self.settings(MEDIA_ROOT=self.temp_media_dir):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('bulk_upload_items', args=[self.project.id]), {
+                    'files': [self.image_file('a.jpg'), self.image_file('b.jpg')],
+                })
+
+        self.assertEqual(RenderJob.objects.filter(kind='ingest').count(), 2)
+
+
+class ItemOrderingTestCase(TestCase):
+    """Tests for bulk reordering and moving single items"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Ordering Project')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpassword123')
+
+    def add_items(self, orders):
+        return MediaItem.objects.bulk_create([
+            MediaItem(project=self.project, file=f'uploads/{index}.jpg', media_type='image', order=order)
+            for index, order in enumerate(orders)
+        ])
+
+    def ordered_ids(self):
+        return list(self.project.media_items.order_by('order', 'id').values_list('id', flat=True))
+
+    def test_reorder_uses_constant_queries(self):
+        items = self.add_items(range(50))
+        new_order = [item.id for item in reversed(items)]
+
+        # Session, user, ownership check and a single CASE UPDATE, whatever the item count
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('update_item_order'), {'item_order[]': new_order})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ordered_ids(), new_order)
+        self.assertEqual(MediaItem.objects.get(id=new_order[0]).order, 1024)
+
+    def test_move_after_reorder_writes_one_row(self):
+        items = self.add_items(range(5))
+        new_order = [item.id for item in reversed(items)]
+        self.client.post(reverse('update_item_order'), {'item_order[]': new_order})
+        orders = dict(self.project.media_items.values_list('id', 'order'))
+
+        # The reorder left room between the items, nothing else is renumbered
+        response = self.client.post(reverse('move_item', args=[new_order[0]]), {'after': new_order[1]})
+
+        self.assertEqual(response.json()['order'], 2560)
+        del orders[new_order[0]]
+        self.assertEqual(dict(self.project.media_items.exclude(id=new_order[0]).values_list('id', 'order')), orders)
+
+    def test_reorder_unknown_item(self):
+        items = self.add_items([0, 1])
+        response = self.client.post(reverse('update_item_order'), {'item_order[]': [items[1].id, 9999]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.ordered_ids(), [items[0].id, items[1].id])
+
+    def test_move_into_gap_writes_one_row(self):
+        first, second, third = self.add_items([1024, 2048, 3072])
+
+        response = self.client.post(reverse('move_item', args=[third.id]), {'after': first.id})
+
+        self.assertEqual(response.json()['order'], 1536)
+        self.assertEqual(self.ordered_ids(), [first.id, third.id, second.id])
+        # Nobody else moved
+        self.assertEqual(MediaItem.objects.get(id=second.id).order, 2048)
+
+        self.client.post(reverse('move_item', args=[second.id]), {'after': ''})
+        self.assertEqual(self.ordered_ids(), [second.id, first.id, third.id])
+        self.assertEqual(MediaItem.objects.get(id=second.id).order, 511)
+
+    def test_move_renumbers_when_out_of_room(self):
+        first, second, third = self.add_items([0, 1, 2])
+
+        response = self.client.post(reverse('move_item', args=[third.id]), {'after': first.id})
+
+        self.assertEqual(response.json()['order'], 2048)
+        self.assertEqual(self.ordered_ids(), [first.id, third.id, second.id])
+        self.assertEqual(list(self.project.media_items.order_by('order').values_list('order', flat=True)),
+                         [1024, 2048, 3072])
+
+    def test_appended_items_keep_the_gap(self):
+        first, second = self.add_items([1024, 2048])
+        appended, = self.add_items([self.project.next_item_order()])
+        self.assertEqual(appended.order, 3072)
+
+        # Moving between appended items lands in the gap, nothing is renumbered
+        response = self.client.post(reverse('move_item', args=[first.id]), {'after': second.id})
+        self.assertEqual(response.json()['order'], 2560)
+        self.assertEqual(MediaItem.objects.get(id=appended.id).order, 3072)
+
+    def test_move_after_item_of_other_project(self):
+        other_user = User.objects.create_user(username='otheruser', password='otherpassword123')
+        other_project = MediaProject.objects.create(user=other_user, title='Other Project')
+        other_item = MediaItem.objects.create(project=other_project, file='uploads/other.jpg', media_type='image')
+        item, = self.add_items([0])
+
+        response = self.client.post(reverse('move_item', args=[item.id]), {'after': other_item.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(reverse('move_item', args=[other_item.id])).status_code, 404)
+
+
+class FakeDriveServer:
+    """Minimal local stand-in for the Drive API, speaking the resumable upload protocol"""
+
+    def __init__(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import threading
+
+        self.received = bytearray()
+        self.bytes_sent = 0
+        # Statuses to answer the next chunk uploads with instead of storing them
+        self.failures = []
+        # Number of permission grants in each batch request received
+        self.batch_requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def read_body(self):
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def do_POST(self):
+                body = self.read_body()
+                if self.path.startswith('/upload/'):
+                    fake.received = bytearray()
+                    self.reply(200, headers={'Location': f'http://127.0.0.1:{fake.port}/session/1'})
+                elif self.path.startswith('/batch/'):
+                    # Answer every request of the batch with an empty permission
+                    content_ids = re.findall(rb'Content-ID: <(.+?)>', body)
+                    fake.batch_requests.append(body.count(b'/files/fake-id/permissions'))
+                    parts = b''.join(
+                        b'--reply\r\nContent-Type: application/http\r\nContent-ID: <response-' + content_id
+                        + b'>\r\n\r\nHTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{}\r\n'
+                        for content_id in content_ids
+                    )
+                    self.reply(200, parts + b'--reply--', {'Content-Type': 'multipart/mixed; boundary=reply'})
+                else:
+                    self.reply(404)
+
+            def do_PUT(self):
+                body = self.read_body()
+                content_range = self.headers['Content-Range']
+                if content_range.startswith('bytes */'):
+                    # Status query of an interrupted upload
+                    headers = {'Range': f'bytes=0-{len(fake.received) - 1}'} if fake.received else {}
+                    return self.reply(308, headers=headers)
+                if fake.failures:
+                    return self.reply(fake.failures.pop(0))
+
+                start, rest = content_range[len('bytes '):].split('-')
+                total = int(rest.split('/')[1])
+                del fake.received[int(start):]
+                fake.received.extend(body)
+                fake.bytes_sent += len(body)
+                if len(fake.received) < total:
+                    return self.reply(308, headers={'Range': f'bytes=0-{len(fake.received) - 1}'})
+                body = json.dumps({'id': 'fake-id', 'webViewLink': 'https://drive.example/fake'}).encode()
+                self.reply(200, body, {'Content-Type': 'application/json'})
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def build_service(self):
+        from googleapiclient.discovery import build
+        import httplib2
+
+        port = self.port
+
+        class LocalHttp(httplib2.Http):
+            def __init__(self):
+                super().__init__()
+                # 308 means "resume incomplete" to Drive, like googleapiclient's build_http
+                self.redirect_codes = self.redirect_codes - {308}
+
+            # The client keeps https for the media endpoint and the batch endpoint always points to
+            # googleapis.com, the fake server is plain http
+            def request(self, uri, *args, **kwargs):
+                uri = uri.replace('https://www.googleapis.com/', f'http://127.0.0.1:{port}/', 1)
+                return super().request(uri.replace('https://', 'http://', 1), *args, **kwargs)
+
+        return build('drive', 'v3', http=LocalHttp(), static_discovery=True,
+                     client_options={'api_endpoint': f'http://127.0.0.1:{self.port}/'})
+
+
+@override_settings(GOOGLE_DRIVE_CHUNK_SIZE=256 * 1024, GOOGLE_DRIVE_RETRY_BACKOFF_SECONDS=0)
+class DriveResumableUploadTestCase(TestCase):
+    """Tests for chunked Drive uploads against a local fake Drive server"""
+
+    def setUp(self):
+        self.drive = FakeDriveServer()
+        self.addCleanup(self.drive.stop)
+        user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=user, title='Drive Project', status='processing')
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.file_path = os.path.join(temp_dir, 'project.mp4')
+        self.content = os.urandom(600 * 1024)
+        with open(self.file_path, 'wb') as output:
+            output.write(self.content)
+
+    def upload(self):
+        from media_app.google_drive_utils import upload_file_to_drive
+
+        with patch('media_app.google_drive_utils.get_drive_service', return_value=self.drive.build_service()):
+            return upload_file_to_drive(self.file_path, 'project.mp4', self.project)
+
+    def test_chunked_upload_retries_transient_errors(self):
+        self.drive.failures = [503]
+
+        result = self.upload()
+
+        self.assertEqual(result, ('fake-id', 'https://drive.example/fake'))
+        self.assertEqual(bytes(self.drive.received), self.content)
+        # The link came with the upload, the only other call is the batched permission grant
+        self.assertEqual(self.drive.batch_requests, [1])
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.upload_progress, 100)
+        self.assertEqual(self.project.drive_upload_uri, '')
+
+    def test_upload_resumes_saved_session(self):
+        # A previous attempt got the first chunk through before dying
+        self.drive.received = bytearray(self.content[:256 * 1024])
+        self.project.drive_upload_uri = f'http://127.0.0.1:{self.drive.port}/session/1'
+        self.project.drive_upload_file = f'{self.file_path}:{len(self.content)}'
+        self.project.save()
+
+        self.upload()
+
+        self.assertEqual(bytes(self.drive.received), self.content)
+        # Only what Drive didn't have yet was sent
+        self.assertEqual(self.drive.bytes_sent, len(self.content) - 256 * 1024)
+
+    @override_settings(GOOGLE_DRIVE_UPLOAD_RETRIES=1)
+    def test_upload_gives_up_after_retries(self):
+        self.drive.failures = [503, 503]
+
+        self.assertEqual(self.upload(), (None, None))
+        # The session is kept for the next attempt
+        self.project.refresh_from_db()
+        self.assertTrue(self.project.drive_upload_uri)
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'progress': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'progress-tests'},
+    },
+    MEDIA_PROGRESS_POLL_SECONDS=0.01,
+)
+class ProgressStreamTestCase(TestCase):
+    """Tests for publishing render progress and streaming it to the project page"""
+
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches['progress'].clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.login(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Streamed Project', status='processing')
+        self.async_client.force_login(self.user)
+
+    async def read_events(self, name='progress'):
+        response = await self.async_client.get(reverse('project_progress', args=[self.project.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        async for chunk in response.streaming_content:
+            for event in chunk.decode().split('\n\n'):
+                if event.startswith(f'event: {name}\n'):
+                    events.append(json.loads(event.split('data: ', 1)[1]))
+        return events
+
+    def test_status_changes_are_published(self):
+        from media_app.progress import get_progress, ProgressReporter
+
+        self.assertEqual(get_progress(self.project.id), {'status': 'processing', 'stage': None, 'percent': None})
+
+        reporter = ProgressReporter(self.project.id, 'processing', 'rendering')
+        reporter(120, 480)
+        self.assertEqual(get_progress(self.project.id), {'status': 'processing', 'stage': 'rendering', 'percent': 25})
+
+        # Saving without a status change keeps the stage
+        self.project.title = 'Renamed'
+        self.project.save()
+        self.assertEqual(get_progress(self.project.id)['percent'], 25)
+
+        self.project.status = 'publishing'
+        self.project.save()
+        self.assertEqual(get_progress(self.project.id), {'status': 'publishing', 'stage': None, 'percent': None})
+
+    def test_saves_without_status_publish_nothing(self):
+        from media_app.progress import get_progress, publish_progress
+
+        # Another job already moved the project on, this instance is outdated
+        publish_progress(self.project.id, 'completed')
+        self.project.preview_status = 'completed'
+        self.project.save(update_fields=['preview_status'])
+        self.assertEqual(get_progress(self.project.id)['status'], 'completed')
+
+        self.project.save(update_fields=['status'])
+        self.assertEqual(get_progress(self.project.id)['status'], 'processing')
+
+    @override_settings(MEDIA_PROGRESS_STREAM_SECONDS=0.2)
+    async def test_stream_sends_changes_until_timeout(self):
+        from media_app.progress import ProgressReporter
+
+        ProgressReporter(self.project.id, 'processing', 'rendering')(48, 96)
+
+        events = await self.read_events()
+        # Sent once, not repeated while nothing changes
+        self.assertEqual(events, [{'status': 'processing', 'stage': 'rendering', 'percent': 50}])
+
+    def test_stream_ends_when_project_is_done(self):
+        from asgiref.sync import async_to_sync
+
+        self.project.status = 'completed'
+        self.project.save()
+
+        with self.assertNumQueries(3):  # Session, user and project, nothing while streaming
+            events = async_to_sync(self.read_events)()
+        self.assertEqual(events, [{'status': 'completed', 'stage': None, 'percent': None}])
+
+    def test_stream_sends_preview_status(self):
+        from media_app.progress import ProgressStream
+
+        self.project.status = 'completed'
+        self.project.preview_status = 'processing'
+        self.project.save()
+
+        stream = ProgressStream(self.project.id, {'status': 'completed', 'stage': None, 'percent': None})
+        self.assertIn('event: preview\ndata: {"preview_status": "processing"}\n\n', stream.poll())
+        # The project is done, the stream stays open for the preview
+        self.assertFalse(stream.finished)
+        self.assertIsNone(stream.poll())
+
+        self.project.preview_status = 'completed'
+        self.project.save(update_fields=['preview_status'])
+        self.assertEqual(stream.poll(), 'event: preview\ndata: {"preview_status": "completed"}\n\n')
+        self.assertTrue(stream.finished)
+
+    def test_wsgi_falls_back_to_polling(self):
+        # No stream holding a worker thread, the page polls check_project_status instead
+        response = self.client.get(reverse('project_progress', args=[self.project.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    def test_async_stream(self):
+        import asyncio
+        from media_app.progress import ProgressStream, publish_progress
+
+        publish_progress(self.project.id, 'failed')
+        stream = ProgressStream(self.project.id, {'status': 'processing', 'stage': None, 'percent': None})
+
+        async def collect():
+            return [chunk async for chunk in stream.events()]
+
+        chunks = asyncio.run(collect())
+        self.assertTrue(chunks[-1].startswith(
+            'event: progress\ndata: {"status": "failed", "stage": null, "percent": null}\n\n'))
+
+    def test_ffmpeg_render_reports_progress(self):
+        from media_app.ffmpeg_renderer import render_timeline
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        image_path = os.path.join(temp_dir, 'photo.jpg')
+        Image.new('RGB', (100, 100), color='blue').save(image_path)
+
+        reports = []
+        render_timeline([{'path': image_path, 'media_type': 'image'}], os.path.join(temp_dir, 'out.mp4'), (64, 36),
+                        progress=lambda done, total: reports.append((done, total)))
+
+        self.assertTrue(reports)
+        done, total = reports[-1]
+        self.assertEqual(total, 2)
+        self.assertAlmostEqual(done, 2, delta=0.2)
+
+
+class PreviewRenderTestCase(TestCase):
+    """Tests for the low-resolution preview render profile"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.project = MediaProject.objects.create(user=self.user, title='Previewed Project', status='completed',
+                                                   output_file='outputs/final.mp4')
+        temp_media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_media_dir, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=temp_media_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def add_image(self):
+        image_io = io.BytesIO()
+        Image.new('RGB', (100, 100), color='red').save(image_io, format='JPEG')
+        return MediaItem.objects.create(
+            project=self.project,
+            file=SimpleUploadedFile('photo.jpg', image_io.getvalue(), content_type='image/jpeg'),
+            media_type='image',
+        )
+
+    def test_get_preview_size(self):
+        from media_app.media_processor import get_preview_size
+
+        self.assertEqual(get_preview_size((1920, 1080)), (640, 360))
+        self.assertEqual(get_preview_size((1080, 1920)), (202, 360))
+        # Smaller sources aren't scaled up
+        self.assertEqual(get_preview_size((320, 240)), (320, 240))
+
+    @override_settings(MEDIA_RENDER_BACKEND='moviepy')
+    def test_render_preview(self):
+        from media_app.media_processor import process_media_project
+        from media_app.mp4_header import read_mp4_info
+
+        self.add_image()
+
+        with patch('media_app.media_processor.render_with_moviepy') as mock_moviepy:
+            self.assertTrue(process_media_project(self.project, threads=1, profile='preview'))
+        mock_moviepy.assert_not_called()
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.preview_status, 'completed')
+        self.assertTrue(self.project.preview_file.name.startswith('previews/'))
+        # The final output is left alone
+        self.assertEqual(self.project.status, 'completed')
+        self.assertEqual(self.project.output_file.name, 'outputs/final.mp4')
+
+        with open(self.project.preview_file.path, 'rb') as preview:
+            info = read_mp4_info(preview)
+        self.assertEqual((info['width'], info['height']), (640, 360))
+
+    @override_settings(MEDIA_RENDER_BACKEND='ffmpeg', OUTPUT_STORAGE_BACKEND='local')
+    def test_final_render_keeps_preview_finished_meanwhile(self):
+        from media_app.media_processor import process_media_project, publish_project
+
+        self.add_image()
+        self.project.preview_status = 'processing'
+        self.project.save()
+
+        def finish_preview(*args, **kwargs):
+            # The preview job completes while the final render is encoding
+            MediaProject.objects.filter(pk=self.project.pk).update(
+                preview_status='completed', preview_file='previews/preview.mp4')
+            return True
+
+        with patch('media_app.media_processor.render_with_ffmpeg', side_effect=finish_preview):
+            self.assertTrue(process_media_project(self.project, threads=1))
+        self.assertTrue(publish_project(self.project))
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'completed')
+        self.assertEqual(self.project.preview_status, 'completed')
+        self.assertEqual(self.project.preview_file.name, 'previews/preview.mp4')
+
+    @override_settings(RENDER_JOB_MAX_ATTEMPTS=1)
+    @patch('media_app.job_queue.render_project', return_value=False)
+    def test_preview_job_failure_leaves_project_status(self, mock_render):
+        from media_app.job_queue import enqueue_render_job, claim_next_job, run_job
+
+        final_job = enqueue_render_job(self.project)
+        job = enqueue_render_job(self.project, profile='preview')
+        self.assertNotEqual(job.pk, final_job.pk)
+        final_job.delete()
+
+        run_job(claim_next_job('worker-1'), 'worker-1')
+
+        mock_render.assert_called_once_with(self.project, 'preview')
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.preview_status, 'failed')
+        self.assertEqual(self.project.status, 'completed')
+
+    @patch('media_app.job_queue.render_project', return_value=True)
+    def test_preview_job_is_not_published(self, mock_render):
+        from media_app.job_queue import enqueue_render_job, claim_next_job, run_job
+
+        self.project.status = 'publishing'
+        self.project.save()
+        enqueue_render_job(self.project, profile='preview')
+
+        run_job(claim_next_job('worker-1'), 'worker-1')
+
+        self.assertFalse(self.project.render_jobs.filter(kind='publish').exists())
+
+    def test_preview_view_queues_preview_job(self):
+        self.add_image()
+        client = Client()
+        client.login(username='testuser', password='testpassword123')
+
+        response = client.post(reverse('preview_project', args=[self.project.id]))
+
+        self.assertRedirects(response, reverse('project_detail', args=[self.project.id]))
+        self.assertEqual(self.project.render_jobs.get().profile, 'preview')
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.preview_status, 'processing')
+        self.assertEqual(self.project.status, 'completed')